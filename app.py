@@ -1,15 +1,28 @@
 import os
-import sqlite3
+import asyncio
+import shutil
 import subprocess
 import threading
 import time
 import signal
 from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from flask_security import login_required, current_user
-from datetime import datetime, timedelta
 from models import db, Channel, Role, User
 from auth import init_security, user_datastore
+from channel_catalog import ChannelCatalog, etag_matches, cache_headers
+import channel_db
+from channel_repo import ChannelRepository
+import m3u_import
+from channel_prober import ChannelProber
+import ffmpeg_tools
+import hls_pipeline
+from stream_manager import Launch, StreamLimitError, StreamManager
+from segment_store import SegmentStore
+import ll_hls
+from stream_commands import CommandQueue
+from warm_pool import WarmPool
+from presence import Presence
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Flask Setup + Config
@@ -17,9 +30,8 @@ from auth import init_security, user_datastore
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
-online_users = {}
-ONLINE_TIMEOUT = timedelta(minutes=1)
-online_users_lock = threading.Lock()
+ONLINE_TIMEOUT = 60        # seconds of request inactivity before a socketless user drops off
+presence = Presence(ONLINE_TIMEOUT)
 
 app.config['SECRET_KEY'] = 'super-secret-key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///C:/Users/samer/PycharmProjects/vlc website/channels.db'
@@ -41,126 +53,305 @@ init_security(app)
 # IPTV STREAMING CLASS
 # ─────────────────────────────────────────────────────────────────────────────
 
+# Longest start_stream waits for ffmpeg's first HLS segment
+STREAM_READY_TIMEOUT = 15
+
+# Opt-in adaptive bitrate: HLS_ABR=1 encodes the HLS_ABR_LADDER renditions
+# (height:video_kbps[:audio_kbps], plus audio:<kbps>) behind a master playlist
+HLS_ABR = os.environ.get('HLS_ABR', '0').lower() in ('1', 'true', 'yes')
+HLS_ABR_LADDER = os.environ.get('HLS_ABR_LADDER')
+
+# Opt-in Low-Latency HLS: HLS_LOW_LATENCY=1 cuts LL_PART_DURATION-second parts,
+# LL_PARTS_PER_SEGMENT to a segment, and serves blocking playlist reloads
+HLS_LOW_LATENCY = os.environ.get('HLS_LOW_LATENCY', '0').lower() in ('1', 'true', 'yes')
+LL_PART_DURATION = float(os.environ.get('LL_PART_DURATION', '0.5'))
+LL_PARTS_PER_SEGMENT = int(os.environ.get('LL_PARTS_PER_SEGMENT', '4'))
+# the spec gives a blocked reload three target durations to complete
+LL_BLOCK_TIMEOUT = 3 * LL_PART_DURATION * LL_PARTS_PER_SEGMENT
+
+# Source codecs decide copy vs transcode; probes are cached per URL
+SOURCE_PROBE_TIMEOUT = 5
+SOURCE_PROBE_TTL = 600
+
+# Channels that may run at once, and seconds without a playlist/segment fetch
+# before a channel's ffmpeg is stopped
+MAX_STREAMS = int(os.environ.get('MAX_STREAMS', '4'))
+STREAM_IDLE_TIMEOUT = float(os.environ.get('STREAM_IDLE_TIMEOUT', '60'))
+
+# Restarts (1 s, 2 s, 4 s ... up to 30 s apart) before a failing channel is
+# given up on, and the minimum gap between stream_health events per channel
+STREAM_MAX_RESTARTS = int(os.environ.get('STREAM_MAX_RESTARTS', '6'))
+STREAM_HEALTH_INTERVAL = 2.0
+
+# Where ffmpeg writes HLS output; point it at a tmpfs (e.g. /dev/shm/iptv) to
+# keep segment writes off disk. Viewers are served from the in-memory store.
+STREAM_DIR = os.environ.get('STREAM_DIR', 'stream')
+
 class IPTVStreamer:
-    def __init__(self, db_path="channels.db"):
+    def __init__(self, db_path="channels.db", abr=False, ladder=hls_pipeline.DEFAULT_LADDER,
+                 max_streams=4, idle_timeout=60, stream_dir="stream", low_latency=False):
         self.db_path = db_path
-        self.current_process = None
-        self.current_channel_id = None
-        self.stream_dir = "stream"
+        self.channels = ChannelRepository(db_path)
+        self._sources = {}
+        self.abr = abr
+        self.ladder = ladder
+        self.low_latency = low_latency
+        self.stream_dir = stream_dir
         self.ensure_stream_directory()
+        self.cleanup_old_files()
+        self.streams = StreamManager(
+            self.stream_dir, max_streams=max_streams, idle_timeout=idle_timeout,
+            on_change=self._streams_changed, on_exit=self._stream_exited,
+            on_health=self._stream_health, store_factory=self._make_store,
+            max_restarts=STREAM_MAX_RESTARTS,
+        )
+        self._health_sent = {}
 
     def ensure_stream_directory(self):
         if not os.path.exists(self.stream_dir):
             os.makedirs(self.stream_dir)
 
     def cleanup_old_files(self):
+        # leftovers from a previous run: per-channel dirs and the old flat layout
         try:
-            for file in os.listdir(self.stream_dir):
-                if file.endswith(('.m3u8', '.ts')):
-                    os.remove(os.path.join(self.stream_dir, file))
+            for entry in os.scandir(self.stream_dir):
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                elif entry.name.endswith(('.m3u8', '.ts')):
+                    os.remove(entry.path)
         except:
             pass
 
     def get_channels(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM channels ORDER BY name")
-        channels = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return channels
+        return self.channels.list_channels()
+
+    def page_channels(self, **filters):
+        return self.channels.page_channels(**filters)
+
+    def search_channels(self, **args):
+        return self.channels.search_channels(**args)
+
+    def list_categories(self):
+        return self.channels.list_categories()
 
     def get_channel_by_id(self, channel_id):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM channels WHERE id = ?", (channel_id,))
-        channel = cursor.fetchone()
-        conn.close()
-        return dict(channel) if channel else None
+        return self.channels.get_channel_by_id(channel_id)
 
     def update_playing_status(self, channel_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE channels SET is_playing = 0")
-        if channel_id:
-            cursor.execute("UPDATE channels SET is_playing = 1 WHERE id = ?", (channel_id,))
-        conn.commit()
-        conn.close()
-
-    def stop_current_stream(self):
-        if self.current_process:
-            try:
-                self.current_process.terminate()
-                self.current_process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                self.current_process.kill()
-                self.current_process.wait()
-            except:
-                pass
-            finally:
-                self.current_process = None
-        self.cleanup_old_files()
+        self.channels.set_playing(channel_id or None)
 
-    def start_stream(self, channel_id):
-        self.stop_current_stream()
+    def start_stream(self, channel_id, viewer=None, abr=None, low_latency=None):
+        """
+        Put ``viewer`` on ``channel_id``, starting its ffmpeg unless it's already
+        running; ``abr``/``low_latency`` pick the output for a new stream.
+        """
         channel = self.get_channel_by_id(channel_id)
         if not channel:
             return False, "Channel not found"
 
-        self.update_playing_status(channel_id)
-        self.current_channel_id = channel_id
-        self.cleanup_old_files()
-
-        stream_path = os.path.join(self.stream_dir, "stream.m3u8")
-
-        ffmpeg_paths = [
-            'ffmpeg', r'C:\ffmpeg\bin\ffmpeg.exe',
-            r'C:\Program Files\ffmpeg\bin\ffmpeg.exe', 'ffmpeg.exe'
-        ]
-        ffmpeg_exe = None
-        for path in ffmpeg_paths:
-            try:
-                subprocess.run([path, '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                ffmpeg_exe = path
-                break
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                continue
-
-        if not ffmpeg_exe:
+        ffmpeg = ffmpeg_tools.ffmpeg_info()
+        if not ffmpeg:
             return False, "FFmpeg not found. Please install FFmpeg and add it to PATH."
 
-        ffmpeg_cmd = [
-            ffmpeg_exe, '-i', channel['url'],
-            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
-            '-profile:v', 'baseline', '-level', '3.0', '-pix_fmt', 'yuv420p',
-            '-r', '25', '-g', '50', '-sc_threshold', '0',
-            '-c:a', 'aac', '-b:a', '128k', '-ar', '44100',
-            '-f', 'hls', '-hls_time', '1', '-hls_list_size', '5',
-            '-hls_flags', 'delete_segments+independent_segments',
-            '-hls_segment_type', 'mpegts', '-hls_start_number_source', 'epoch',
-            '-force_key_frames', 'expr:gte(t,n_forced*1)', '-y', stream_path
-        ]
-
+        abr = self.abr if abr is None else abr
+        low_latency = self.low_latency if low_latency is None else low_latency
         try:
-            self.current_process = subprocess.Popen(
-                ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE
+            stream = self.streams.join(
+                channel_id, viewer,
+                lambda out_dir: self._launch_channel(ffmpeg.path, channel, out_dir, abr, low_latency),
+            )
+        except StreamLimitError as e:
+            return False, str(e)
+        if stream.process is None:
+            return False, stream.error or "Stream failed to start"
+        return True, f"Streaming: {channel['name']} ({stream.mode})"
+
+    def warm_channel(self, channel_id):
+        """Start ``channel_id`` with the default output and no viewers, if a slot is free."""
+        channel = self.get_channel_by_id(channel_id)
+        ffmpeg = ffmpeg_tools.ffmpeg_info()
+        if not channel or not ffmpeg:
+            return None
+        return self.streams.warm(
+            channel_id,
+            lambda out_dir: self._launch_channel(ffmpeg.path, channel, out_dir, self.abr, self.low_latency),
+        )
+
+    def stop_stream(self, viewer=None):
+        """Take ``viewer`` off its channel; the channel stops once it goes idle."""
+        return self.streams.leave(viewer)
+
+    def playlist_url(self, channel_id):
+        stream = self.streams.get(channel_id)
+        return stream.as_dict()['playlist'] if stream else None
+
+    def probe_source(self, url):
+        """ffprobe a channel URL, remembering the answer for SOURCE_PROBE_TTL seconds."""
+        cached = self._sources.get(url)
+        if cached and time.monotonic() - cached[0] < SOURCE_PROBE_TTL:
+            return cached[1]
+        info = ffmpeg_tools.probe_source(url, timeout=SOURCE_PROBE_TIMEOUT)
+        self._sources[url] = (time.monotonic(), info)
+        return info
+
+    def _launch_channel(self, ffmpeg_path, channel, out_dir, abr, low_latency):
+        override = channel.get('stream_mode')
+        if abr:
+            mode = 'abr'
+            source = self.probe_source(channel['url'])
+            plan = hls_pipeline.abr_plan(
+                ffmpeg_path, channel['url'], out_dir, self.ladder, source.height if source else None
+            )
+        elif low_latency:
+            mode = 'll'
+            plan = hls_pipeline.ll_hls_plan(
+                ffmpeg_path, channel['url'], out_dir, LL_PART_DURATION, LL_PARTS_PER_SEGMENT
             )
-            threading.Thread(target=self._monitor_stream, daemon=True).start()
-            time.sleep(2)
-            return True, f"Started streaming: {channel['name']}"
+        else:
+            source = self.probe_source(channel['url']) if override != 'transcode' else None
+            mode = hls_pipeline.choose_mode(override, source)
+            plan = self._plan(mode, ffmpeg_path, channel['url'], out_dir, source)
+
+        process, ready = self._launch(plan)
+        if process is None and mode == 'copy' and override != 'copy':
+            # the remux died before its first segment; re-encode instead
+            print(f"Remux failed for {channel['name']}, falling back to transcode")
+            mode = 'transcode'
+            plan = hls_pipeline.transcode_plan(ffmpeg_path, channel['url'], out_dir)
+            process, ready = self._launch(plan)
+        return Launch(process, plan.playlist, mode, ready)
+
+    def _plan(self, mode, ffmpeg_path, url, out_dir, source):
+        if mode == 'copy':
+            copy_audio = source is None or source.audio_codec in (None, *hls_pipeline.COPY_AUDIO_CODECS)
+            return hls_pipeline.remux_plan(ffmpeg_path, url, out_dir, copy_audio=copy_audio)
+        return hls_pipeline.transcode_plan(ffmpeg_path, url, out_dir)
+
+    def _make_store(self, stream):
+        if stream.mode != 'll':
+            return SegmentStore(stream.directory).start()
+        # parts arrive every LL_PART_DURATION; poll well inside that
+        store = SegmentStore(stream.directory, keep=LL_PARTS_PER_SEGMENT * 2, poll_interval=0.02)
+        stream.low_latency = ll_hls.LowLatencyPackager(store, LL_PART_DURATION, LL_PARTS_PER_SEGMENT)
+        return store.start()
+
+    def _launch(self, plan):
+        """Start ffmpeg for ``plan``; (process, ready), or (None, False) if it died on start-up."""
+        process = subprocess.Popen(
+            plan.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL
+        )
+        # return as soon as the first segment is listed, not after a fixed delay
+        if ffmpeg_tools.wait_for_playlist(plan.ready_path, process, timeout=STREAM_READY_TIMEOUT):
+            return process, True
+        if process.poll() is not None:
+            _, stderr = process.communicate()
+            print(f"Stream error: {stderr.decode(errors='replace')[-2000:]}")
+            return None, False
+        return process, False
+
+    def _stream_exited(self, stream, returncode, viewers):
+        health = stream.health.as_dict()
+        print(f"Stream on channel {stream.channel_id} gave up after {health['restarts']} restarts: "
+              f"{health['last_error']}")
+        self._health_sent.pop(stream.channel_id, None)
+        for viewer in sorted(viewers):
+            socketio.emit('stream_error', {
+                'channel_id': stream.channel_id, 'message': 'Stream ended unexpectedly',
+                'error': health['last_error'],
+            }, to=viewer)
+
+    def _stream_health(self, stream):
+        # progress arrives twice a second; state changes go out at once, the rest is throttled
+        health = stream.health.as_dict()
+        now = time.monotonic()
+        last_state, last_sent = self._health_sent.get(stream.channel_id, (None, 0.0))
+        if health['state'] == last_state and now - last_sent < STREAM_HEALTH_INTERVAL:
+            return
+        self._health_sent[stream.channel_id] = (health['state'], now)
+        socketio.emit('stream_health', {'channel_id': stream.channel_id, **health})
+
+    def _streams_changed(self):
+        # now_playing follows the most recently started channel that is still running
+        running = [s for s in self.streams.status() if s['alive']]
+        newest = max(running, key=lambda s: s['started_at'])['channel_id'] if running else None
+        if newest != self.channels.now_playing_id():
+            self.update_playing_status(newest)
+
+streamer = IPTVStreamer(
+    abr=HLS_ABR, low_latency=HLS_LOW_LATENCY,
+    max_streams=MAX_STREAMS, idle_timeout=STREAM_IDLE_TIMEOUT, stream_dir=STREAM_DIR,
+    ladder=hls_pipeline.parse_ladder(HLS_ABR_LADDER) if HLS_ABR_LADDER else hls_pipeline.DEFAULT_LADDER,
+)
+channel_catalog = ChannelCatalog(lambda: channel_db.public_channels(streamer.get_channels()))
+streamer.channels.on_write(channel_catalog.invalidate)
+
+# Seconds between full health sweeps of every channel URL; 0 disables the loop
+CHANNEL_PROBE_INTERVAL = float(os.environ.get('CHANNEL_PROBE_INTERVAL', '0'))
+# Also record codec and resolution of live channels, if ffprobe can be found
+CHANNEL_PROBE_FFPROBE = os.environ.get('CHANNEL_PROBE_FFPROBE', '1').lower() in ('1', 'true', 'yes')
+prober = ChannelProber(streamer.channels, use_ffprobe=CHANNEL_PROBE_FFPROBE)
+
+
+def _probe_loop():
+    asyncio.run(prober.run_forever(CHANNEL_PROBE_INTERVAL))
+
+
+def _play_command(job):
+    params = job.params
+    warm_pool.note_played(params['channel_id'])
+    success, message = streamer.start_stream(
+        params['channel_id'], viewer=job.viewer, abr=params['abr'], low_latency=params['low_latency']
+    )
+    playlist = streamer.playlist_url(params['channel_id']) if success else None
+    if success:
+        socketio.emit('channel_changed', {'channel_id': params['channel_id'], 'message': message, 'playlist': playlist},
+                      to=job.viewer)
+    return success, message, {'playlist': playlist}
+
+
+def _stop_command(job):
+    channel_id = streamer.stop_stream(job.viewer)
+    socketio.emit('stream_stopped', {'channel_id': channel_id}, to=job.viewer)
+    return True, 'Stream stopped', {'stopped_channel_id': channel_id}
+
+
+# Optional warm pool: keep WARM_POOL_SIZE recently watched / favorite channels
+# running without viewers so /api/play joins a stream that already has segments.
+# Warm streams share MAX_STREAMS and give up their slot to real viewers first.
+WARM_POOL_SIZE = int(os.environ.get('WARM_POOL_SIZE', '0'))
+WARM_POOL_INTERVAL = 30
+WARM_POOL_MAX_LOAD = float(os.environ.get('WARM_POOL_MAX_LOAD', '0.8'))
+warm_pool = WarmPool(
+    WARM_POOL_SIZE,
+    open_source=streamer.warm_channel,
+    close_source=lambda channel_id, stream: streamer.streams.unpin(channel_id),
+    is_alive=lambda stream: streamer.streams.get(stream.channel_id) is stream,
+    max_load=WARM_POOL_MAX_LOAD,
+)
+
+
+def _warm_loop():
+    while True:
+        try:
+            warm_pool.refresh(streamer.channels.favorite_ids(WARM_POOL_SIZE))
         except Exception as e:
-            return False, f"Failed to start stream: {str(e)}"
+            print(f"Warm pool refresh failed: {e}")
+        time.sleep(WARM_POOL_INTERVAL)
+
+
+# Play/stop requests return a job id at once; one worker runs them in order
+# and pushes each state change as a 'job_update' event to the viewer who asked
+commands = CommandQueue(
+    {'play': _play_command, 'stop': _stop_command},
+    on_update=lambda job: socketio.emit('job_update', job.as_dict(), to=job.viewer) if job.viewer else None,
+)
 
-    def _monitor_stream(self):
-        if self.current_process:
-            _, stderr = self.current_process.communicate()
-            if self.current_process.returncode != 0:
-                print(f"Stream error: {stderr.decode()}")
-                socketio.emit('stream_error', {'message': 'Stream ended unexpectedly'})
-            self.current_process = None
 
-streamer = IPTVStreamer()
+def catalog_response(snap):
+    headers = cache_headers(snap.etag)
+    if etag_matches(request.headers.get('If-None-Match'), snap.etag):
+        return app.response_class(status=304, headers=headers)
+    return app.response_class(snap.body, mimetype='application/json', headers=headers)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Routes
@@ -169,46 +360,110 @@ streamer = IPTVStreamer()
 @app.route('/')
 @login_required
 def index():
-    now_playing = Channel.query.filter_by(is_playing=1).first()
+    now_playing = streamer.channels.get_now_playing()
     online = get_online_users()
     return render_template("index.html", now_playing=now_playing, online_users=online)
 
 @app.route('/api/channels')
 @login_required
 def get_channels():
-    return jsonify(streamer.get_channels())
+    if not channel_db.wants_page(request.args):
+        return catalog_response(channel_catalog.snapshot())
+    try:
+        filters = channel_db.parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    key = ('page',) + tuple(sorted(filters.items()))
+    return catalog_response(channel_catalog.snapshot(key, lambda: streamer.page_channels(**filters)))
+
+@app.route('/api/channels/search')
+@login_required
+def search_channels():
+    try:
+        args = channel_db.parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    key = ('search',) + tuple(sorted(args.items()))
+    return catalog_response(channel_catalog.snapshot(key, lambda: streamer.search_channels(**args)))
+
+@app.route('/api/categories')
+@login_required
+def get_categories():
+    return catalog_response(channel_catalog.snapshot('categories', streamer.list_categories))
 
 @app.route('/api/play/<int:channel_id>', methods=['POST'])
 @login_required
 def play_channel(channel_id):
-    success, message = streamer.start_stream(channel_id)
-    if success:
-        socketio.emit('channel_changed', {'channel_id': channel_id, 'message': message})
-    return jsonify({'success': success, 'message': message})
+    abr, ll = request.args.get('abr'), request.args.get('ll')
+    job = commands.submit(
+        'play', viewer=current_user.username, channel_id=channel_id,
+        abr=None if abr is None else abr in ('1', 'true'),
+        low_latency=None if ll is None else ll in ('1', 'true'),
+    )
+    return jsonify({'success': True, 'message': 'Switching channel...', **job.as_dict()}), 202
 
 @app.route('/api/stop', methods=['POST'])
 @login_required
 def stop_stream():
-    streamer.stop_current_stream()
-    streamer.update_playing_status(None)
-    streamer.current_channel_id = None
-    socketio.emit('stream_stopped')
-    return jsonify({'success': True, 'message': 'Stream stopped'})
+    job = commands.submit('stop', viewer=current_user.username)
+    return jsonify({'success': True, 'message': 'Stopping stream...', **job.as_dict()}), 202
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    job = commands.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify(job.as_dict())
 
 @app.route('/api/status')
 @login_required
 def get_status():
+    channel_id = streamer.streams.viewer_channel(current_user.username)
+    stream = streamer.streams.get(channel_id) if channel_id is not None else None
     return jsonify({
-        'is_streaming': streamer.current_process is not None,
-        'current_channel_id': streamer.current_channel_id,
-        'process_alive': streamer.current_process.poll() is None if streamer.current_process else False
+        'is_streaming': stream is not None,
+        'current_channel_id': channel_id,
+        'playlist': streamer.playlist_url(channel_id) if stream else None,
+        'mode': stream.mode if stream else None,
+        'process_alive': stream.alive if stream else False,
+        'streams': streamer.streams.status(),
+        'max_streams': streamer.streams.max_streams,
+        'queued_commands': commands.depth(),
+        'warm_pool': warm_pool.status(),
     })
 
-@app.route('/stream/<path:filename>')
-def serve_stream(filename):
-    file_path = os.path.join(streamer.stream_dir, filename)
-    if not os.path.exists(file_path):
+@app.route('/stream/<int:channel_id>/<path:filename>')
+def serve_stream(channel_id, filename):
+    stream = streamer.streams.get(channel_id)
+    packager = stream.low_latency if stream else None
+    if packager and filename == packager.playlist:
+        # LL-HLS blocking reload: hold the request until the asked-for part exists
+        try:
+            msn, part = ll_hls.parse_blocking_args(request.args)
+            if msn is not None and not packager.wait(msn, part, LL_BLOCK_TIMEOUT):
+                return "Playlist update timed out", 503
+        except ValueError as e:
+            return str(e), 400
+    elif packager:
+        packager.wait_for_part(filename, LL_BLOCK_TIMEOUT)  # preload hint, no-op otherwise
+    entry = stream.store.get(filename) if stream and stream.store else None
+    if entry is not None:
+        stream.touch()
+        headers = {
+            'ETag': entry.etag, 'Cache-Control': entry.cache_control, 'Access-Control-Allow-Origin': '*',
+        }
+        if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+            return app.response_class(status=304, headers=headers)
+        return app.response_class(entry.body, mimetype=entry.content_type, headers=headers)
+
+    # not in the live window yet (or already evicted): fall back to the file ffmpeg wrote.
+    # filename may be nested (ABR variants live in <rendition>/), so keep it inside the channel dir
+    root = os.path.abspath(streamer.streams.directory(channel_id))
+    file_path = os.path.abspath(os.path.join(root, filename))
+    if os.path.commonpath([root, file_path]) != root or not os.path.isfile(file_path):
         return "Stream file not found", 404
+    streamer.streams.touch(channel_id)
 
     mimetype = 'application/vnd.apple.mpegurl' if filename.endswith('.m3u8') else 'video/mp2t'
     response = send_file(file_path, mimetype=mimetype)
@@ -222,12 +477,9 @@ def serve_stream(filename):
 @login_required
 def toggle_favorite():
     data = request.get_json()
-    channel_id = data.get('channel_id')
-    channel = Channel.query.get(channel_id)
-    if channel:
-        channel.favorites = 0 if channel.favorites == 1 else 1
-        db.session.commit()
-        return jsonify({'success': True, 'new_status': channel.favorites})
+    new_status = streamer.channels.toggle_favorite(data.get('channel_id'))
+    if new_status is not None:
+        return jsonify({'success': True, 'new_status': new_status})
     return jsonify({'success': False})
 
 @app.route('/get_favorites')
@@ -236,46 +488,96 @@ def get_favorites():
     favorites = Channel.query.filter_by(favorites=1).all()
     return jsonify([[ch.id, ch.name] for ch in favorites])
 
+@app.route('/api/admin/import', methods=['POST'])
+@login_required
+def import_channels():
+    if not current_user.has_role('admin'):
+        return jsonify({'success': False, 'message': 'Admin only'}), 403
+    data = request.get_json() or {}
+    source = data.get('source')
+    if not source:
+        return jsonify({'success': False, 'message': 'source is required'}), 400
+    try:
+        result = m3u_import.import_playlist(streamer.db_path, source, prune=bool(data.get('prune')))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Import failed: {str(e)}'}), 500
+    streamer.channels.reset_cached_state()
+    return jsonify({'success': True, **result.as_dict()})
+
+@app.route('/api/admin/probe', methods=['POST'])
+@login_required
+def probe_channels():
+    if not current_user.has_role('admin'):
+        return jsonify({'success': False, 'message': 'Admin only'}), 403
+    if not prober.running:
+        threading.Thread(target=lambda: asyncio.run(prober.run_once()), daemon=True).start()
+    return jsonify({'success': True, 'message': 'Probe started', 'last_run': prober.last_run}), 202
+
+@app.route('/api/admin/channels/<int:channel_id>/stream_mode', methods=['POST'])
+@login_required
+def set_stream_mode(channel_id):
+    if not current_user.has_role('admin'):
+        return jsonify({'success': False, 'message': 'Admin only'}), 403
+    mode = (request.get_json() or {}).get('mode')
+    if mode not in hls_pipeline.STREAM_MODES:
+        return jsonify({'success': False, 'message': f"mode must be one of {', '.join(hls_pipeline.STREAM_MODES)}"}), 400
+    if not streamer.channels.set_stream_mode(channel_id, mode):
+        return jsonify({'success': False, 'message': 'Channel not found'}), 404
+    return jsonify({'success': True, 'channel_id': channel_id, 'mode': mode})
+
 @app.route('/api/online_users')
 @login_required
 def api_online_users():
+    # the page gets this pushed ("presence" / "presence_diff"); kept for other clients
     return jsonify(get_online_users())
 
 @socketio.on('connect')
 def handle_connect():
+    # streams are per viewer: each user's tabs share a room named after them,
+    # which play/stop/job events are sent to
+    if current_user.is_authenticated:
+        join_room(current_user.username)
+    channel_id = streamer.streams.viewer_channel(current_user.username) if current_user.is_authenticated else None
     emit('status', {
-        'is_streaming': streamer.current_process is not None,
-        'current_channel_id': streamer.current_channel_id
+        'is_streaming': channel_id is not None,
+        'current_channel_id': channel_id,
+        'streams': streamer.streams.status(),
     })
+    if current_user.is_authenticated and presence.connect(current_user.username):
+        publish_presence()
+    emit('presence', {'users': list(presence.snapshot())})
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    pass
+    if current_user.is_authenticated and presence.disconnect(current_user.username):
+        publish_presence()
 
 @app.before_request
 def track_user_activity():
-    if current_user.is_authenticated:
-        with online_users_lock:
-            online_users[current_user.username] = datetime.utcnow()
+    if current_user.is_authenticated and presence.touch(current_user.username):
+        publish_presence()
 
-def cleanup_online_users():
-    now = datetime.utcnow()
-    with online_users_lock:
-        stale = [u for u, last in online_users.items() if now - last >= ONLINE_TIMEOUT]
-        for u in stale:
-            del online_users[u]
+
+def publish_presence():
+    """Broadcast who joined and left since the last broadcast; nothing if no one did."""
+    presence.expire()
+    joined, left = presence.drain_changes()
+    if joined or left:
+        socketio.emit('presence_diff', {'joined': joined, 'left': left})
 
 
 def get_online_users():
-    cleanup_online_users()
-    with online_users_lock:
-        return list(online_users.keys())
+    presence.expire()
+    return list(presence.snapshot())
 
 
 def _cleanup_loop():
     while True:
-        cleanup_online_users()
-        time.sleep(30)
+        try:
+            publish_presence()
+        except Exception as e:
+            print(f"Presence update failed: {e}")
+        time.sleep(5)   # expiry only pops due heap entries, so frequent sweeps are cheap
 
 
 threading.Thread(target=_cleanup_loop, daemon=True).start()
@@ -290,6 +592,14 @@ if __name__ == '__main__':
             user_datastore.create_role(name='admin', description='Administrator')
             db.session.commit()
 
+    if CHANNEL_PROBE_INTERVAL > 0:
+        threading.Thread(target=_probe_loop, daemon=True).start()
+    if warm_pool.enabled:
+        threading.Thread(target=_warm_loop, daemon=True).start()
+
+    ffmpeg = ffmpeg_tools.ffmpeg_info()
+    print(f"🎬 FFmpeg: {ffmpeg.version if ffmpeg else 'not found'}")
+
     print("✅ IPTV Streaming Server started on http://localhost:5000")
     print("🔒 Login required to access")
     socketio.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,164 @@
+"""
+Per-viewer video bitrate for the WebRTC broadcaster.
+
+Each peer gets a PeerEstimate fed from its RTCP feedback: the receiver's
+REMB estimate caps it, and reported packet loss moves it the way GCC's
+loss-based controller does (back off above 10 % loss, probe upwards below
+2 %). BandwidthPolicy keeps every estimate between a floor and a ceiling
+and, when a server-wide egress budget is set, shares the budget out
+max-min fairly. It also picks the single target for a shared encoder,
+which serves most viewers without starving the slow ones.
+
+Nothing here touches aiortc; main.py feeds the estimates and applies the
+allocations. Doing so needs two RTCRtpSender internals, the RTCP handler
+and the per-peer encoder, checked against aiortc 1.5-1.9; main.py logs
+once and leaves aiortc's own REMB handling in charge if they are missing.
+"""
+import threading
+from typing import NamedTuple
+
+LOSS_BACKOFF = 0.10   # above this fraction lost, cut the rate
+LOSS_PROBE = 0.02     # below it, probe upwards
+PROBE_GAIN = 1.05
+
+
+class BitrateLimits(NamedTuple):
+    floor_kbps: int
+    start_kbps: int
+    ceiling_kbps: int
+
+
+def sdp_bitrate_hints(sdp: str, limits: BitrateLimits) -> str:
+    """
+    Advertise the limits in an answer's video section: b=AS / b=TIAS at the
+    ceiling, and x-google-{start,min,max}-bitrate on the VP8/VP9/H.264
+    payload types. Unlike pinning all three to one value, this leaves the
+    browser's congestion control room to move.
+    """
+    hints = (f"x-google-start-bitrate={limits.start_kbps};"
+             f"x-google-min-bitrate={limits.floor_kbps};x-google-max-bitrate={limits.ceiling_kbps}")
+    out = []
+    in_video = False
+    video_pts = []
+    for line in sdp.splitlines():
+        if line.startswith("m="):
+            in_video = line.startswith("m=video")
+        elif line.startswith(("b=AS:", "b=TIAS:")) and in_video:
+            continue   # replaced below
+        elif line.startswith("a=rtpmap:") and in_video:
+            pt, _, codec = line[len("a=rtpmap:"):].partition(" ")
+            if codec.split("/")[0].upper() in ("VP8", "VP9", "H264"):
+                video_pts.append(pt)
+        out.append(line)
+        if in_video and line.startswith("c="):
+            out += [f"b=AS:{limits.ceiling_kbps}", f"b=TIAS:{limits.ceiling_kbps * 1000}"]
+
+    for pt in video_pts:
+        for i, line in enumerate(out):
+            if line.startswith(f"a=fmtp:{pt} "):
+                if "x-google-max-bitrate" not in line:
+                    out[i] = f"{line};{hints}"
+                break
+        else:
+            out.append(f"a=fmtp:{pt} {hints}")
+    return "\r\n".join(out) + "\r\n"
+
+
+class PeerEstimate:
+    def __init__(self, limits: BitrateLimits):
+        self.limits = limits
+        self.kbps = float(limits.start_kbps)
+        self.remb_kbps: float | None = None
+        self.loss: float | None = None
+        self.rtt_ms: float | None = None
+
+    def update(self, loss: float | None = None, remb_kbps: float | None = None,
+               rtt_ms: float | None = None) -> int:
+        """Fold in one round of feedback; returns the new estimate."""
+        if remb_kbps:
+            self.remb_kbps = remb_kbps
+        if rtt_ms is not None:
+            self.rtt_ms = rtt_ms
+        if loss is not None:
+            self.loss = loss
+            if loss > LOSS_BACKOFF:
+                self.kbps *= 1 - 0.5 * loss
+            elif loss < LOSS_PROBE:
+                self.kbps *= PROBE_GAIN
+        if self.remb_kbps:
+            self.kbps = min(self.kbps, self.remb_kbps)
+        self.kbps = min(max(self.kbps, self.limits.floor_kbps), self.limits.ceiling_kbps)
+        return int(self.kbps)
+
+    def as_dict(self) -> dict:
+        return {
+            'kbps': int(self.kbps),
+            'remb_kbps': int(self.remb_kbps) if self.remb_kbps else None,
+            'loss': self.loss,
+            'rtt_ms': self.rtt_ms,
+        }
+
+
+class BandwidthPolicy:
+    def __init__(self, limits: BitrateLimits, budget_kbps: int | None = None):
+        self.limits = limits
+        self.budget_kbps = budget_kbps or None
+        self.lock = threading.Lock()
+        self.peers: dict[object, PeerEstimate] = {}
+        self.allocations: dict[object, int] = {}
+
+    def register(self, peer) -> PeerEstimate:
+        with self.lock:
+            if peer not in self.peers:
+                self.peers[peer] = PeerEstimate(self.limits)
+            return self.peers[peer]
+
+    def estimate(self, peer) -> PeerEstimate | None:
+        """The peer's estimate; None once it is forgotten (or was never registered)."""
+        with self.lock:
+            return self.peers.get(peer)
+
+    def forget(self, peer) -> None:
+        with self.lock:
+            self.peers.pop(peer, None)
+            self.allocations.pop(peer, None)
+
+    def allocate(self) -> dict:
+        """
+        kbps per peer: its estimate, scaled into the budget max-min fairly
+        (small consumers keep what they need, the rest split the remainder).
+        Floors are kept even if that overruns the budget; admitting fewer
+        peers is the fix for that.
+        """
+        with self.lock:
+            wants = {peer: int(e.kbps) for peer, e in self.peers.items()}
+            if self.budget_kbps is None or sum(wants.values()) <= self.budget_kbps:
+                self.allocations = wants
+                return dict(wants)
+            remaining = self.budget_kbps
+            allocations = {}
+            pending = sorted(wants.items(), key=lambda item: item[1])
+            while pending:
+                share = remaining / len(pending)
+                peer, want = pending.pop(0)
+                allocations[peer] = int(max(self.limits.floor_kbps, min(want, share)))
+                remaining -= allocations[peer]
+            self.allocations = allocations
+            return dict(allocations)
+
+    def shared_target(self, allocations: dict | None = None, percentile: float = 0.25) -> int:
+        """One rate for an encoder all peers share: a low percentile of their allocations."""
+        rates = sorted((allocations if allocations is not None else self.allocations).values())
+        if not rates:
+            return self.limits.start_kbps
+        return rates[min(len(rates) - 1, int(len(rates) * percentile))]
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                'floor_kbps': self.limits.floor_kbps,
+                'ceiling_kbps': self.limits.ceiling_kbps,
+                'budget_kbps': self.budget_kbps,
+                'allocated_kbps': sum(self.allocations.values()),
+                'peers': len(self.peers),
+            }
@@ -0,0 +1,87 @@
+"""
+Versioned, process-wide cache of serialized channel listings.
+
+Every write to the channels table (favorite toggle, now-playing change,
+playlist import) calls ``invalidate()``, which bumps the version and drops
+the cached bodies. Readers get a pre-serialized JSON body together with a
+strong ETag, so a reload can be answered with ``304 Not Modified``.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, NamedTuple
+
+
+class CatalogSnapshot(NamedTuple):
+    body: bytes
+    etag: str
+    version: int
+
+
+class ChannelCatalog:
+    def __init__(self, loader: Callable[[], Any], max_entries: int = 64):
+        self._loader = loader
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries: "OrderedDict[Any, CatalogSnapshot]" = OrderedDict()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> int:
+        """Bump the catalog version and forget every cached body."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            return self._version
+
+    def peek(self, key: Any = None) -> CatalogSnapshot | None:
+        """The cached body for ``key``, or None on a miss. Never builds."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def snapshot(self, key: Any = None, producer: Callable[[], Any] | None = None) -> CatalogSnapshot:
+        """
+        Return the cached body for ``key`` at the current version, building it
+        with ``producer`` (default: the catalog loader) on a miss.
+        """
+        with self._lock:
+            version = self._version
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+
+        # Build outside the lock so a slow query doesn't stall other readers.
+        data = (producer or self._loader)()
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        snap = CatalogSnapshot(body, '"%s"' % hashlib.sha1(body).hexdigest(), version)
+
+        with self._lock:
+            # A write landed while we were building: serve it, but don't cache it.
+            if self._version == version:
+                self._entries[key] = snap
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return snap
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True if an ``If-None-Match`` header value matches ``etag``."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    # no-cache = "store it, but revalidate with the ETag every time"
+    return {"ETag": etag, "Cache-Control": "no-cache"}
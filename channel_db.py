@@ -0,0 +1,418 @@
+"""
+SQL helpers for the channels table shared by the Flask (app.py) and
+FastAPI (main.py) backends. Everything here takes an open sqlite3
+connection; connection management stays with the caller.
+"""
+import base64
+import json
+import re
+import sqlite3
+from typing import Any, Mapping
+
+# Columns returned when ``fields=`` is not given.
+DEFAULT_FIELDS = ("id", "name", "category", "Favorites", "is_playing")
+# Health columns filled in by channel_prober.
+HEALTH_FIELDS = ("alive", "last_checked", "ttfb_ms", "codec", "resolution")
+# Columns a client may ask for via ``fields=``. ``url`` is deliberately not
+# here: playback URLs stay on the server.
+PUBLIC_FIELDS = DEFAULT_FIELDS + HEALTH_FIELDS
+BOOL_FIELDS = ("Favorites", "is_playing", "alive")
+
+# sort name -> the column the keyset is built on
+SORT_COLUMNS = {"name": "name", "ttfb": "ttfb_ms"}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+PAGE_PARAMS = ("limit", "cursor", "q", "category", "favorites_only", "alive", "sort", "fields")
+
+DEFAULT_SEARCH_LIMIT = 50
+
+
+# SQL twin of derive_category(); used by the triggers and the backfill.
+_CATEGORY_SQL = (
+    "CASE WHEN instr(trim({col}), ' ') > 1 "
+    "THEN substr(trim({col}), 1, instr(trim({col}), ' ') - 1) END"
+)
+
+
+# is_playing is answered from the single-row now_playing table rather than
+# the legacy channels.is_playing column, so a channel switch is one row write.
+NOW_PLAYING_SQL = "(SELECT channel_id FROM now_playing WHERE slot = 0)"
+
+
+# Columns added to the original (id, name, url, Favorites, is_playing) table.
+EXTRA_COLUMNS = {
+    "tvg_id": "TEXT",
+    "alive": "INTEGER",
+    "last_checked": "REAL",
+    "ttfb_ms": "REAL",
+    "codec": "TEXT",
+    "resolution": "TEXT",
+    "stream_mode": "TEXT",
+}
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Idempotently add the columns and indexes the listing queries rely on."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_name_id ON channels(name, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_url ON channels(url)")
+    add_missing_columns(conn, EXTRA_COLUMNS)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_alive ON channels(alive, name, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_ttfb ON channels(ttfb_ms, id)")
+    ensure_category_column(conn)
+    ensure_now_playing_table(conn)
+    ensure_search_index(conn)
+    conn.commit()
+
+
+def ensure_now_playing_table(conn: sqlite3.Connection) -> None:
+    """
+    Create the single-row now_playing table, seeded from whichever channel
+    the old is_playing column marked, and retire that column's flags.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'now_playing'"
+    ).fetchone()
+    if exists:
+        return
+    conn.executescript("""
+        CREATE TABLE now_playing (
+            slot INTEGER PRIMARY KEY CHECK (slot = 0),
+            channel_id INTEGER REFERENCES channels(id) ON DELETE SET NULL,
+            started_at REAL
+        );
+        INSERT INTO now_playing (slot, channel_id)
+            SELECT 0, (SELECT id FROM channels WHERE is_playing = 1 LIMIT 1);
+        UPDATE channels SET is_playing = 0 WHERE is_playing;
+    """)
+
+
+def get_now_playing_id(conn: sqlite3.Connection) -> int | None:
+    row = conn.execute("SELECT channel_id FROM now_playing WHERE slot = 0").fetchone()
+    return row[0] if row else None
+
+
+def set_now_playing(conn: sqlite3.Connection, channel_id: int | None, started_at: float | None = None) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO now_playing (slot, channel_id, started_at) VALUES (0, ?, ?)",
+        (channel_id, started_at),
+    )
+
+
+def _column(field: str, table: str = "") -> str:
+    prefix = f"{table}." if table else ""
+    if field == "is_playing":
+        return f"({prefix}id IS {NOW_PLAYING_SQL}) AS is_playing"
+    return prefix + field
+
+
+def add_missing_columns(conn: sqlite3.Connection, columns: Mapping[str, str]) -> list[str]:
+    """ALTER TABLE channels ADD COLUMN for each missing column; returns the ones added."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(channels)")}
+    added = []
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE channels ADD COLUMN {name} {decl}")
+            added.append(name)
+    return added
+
+
+def derive_category(name: str) -> str | None:
+    """First word of a multi-word channel name ("Sky Sports 1" -> "Sky")."""
+    parts = name.strip().split(" ", 1)
+    return parts[0] if len(parts) == 2 else None
+
+
+def ensure_category_column(conn: sqlite3.Connection) -> None:
+    """
+    Add channels.category, backfill it from the names, and keep it filled
+    on insert/rename. An explicitly written category (e.g. an M3U
+    group-title) is never overwritten.
+    """
+    if add_missing_columns(conn, {"category": "TEXT"}):
+        conn.execute(f"UPDATE channels SET category = {_CATEGORY_SQL.format(col='name')}")
+    conn.executescript(f"""
+        CREATE INDEX IF NOT EXISTS idx_channels_category ON channels(category, name, id);
+        CREATE TRIGGER IF NOT EXISTS channels_category_ai AFTER INSERT ON channels
+        WHEN new.category IS NULL BEGIN
+            UPDATE channels SET category = {_CATEGORY_SQL.format(col='new.name')} WHERE id = new.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS channels_category_au AFTER UPDATE OF name ON channels
+        WHEN new.category IS NULL OR new.category IS {_CATEGORY_SQL.format(col='old.name')} BEGIN
+            UPDATE channels SET category = {_CATEGORY_SQL.format(col='new.name')} WHERE id = new.id;
+        END;
+    """)
+
+
+def list_categories(conn: sqlite3.Connection) -> list[dict]:
+    """Categories with channel counts, answered from idx_channels_category."""
+    rows = conn.execute(
+        "SELECT category, COUNT(*) FROM channels WHERE category IS NOT NULL "
+        "GROUP BY category ORDER BY category"
+    )
+    return [{"name": name, "count": count} for name, count in rows]
+
+
+def favorite_ids(conn: sqlite3.Connection, limit: int) -> list[int]:
+    """Favorite channel ids in name order, skipping ones the prober found dead."""
+    rows = conn.execute(
+        "SELECT id FROM channels WHERE Favorites = 1 AND alive IS NOT 0 ORDER BY name, id LIMIT ?",
+        (limit,),
+    )
+    return [r[0] for r in rows]
+
+
+def ensure_search_index(conn: sqlite3.Connection) -> bool:
+    """
+    Create the FTS5 index over channels.name (external content, so names are
+    not stored twice) plus the triggers that keep it in sync. Returns False
+    if this SQLite build has no FTS5; search then falls back to LIKE.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'channels_fts'"
+    ).fetchone()
+    if exists:
+        return True
+    try:
+        conn.executescript("""
+            CREATE VIRTUAL TABLE channels_fts USING fts5(
+                name, content='channels', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+            );
+            CREATE TRIGGER IF NOT EXISTS channels_fts_ai AFTER INSERT ON channels BEGIN
+                INSERT INTO channels_fts(rowid, name) VALUES (new.id, new.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS channels_fts_ad AFTER DELETE ON channels BEGIN
+                INSERT INTO channels_fts(channels_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS channels_fts_au AFTER UPDATE OF name ON channels BEGIN
+                INSERT INTO channels_fts(channels_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                INSERT INTO channels_fts(rowid, name) VALUES (new.id, new.name);
+            END;
+            INSERT INTO channels_fts(channels_fts) VALUES ('rebuild');
+        """)
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        return False
+    return True
+
+
+# ─────────────── Cursors ───────────────
+def encode_cursor(sort: str, key: str | float, channel_id: int) -> str:
+    raw = json.dumps([sort, key, channel_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str = "name") -> tuple[str | float, int]:
+    """Return the (sort key, id) to resume after; the cursor must match ``sort``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, channel_id = json.loads(raw)
+        if cursor_sort != sort or not isinstance(key, (str, int, float)) or not isinstance(channel_id, int):
+            raise TypeError
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return key, channel_id
+
+
+# ─────────────── Listing ───────────────
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _truthy(value: Any) -> bool:
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def parse_page_args(args: Mapping[str, Any]) -> dict:
+    """
+    Normalise query-string arguments (Flask ``request.args`` or Starlette
+    ``request.query_params``) into keyword arguments for ``page_channels``.
+    Raises ValueError on bad input.
+    """
+    try:
+        limit = int(args.get("limit") or DEFAULT_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    fields = None
+    if args.get("fields"):
+        fields = tuple(f.strip() for f in args["fields"].split(",") if f.strip())
+        unknown = [f for f in fields if f not in PUBLIC_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+
+    sort = args.get("sort") or "name"
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_COLUMNS)}")
+
+    cursor = args.get("cursor") or None
+    if cursor:
+        decode_cursor(cursor, sort)
+
+    alive = args.get("alive")
+    return {
+        "limit": min(limit, MAX_PAGE_SIZE),
+        "cursor": cursor,
+        "q": (args.get("q") or "").strip() or None,
+        "category": (args.get("category") or "").strip() or None,
+        "favorites_only": _truthy(args.get("favorites_only", "")),
+        "alive": None if alive in (None, "") else _truthy(alive),
+        "sort": sort,
+        "fields": fields,
+    }
+
+
+def wants_page(args: Mapping[str, Any]) -> bool:
+    """True if the request uses any of the paginated-listing parameters."""
+    return any(p in args for p in PAGE_PARAMS)
+
+
+def _row_to_item(fields, values) -> dict:
+    return {f: (bool(v) if v is not None else None) if f in BOOL_FIELDS else v for f, v in zip(fields, values)}
+
+
+def public_channels(rows) -> list[dict]:
+    """Full channel rows cut down to PUBLIC_FIELDS, for the unpaginated listing."""
+    return [_row_to_item(PUBLIC_FIELDS, [row.get(f) for f in PUBLIC_FIELDS]) for row in rows]
+
+
+def page_channels(conn: sqlite3.Connection, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None,
+                  q: str | None = None, category: str | None = None, favorites_only: bool = False,
+                  alive: bool | None = None, sort: str = "name",
+                  fields: tuple[str, ...] | None = None) -> dict:
+    """
+    One page of channels ordered by (name, id) or (ttfb_ms, id), using
+    keyset pagination so deep pages cost the same as the first one.
+    Channels never probed are left out of the ttfb ordering.
+    Returns {"items": [...], "next_cursor": str | None}.
+    """
+    fields = tuple(fields or DEFAULT_FIELDS)
+    sort_col = SORT_COLUMNS[sort]
+    # id and the sort column are always selected: the cursor is built from them
+    select = list(dict.fromkeys(("id", sort_col) + fields))
+
+    where, params = [], []
+    if sort_col != "name":
+        where.append(f"{sort_col} IS NOT NULL")
+    if cursor:
+        after_key, after_id = decode_cursor(cursor, sort)
+        where.append(f"({sort_col}, id) > (?, ?)")
+        params += [after_key, after_id]
+    if q:
+        where.append("name LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(q)}%")
+    if category:
+        where.append("category = ?")
+        params.append(category)
+    if favorites_only:
+        where.append("Favorites = 1")
+    if alive is not None:
+        where.append("alive = ?")
+        params.append(int(alive))
+
+    sql = f"SELECT {', '.join(_column(f) for f in select)} FROM channels"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_col}, id LIMIT ?"
+    params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, rows[-1][1], rows[-1][0])
+
+    items = []
+    for row in rows:
+        record = dict(zip(select, row))
+        items.append(_row_to_item(fields, [record[f] for f in fields]))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# ─────────────── Search ───────────────
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(text: str) -> str | None:
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match,
+    the last one as a prefix ("sky spo" -> "sky" "spo"*).
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{t}"' for t in tokens[:-1]] + [f'"{tokens[-1]}"*']
+    return " ".join(terms)
+
+
+def search_channels(conn: sqlite3.Connection, q: str, limit: int = DEFAULT_SEARCH_LIMIT,
+                    category: str | None = None, fields: tuple[str, ...] | None = None) -> dict:
+    """Ranked (bm25) prefix search over channel names."""
+    fields = tuple(fields or DEFAULT_FIELDS)
+    match = fts_query(q)
+    if match is None:
+        return {"items": []}
+
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'channels_fts'"
+    ).fetchone()
+    if not has_fts:
+        page = page_channels(conn, limit=limit, q=q, category=category, fields=fields)
+        return {"items": page["items"]}
+
+    sql = (
+        f"SELECT {', '.join(_column(f, 'c') for f in fields)} FROM channels_fts "
+        "JOIN channels c ON c.id = channels_fts.rowid WHERE channels_fts MATCH ?"
+    )
+    params: list[Any] = [match]
+    if category:
+        sql += " AND c.category = ?"
+        params.append(category)
+    # Ranking a one-letter prefix means scoring most of the catalog; just take
+    # the first matches from the index instead.
+    if len(q.strip()) > 1:
+        sql += " ORDER BY channels_fts.rank, c.name"
+    sql += " LIMIT ?"
+    params.append(limit)
+
+    return {"items": [_row_to_item(fields, row) for row in conn.execute(sql, params)]}
+
+
+def parse_search_args(args: Mapping[str, Any]) -> dict:
+    page_args = parse_page_args({**args, "limit": args.get("limit") or DEFAULT_SEARCH_LIMIT})
+    if not page_args["q"]:
+        raise ValueError("q is required")
+    return {k: page_args[k] for k in ("q", "limit", "category", "fields")}
+
+
+# ─────────────── Health probes ───────────────
+def probe_targets(conn: sqlite3.Connection, after_id: int = 0, limit: int = 500) -> list[tuple[int, str]]:
+    """The next ``limit`` (id, url) pairs after ``after_id``, for the prober to walk the table."""
+    return conn.execute(
+        "SELECT id, url FROM channels WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+    ).fetchall()
+
+
+def set_stream_mode(conn: sqlite3.Connection, channel_id: int, mode: str | None) -> bool:
+    """Store a 'copy'/'transcode' override; None or 'auto' clears it. False if no such channel."""
+    if mode == "auto":
+        mode = None
+    cur = conn.execute("UPDATE channels SET stream_mode = ? WHERE id = ?", (mode, channel_id))
+    return cur.rowcount > 0
+
+
+def record_probe_results(conn: sqlite3.Connection, results) -> None:
+    """
+    ``results`` are (alive, last_checked, ttfb_ms, codec, resolution, id)
+    tuples; a None codec/resolution keeps the previously detected value.
+    """
+    conn.executemany(
+        "UPDATE channels SET alive = ?, last_checked = ?, ttfb_ms = ?, "
+        "codec = COALESCE(?, codec), resolution = COALESCE(?, resolution) WHERE id = ?",
+        results,
+    )
@@ -0,0 +1,163 @@
+"""
+Background health prober for channel URLs.
+
+Walks the channels table in id order and checks every http(s) URL with a
+bounded number of concurrent requests, recording whether it answered, when
+it was checked and its time to first byte. With ``use_ffprobe`` it also
+asks ffprobe for the video codec and resolution of live channels.
+Results land in the channels.alive / last_checked / ttfb_ms / codec /
+resolution columns, which /api/channels can filter and sort on.
+"""
+import asyncio
+import json
+import ssl
+import time
+from typing import NamedTuple
+from urllib.parse import urljoin, urlsplit
+
+from ffmpeg_tools import find_ffprobe
+
+USER_AGENT = "vlc-website-prober/1.0"
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class ProbeResult(NamedTuple):
+    alive: bool
+    status: int | None = None
+    ttfb_ms: float | None = None
+    error: str | None = None
+
+
+async def _http_get_head(url: str, timeout: float) -> tuple[int, dict, float]:
+    """Send a GET, read only the status line and headers; returns (status, headers, ttfb_ms)."""
+    parts = urlsplit(url)
+    https = parts.scheme == "https"
+    host = parts.hostname
+    port = parts.port or (443 if https else 80)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    host_header = host if parts.port is None else f"{host}:{parts.port}"
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=ssl.create_default_context() if https else None),
+        timeout,
+    )
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: {USER_AGENT}\r\n"
+            f"Accept: */*\r\nConnection: close\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+        sent = time.monotonic()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        ttfb_ms = (time.monotonic() - sent) * 1000
+        if not status_line:
+            raise ConnectionError("empty response")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers, ttfb_ms
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass   # the connection is gone either way
+
+
+async def probe_http(url: str, timeout: float = 8.0, max_redirects: int = 3) -> ProbeResult:
+    try:
+        for _ in range(max_redirects + 1):
+            status, headers, ttfb_ms = await _http_get_head(url, timeout)
+            if status in REDIRECT_CODES and headers.get("location"):
+                url = urljoin(url, headers["location"])
+                continue
+            return ProbeResult(200 <= status < 300, status, round(ttfb_ms, 1))
+        return ProbeResult(False, status, None, "too many redirects")
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError, ConnectionError) as e:
+        return ProbeResult(False, None, None, str(e) or e.__class__.__name__)
+
+
+async def probe_media(url: str, ffprobe: str, timeout: float = 15.0) -> tuple[str | None, str | None]:
+    """(codec, "WxH") of the first video stream according to ffprobe."""
+    proc = await asyncio.create_subprocess_exec(
+        ffprobe, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height", "-of", "json", url,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None, None
+    try:
+        stream = json.loads(out or b"{}").get("streams", [{}])[0]
+    except (ValueError, IndexError):
+        return None, None
+    resolution = f"{stream['width']}x{stream['height']}" if stream.get("width") else None
+    return stream.get("codec_name"), resolution
+
+
+class ChannelProber:
+    def __init__(self, repo, concurrency: int = 32, timeout: float = 8.0,
+                 use_ffprobe: bool = False, ffprobe: str | None = None, batch_size: int = 500):
+        self.repo = repo
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.ffprobe = (ffprobe or find_ffprobe()) if use_ffprobe else None
+        self.running = False
+        self.last_run: dict | None = None
+
+    async def probe_channel(self, channel_id: int, url: str, sem: asyncio.Semaphore) -> tuple | None:
+        if urlsplit(url).scheme not in ("http", "https"):
+            return None  # rtmp/rtsp/udp: nothing cheap to check
+        async with sem:
+            result = await probe_http(url, self.timeout)
+            codec = resolution = None
+            if result.alive and self.ffprobe:
+                codec, resolution = await probe_media(url, self.ffprobe, self.timeout * 2)
+        return (int(result.alive), time.time(), result.ttfb_ms, codec, resolution, channel_id)
+
+    async def run_once(self) -> dict:
+        """Probe every channel once; returns counts. Concurrent calls are ignored."""
+        if self.running:
+            return {"skipped": True}
+        self.running = True
+        started = time.monotonic()
+        checked = alive = 0
+        sem = asyncio.Semaphore(self.concurrency)
+        try:
+            after_id = 0
+            while True:
+                targets = await asyncio.to_thread(self.repo.probe_targets, after_id, self.batch_size)
+                if not targets:
+                    break
+                after_id = targets[-1][0]
+                rows = await asyncio.gather(*(self.probe_channel(cid, url, sem) for cid, url in targets))
+                rows = [r for r in rows if r is not None]
+                if rows:
+                    await asyncio.to_thread(self.repo.record_probe_results, rows)
+                checked += len(rows)
+                alive += sum(r[0] for r in rows)
+        finally:
+            self.running = False
+        self.last_run = {
+            "checked": checked, "alive": alive, "dead": checked - alive,
+            "seconds": round(time.monotonic() - started, 1), "finished_at": time.time(),
+        }
+        return self.last_run
+
+    async def run_forever(self, interval: float) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Channel probe failed: {e}")
+            await asyncio.sleep(interval)
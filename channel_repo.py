@@ -0,0 +1,231 @@
+"""
+Channel repository shared by both backends.
+
+A small bounded pool of long-lived sqlite3 connections replaces the
+connect-per-call pattern. Each connection is opened once with WAL,
+synchronous=NORMAL and mmap, and keeps sqlite3's per-connection statement
+cache warm, so repeated queries reuse their prepared statements.
+``AsyncChannelRepository`` runs the same calls in a worker thread for the
+FastAPI backend, so catalog reads never block the event loop.
+"""
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import channel_db
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",   # 256 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+class ConnectionPool:
+    def __init__(self, db_path: str, size: int = 4, timeout: float = 5.0,
+                 on_connect: Callable[[sqlite3.Connection], None] | None = None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._on_connect = on_connect
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path, timeout=self.timeout, check_same_thread=False, cached_statements=256
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if self._on_connect:
+            self._on_connect(conn)
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._open()
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No channels.db connection free after {self.timeout}s")
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            self._idle = queue.LifoQueue()
+
+
+class ChannelRepository:
+    def __init__(self, db_path: str = "channels.db", pool_size: int = 4):
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._now_playing: int | None = None
+        self._now_playing_loaded = False
+        self._write_listeners: list[Callable[[], object]] = []
+        self.pool = ConnectionPool(db_path, size=pool_size, on_connect=self._prepare)
+
+    def _prepare(self, conn: sqlite3.Connection) -> None:
+        with self._schema_lock:
+            if not self._schema_ready:
+                channel_db.ensure_schema(conn)
+                self._schema_ready = True
+
+    def on_write(self, callback: Callable[[], object]) -> None:
+        """Register a callback (e.g. ChannelCatalog.invalidate) run after every write."""
+        self._write_listeners.append(callback)
+
+    def notify_write(self) -> None:
+        for callback in self._write_listeners:
+            callback()
+
+    def reset_cached_state(self) -> None:
+        """Forget in-memory state after a bulk write made outside the repository (e.g. an import)."""
+        self._now_playing_loaded = False
+        self.notify_write()
+
+    # ─────────────── Reads ───────────────
+    def get_channel_by_id(self, channel_id: int) -> dict | None:
+        with self.pool.connection() as conn:
+            # the trailing is_playing shadows the legacy column of the same name
+            cur = conn.execute(
+                f"SELECT *, (id IS {channel_db.NOW_PLAYING_SQL}) AS is_playing FROM channels WHERE id = ?",
+                (channel_id,),
+            )
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else None
+
+    def list_channels(self) -> list[dict]:
+        with self.pool.connection() as conn:
+            cur = conn.execute(
+                f"SELECT *, (id IS {channel_db.NOW_PLAYING_SQL}) AS is_playing FROM channels ORDER BY name"
+            )
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def page_channels(self, **filters) -> dict:
+        with self.pool.connection() as conn:
+            return channel_db.page_channels(conn, **filters)
+
+    def search_channels(self, **args) -> dict:
+        with self.pool.connection() as conn:
+            return channel_db.search_channels(conn, **args)
+
+    def list_categories(self) -> list[dict]:
+        with self.pool.connection() as conn:
+            return channel_db.list_categories(conn)
+
+    def favorite_ids(self, limit: int) -> list[int]:
+        with self.pool.connection() as conn:
+            return channel_db.favorite_ids(conn, limit)
+
+    def probe_targets(self, after_id: int = 0, limit: int = 500) -> list[tuple[int, str]]:
+        with self.pool.connection() as conn:
+            return channel_db.probe_targets(conn, after_id, limit)
+
+    def now_playing_id(self) -> int | None:
+        """Currently playing channel id, served from memory after the first read."""
+        if not self._now_playing_loaded:
+            with self.pool.connection() as conn:
+                self._now_playing = channel_db.get_now_playing_id(conn)
+            self._now_playing_loaded = True
+        return self._now_playing
+
+    def get_now_playing(self) -> dict | None:
+        channel_id = self.now_playing_id()
+        return self.get_channel_by_id(channel_id) if channel_id is not None else None
+
+    # ─────────────── Writes ───────────────
+    def set_playing(self, channel_id: int | None) -> None:
+        """Single-row write-through of the now-playing state."""
+        with self.pool.connection() as conn:
+            channel_db.set_now_playing(conn, channel_id, time.time() if channel_id is not None else None)
+        self._now_playing = channel_id
+        self._now_playing_loaded = True
+        self.notify_write()
+
+    def record_probe_results(self, results) -> None:
+        with self.pool.connection() as conn:
+            channel_db.record_probe_results(conn, results)
+        self.notify_write()
+
+    def toggle_favorite(self, channel_id: int) -> int | None:
+        """Flip the Favorites flag; returns the new value, or None if no such channel."""
+        with self.pool.connection() as conn:
+            cur = conn.execute(
+                "UPDATE channels SET Favorites = CASE Favorites WHEN 1 THEN 0 ELSE 1 END WHERE id = ?",
+                (channel_id,),
+            )
+            if cur.rowcount == 0:
+                return None
+            new_status = conn.execute("SELECT Favorites FROM channels WHERE id = ?", (channel_id,)).fetchone()[0]
+        self.notify_write()
+        return new_status
+
+    def set_stream_mode(self, channel_id: int, mode: str | None) -> bool:
+        with self.pool.connection() as conn:
+            changed = channel_db.set_stream_mode(conn, channel_id, mode)
+        if changed:
+            self.notify_write()
+        return changed
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class AsyncChannelRepository:
+    """Thread-offloaded facade over ChannelRepository for asyncio callers."""
+
+    def __init__(self, repo: ChannelRepository):
+        self.repo = repo
+
+    async def get_channel_by_id(self, channel_id: int) -> dict | None:
+        return await asyncio.to_thread(self.repo.get_channel_by_id, channel_id)
+
+    async def list_channels(self) -> list[dict]:
+        return await asyncio.to_thread(self.repo.list_channels)
+
+    async def page_channels(self, **filters) -> dict:
+        return await asyncio.to_thread(lambda: self.repo.page_channels(**filters))
+
+    async def search_channels(self, **args) -> dict:
+        return await asyncio.to_thread(lambda: self.repo.search_channels(**args))
+
+    async def list_categories(self) -> list[dict]:
+        return await asyncio.to_thread(self.repo.list_categories)
+
+    async def get_now_playing(self) -> dict | None:
+        return await asyncio.to_thread(self.repo.get_now_playing)
+
+    async def set_playing(self, channel_id: int | None) -> None:
+        await asyncio.to_thread(self.repo.set_playing, channel_id)
+
+    async def toggle_favorite(self, channel_id: int) -> int | None:
+        return await asyncio.to_thread(self.repo.toggle_favorite, channel_id)
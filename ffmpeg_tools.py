@@ -0,0 +1,162 @@
+"""
+ffmpeg discovery and readiness helpers for the HLS streamer.
+
+The ffmpeg binary and its capabilities (encoders, hardware accelerators)
+are resolved once per process and cached, instead of spawning
+``ffmpeg -version`` on every play request.
+"""
+import functools
+import json
+import os
+import shutil
+import subprocess
+import time
+from typing import NamedTuple
+
+FFMPEG_CANDIDATES = (
+    'ffmpeg', r'C:\ffmpeg\bin\ffmpeg.exe',
+    r'C:\Program Files\ffmpeg\bin\ffmpeg.exe', 'ffmpeg.exe',
+)
+
+
+class FFmpegInfo(NamedTuple):
+    path: str
+    version: str
+    encoders: frozenset
+    hwaccels: tuple
+
+    def has_encoder(self, name: str) -> bool:
+        return name in self.encoders
+
+
+def _run(args, timeout=10):
+    return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=True)
+
+
+def _resolve(candidates) -> str | None:
+    for candidate in candidates:
+        path = shutil.which(candidate) or (candidate if os.path.isfile(candidate) else None)
+        if not path:
+            continue
+        try:
+            _run([path, '-version'])
+            return path
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def find_ffmpeg() -> str | None:
+    return _resolve(FFMPEG_CANDIDATES)
+
+
+@functools.lru_cache(maxsize=None)
+def find_ffprobe() -> str | None:
+    """ffprobe next to the resolved ffmpeg, else whatever is on PATH."""
+    candidates = ['ffprobe', 'ffprobe.exe']
+    ffmpeg = find_ffmpeg()
+    if ffmpeg and os.path.dirname(ffmpeg):
+        base = os.path.join(os.path.dirname(ffmpeg), 'ffprobe')
+        candidates = [base, base + '.exe'] + candidates
+    return _resolve(candidates)
+
+
+def _parse_encoders(output: str) -> frozenset:
+    # " V....D libx264   libx264 H.264 / AVC ..." -> "libx264"
+    names = set()
+    started = False
+    for line in output.splitlines():
+        if line.strip().startswith('------'):
+            started = True
+            continue
+        parts = line.split()
+        if started and len(parts) >= 2:
+            names.add(parts[1])
+    return frozenset(names)
+
+
+def _parse_hwaccels(output: str) -> tuple:
+    lines = [l.strip() for l in output.splitlines() if l.strip()]
+    if lines and lines[0].lower().startswith('hardware acceleration methods'):
+        lines = lines[1:]
+    return tuple(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_info() -> FFmpegInfo | None:
+    """Resolve ffmpeg and probe its capabilities; None if ffmpeg is missing."""
+    path = find_ffmpeg()
+    if not path:
+        return None
+    try:
+        version = _run([path, '-hide_banner', '-version']).stdout.decode(errors='replace').splitlines()[0]
+        encoders = _parse_encoders(_run([path, '-hide_banner', '-encoders']).stdout.decode(errors='replace'))
+        hwaccels = _parse_hwaccels(_run([path, '-hide_banner', '-hwaccels']).stdout.decode(errors='replace'))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError, IndexError):
+        version, encoders, hwaccels = '', frozenset(), ()
+    return FFmpegInfo(path, version, encoders, hwaccels)
+
+
+class SourceInfo(NamedTuple):
+    video_codec: str | None
+    audio_codec: str | None
+    width: int | None = None
+    height: int | None = None
+
+
+def _parse_probe(output: str) -> SourceInfo:
+    video = audio = None
+    for stream in json.loads(output or '{}').get('streams', []):
+        if stream.get('codec_type') == 'video' and video is None:
+            video = stream
+        elif stream.get('codec_type') == 'audio' and audio is None:
+            audio = stream
+    video = video or {}
+    return SourceInfo(
+        video.get('codec_name'), (audio or {}).get('codec_name'),
+        video.get('width'), video.get('height'),
+    )
+
+
+def probe_source(url: str, timeout: float = 8.0) -> SourceInfo | None:
+    """First video and audio codec of ``url`` per ffprobe; None if it can't tell."""
+    ffprobe = find_ffprobe()
+    if not ffprobe:
+        return None
+    try:
+        out = _run([
+            ffprobe, '-v', 'error', '-show_entries', 'stream=codec_type,codec_name,width,height',
+            '-of', 'json', url,
+        ], timeout=timeout).stdout.decode(errors='replace')
+        return _parse_probe(out)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError, ValueError):
+        return None
+
+
+def playlist_ready(playlist_path: str) -> bool:
+    """
+    True once ffmpeg has written a media playlist that lists at least one
+    segment, or a master playlist (written after every variant has one).
+    """
+    try:
+        with open(playlist_path, 'r', errors='replace') as fh:
+            text = fh.read()
+            return '#EXTINF' in text or '#EXT-X-STREAM-INF' in text
+    except OSError:
+        return False
+
+
+def wait_for_playlist(playlist_path: str, process=None, timeout: float = 15.0, interval: float = 0.05) -> bool:
+    """
+    Block until ``playlist_path`` has its first segment, the process exits,
+    or ``timeout`` passes. Returns True only in the first case.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if playlist_ready(playlist_path):
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        time.sleep(interval)
+    return False
@@ -0,0 +1,198 @@
+"""
+ffmpeg command lines for the HLS streamer.
+
+Each builder returns a ``StreamPlan``: the argv to run, the playlist a
+player should open (relative to the stream directory) and the file whose
+appearance means the stream is ready to play.
+"""
+import os
+from typing import NamedTuple
+
+# Shared HLS muxer settings: 1 s segments, 5-segment live window. temp_file
+# makes segments and playlists appear atomically, so the segment store never
+# reads a half-written file.
+HLS_ARGS = (
+    '-f', 'hls', '-hls_time', '1', '-hls_list_size', '5',
+    '-hls_flags', 'delete_segments+independent_segments+temp_file',
+    '-hls_segment_type', 'mpegts', '-hls_start_number_source', 'epoch',
+)
+
+
+# Stream modes; channels.stream_mode holds an operator override (NULL = auto)
+STREAM_MODES = ('auto', 'copy', 'transcode')
+
+# What browsers can play from MPEG-TS HLS without us touching it
+COPY_VIDEO_CODECS = frozenset({'h264'})
+COPY_AUDIO_CODECS = frozenset({'aac'})
+
+# Progress as key=value blocks on stdout, only warnings and errors on stderr;
+# parsed by stream_supervisor
+PROGRESS_ARGS = ('-hide_banner', '-loglevel', 'warning', '-nostats', '-progress', 'pipe:1')
+
+
+class StreamPlan(NamedTuple):
+    cmd: list
+    playlist: str
+    ready_path: str
+
+
+class Rendition(NamedTuple):
+    name: str
+    height: int | None          # None = audio-only variant
+    video_kbps: int = 0
+    audio_kbps: int = 128
+
+
+DEFAULT_LADDER = (
+    Rendition('1080p', 1080, 5000, 160),
+    Rendition('720p', 720, 2800, 128),
+    Rendition('480p', 480, 1200, 96),
+    Rendition('audio', None, 0, 64),
+)
+
+
+def parse_ladder(spec: str) -> tuple[Rendition, ...]:
+    """
+    "1080:5000,720:2800,480:1200,audio:64" -> renditions. Video entries are
+    height:video_kbps[:audio_kbps]; "audio:<kbps>" adds an audio-only variant.
+    """
+    ladder = []
+    for item in spec.split(','):
+        parts = item.strip().split(':')
+        if not parts[0]:
+            continue
+        if parts[0] == 'audio':
+            ladder.append(Rendition('audio', None, 0, int(parts[1]) if len(parts) > 1 else 64))
+        else:
+            height, video_kbps = int(parts[0]), int(parts[1])
+            audio_kbps = int(parts[2]) if len(parts) > 2 else 128
+            ladder.append(Rendition(f'{height}p', height, video_kbps, audio_kbps))
+    if not any(r.height for r in ladder):
+        raise ValueError("ABR ladder needs at least one video rendition")
+    return tuple(ladder)
+
+
+def fit_ladder(ladder, source_height: int | None) -> tuple[Rendition, ...]:
+    """
+    Drop video rungs taller than the source; upscaling only spends CPU and
+    bandwidth on copies of a lower rung. The shortest rung always stays.
+    """
+    if not source_height:
+        return tuple(ladder)
+    video = [r for r in ladder if r.height]
+    lowest = min(video, key=lambda r: r.height)
+    return tuple(r for r in ladder if not r.height or r.height <= source_height or r is lowest)
+
+
+def transcode_plan(ffmpeg: str, url: str, out_dir: str) -> StreamPlan:
+    """Single 25 fps H.264 baseline / AAC rendition."""
+    playlist = os.path.join(out_dir, 'stream.m3u8')
+    cmd = [
+        ffmpeg, *PROGRESS_ARGS, '-i', url,
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+        '-profile:v', 'baseline', '-level', '3.0', '-pix_fmt', 'yuv420p',
+        '-r', '25', '-g', '50', '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', '128k', '-ar', '44100',
+        *HLS_ARGS,
+        '-force_key_frames', 'expr:gte(t,n_forced*1)', '-y', playlist,
+    ]
+    return StreamPlan(cmd, 'stream.m3u8', playlist)
+
+
+def ll_hls_plan(ffmpeg: str, url: str, out_dir: str,
+                part_duration: float = 0.5, parts_per_segment: int = 4) -> StreamPlan:
+    """
+    Short keyframe-aligned parts (part<N>.ts in parts.m3u8) for ll_hls to
+    package into an LL-HLS playlist. Every part starts on a keyframe, so
+    each one is independently decodable.
+    """
+    parts = os.path.join(out_dir, 'parts.m3u8')
+    cmd = [
+        ffmpeg, *PROGRESS_ARGS, '-i', url,
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+        '-profile:v', 'baseline', '-level', '3.0', '-pix_fmt', 'yuv420p',
+        '-r', '25', '-g', str(max(1, round(25 * part_duration))), '-sc_threshold', '0',
+        '-force_key_frames', f'expr:gte(t,n_forced*{part_duration})',
+        '-c:a', 'aac', '-b:a', '128k', '-ar', '44100',
+        '-f', 'hls', '-hls_time', str(part_duration), '-hls_list_size', str(parts_per_segment * 6),
+        '-hls_flags', 'delete_segments+independent_segments+temp_file',
+        '-hls_segment_type', 'mpegts', '-hls_start_number_source', 'epoch',
+        '-hls_segment_filename', os.path.join(out_dir, 'part%d.ts'),
+        '-y', parts,
+    ]
+    return StreamPlan(cmd, 'stream.m3u8', parts)
+
+
+def can_copy_video(source) -> bool:
+    return source is not None and source.video_codec in COPY_VIDEO_CODECS
+
+
+def choose_mode(override: str | None, source) -> str:
+    """'copy' or 'transcode' for a channel, given its override and probed source."""
+    if override in ('copy', 'transcode'):
+        return override
+    return 'copy' if can_copy_video(source) else 'transcode'
+
+
+def remux_plan(ffmpeg: str, url: str, out_dir: str, copy_audio: bool = True) -> StreamPlan:
+    """
+    Repackage an H.264 source into HLS without re-encoding the video. Audio
+    is copied too when it is already AAC, otherwise it alone is transcoded.
+    Segments are cut on the source's own keyframes.
+    """
+    playlist = os.path.join(out_dir, 'stream.m3u8')
+    audio = ['-c:a', 'copy'] if copy_audio else ['-c:a', 'aac', '-b:a', '128k', '-ar', '44100']
+    cmd = [
+        ffmpeg, *PROGRESS_ARGS, '-i', url,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c:v', 'copy', *audio,
+        *HLS_ARGS,
+        '-y', playlist,
+    ]
+    return StreamPlan(cmd, 'stream.m3u8', playlist)
+
+
+def abr_plan(ffmpeg: str, url: str, out_dir: str, ladder=DEFAULT_LADDER,
+             source_height: int | None = None) -> StreamPlan:
+    """
+    One ffmpeg process, one decode: the video is split and scaled once per
+    rung, every rung gets its own AAC track, and a master playlist ties the
+    variants together (<out_dir>/<rendition>/stream.m3u8). Rungs above
+    ``source_height`` are left out, and no rung is ever scaled up.
+    """
+    ladder = fit_ladder(ladder, source_height)
+    video = [r for r in ladder if r.height]
+    splits = ''.join(f'[v{i}]' for i in range(len(video)))
+    scales = ';'.join(f"[v{i}]scale=-2:'min(ih,{r.height})'[v{i}out]" for i, r in enumerate(video))
+    cmd = [ffmpeg, *PROGRESS_ARGS, '-i', url, '-filter_complex', f'[0:v]split={len(video)}{splits};{scales}']
+
+    for i, r in enumerate(video):
+        cmd += [
+            '-map', f'[v{i}out]', f'-c:v:{i}', 'libx264',
+            f'-b:v:{i}', f'{r.video_kbps}k', f'-maxrate:v:{i}', f'{int(r.video_kbps * 1.07)}k',
+            f'-bufsize:v:{i}', f'{int(r.video_kbps * 1.5)}k',
+        ]
+    cmd += [
+        '-preset', 'veryfast', '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+        '-r', '25', '-g', '50', '-keyint_min', '50', '-sc_threshold', '0',
+        '-force_key_frames', 'expr:gte(t,n_forced*1)',
+    ]
+
+    stream_map = []
+    for j, r in enumerate(ladder):
+        cmd += ['-map', '0:a:0', f'-c:a:{j}', 'aac', f'-b:a:{j}', f'{r.audio_kbps}k']
+        if r.height:
+            stream_map.append(f'v:{video.index(r)},a:{j},name:{r.name}')
+        else:
+            stream_map.append(f'a:{j},name:{r.name}')
+    cmd += ['-ar', '44100', '-ac', '2']
+
+    master = os.path.join(out_dir, 'master.m3u8')
+    cmd += [
+        *HLS_ARGS,
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', ' '.join(stream_map),
+        '-hls_segment_filename', os.path.join(out_dir, '%v', 'seg_%d.ts'),
+        '-y', os.path.join(out_dir, '%v', 'stream.m3u8'),
+    ]
+    return StreamPlan(cmd, 'master.m3u8', master)
@@ -0,0 +1,156 @@
+"""
+Low-Latency HLS packaging on top of ffmpeg's plain HLS muxer.
+
+ffmpeg writes short, independently decodable "parts" (``part<N>.ts``,
+0.5 s by default) into ``parts.m3u8``. The packager groups every
+``parts_per_segment`` consecutive parts into a full segment (MPEG-TS
+concatenates cleanly), and publishes an LL-HLS media playlist listing
+``EXT-X-PART`` entries for the live edge plus a preload hint for the next
+part. Clients block on ``_HLS_msn``/``_HLS_part`` instead of re-polling.
+"""
+import math
+import re
+
+from segment_store import PLAYLIST_TYPE, Entry, make_etag
+
+_SEQ_RE = re.compile(r'#EXT-X-MEDIA-SEQUENCE:(\d+)')
+_PART_NAME_RE = re.compile(r'part(\d+)\.ts$')
+
+# Parts shown in full for this many complete segments behind the live edge
+PART_SEGMENTS = 2
+
+
+def parse_media_playlist(text: str) -> tuple[int, list[tuple[float, str]]]:
+    """(media sequence, [(duration, uri), ...]) of a plain media playlist."""
+    match = _SEQ_RE.search(text)
+    sequence = int(match.group(1)) if match else 0
+    items = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXTINF:'):
+            duration = float(line[8:].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            items.append((duration, line))
+            duration = None
+    return sequence, items
+
+
+def parse_blocking_args(args) -> tuple[int | None, int | None]:
+    """_HLS_msn / _HLS_part query parameters; ValueError if malformed."""
+    msn, part = args.get('_HLS_msn'), args.get('_HLS_part')
+    if msn is None:
+        if part is not None:
+            raise ValueError("_HLS_part requires _HLS_msn")
+        return None, None
+    msn = int(msn)
+    part = int(part) if part is not None else None
+    if msn < 0 or (part is not None and part < 0):
+        raise ValueError("_HLS_msn and _HLS_part must be non-negative")
+    return msn, part
+
+
+class LowLatencyPackager:
+    def __init__(self, store, part_target: float = 0.5, parts_per_segment: int = 4,
+                 source: str = 'parts.m3u8', playlist: str = 'stream.m3u8'):
+        self.store = store
+        self.part_target = part_target
+        self.parts_per_segment = parts_per_segment
+        self.source = source
+        self.playlist = playlist
+        self.msn = -1          # newest segment (possibly still being filled)
+        self.parts = 0         # parts of it published so far
+        self.next_part: str | None = None
+        store.add_listener(self._on_playlist)
+
+    def has(self, msn: int, part: int | None) -> bool:
+        """True once the playlist contains segment ``msn`` (or its part ``part``)."""
+        if msn < self.msn:
+            return True
+        if msn > self.msn:
+            return False
+        if part is None:
+            return self.parts >= self.parts_per_segment
+        return part < self.parts
+
+    def wait(self, msn: int, part: int | None, timeout: float) -> bool:
+        """
+        Blocking playlist reload. Raises ValueError for a request more than
+        two segments past the live edge, as the spec asks servers to reject.
+        """
+        if self.msn >= 0 and msn > self.msn + 2:
+            raise ValueError("_HLS_msn is too far ahead of the live edge")
+        return self.store.wait_for(lambda: self.has(msn, part), timeout)
+
+    def wait_for_part(self, name: str, timeout: float) -> bool:
+        """Hold a request for the preload-hinted part until ffmpeg finishes it."""
+        if name != self.next_part:
+            return False
+        return self.store.wait_for(lambda: self.store.get(name) is not None, timeout)
+
+    # ─────────────── internals ───────────────
+
+    def _on_playlist(self, name: str, body: bytes) -> None:
+        if name != self.source:
+            return
+        sequence, items = parse_media_playlist(body.decode('utf-8', errors='replace'))
+        parts = [(sequence + i, duration, uri) for i, (duration, uri) in enumerate(items)
+                 if self.store.get(uri) is not None]
+        if not parts:
+            return
+
+        # group parts by segment number; drop a head group whose first parts slid out
+        groups: dict[int, list] = {}
+        for seq, duration, uri in parts:
+            groups.setdefault(seq // self.parts_per_segment, []).append((seq, duration, uri))
+        first_msn = min(groups)
+        if groups[first_msn][0][0] % self.parts_per_segment and len(groups) > 1:
+            del groups[first_msn]
+
+        msns = sorted(groups)
+        last_msn = msns[-1]
+        referenced = set()
+        lines = []
+        target = self.part_target * self.parts_per_segment
+        for msn in msns:
+            group = groups[msn]
+            complete = msn < last_msn or len(group) == self.parts_per_segment
+            if msn >= last_msn - PART_SEGMENTS:
+                for seq, duration, uri in group:
+                    lines.append(f'#EXT-X-PART:DURATION={duration:.3f},URI="{uri}",INDEPENDENT=YES')
+                    referenced.add(uri)
+            if complete:
+                seg_name = f'seg{msn}.ts'
+                if self.store.get(seg_name) is None:
+                    data = b''.join(self.store.get(uri).body for _, _, uri in group)
+                    self.store.put_locked(seg_name, Entry(
+                        data, 'video/mp2t', self.store.segment_cache, make_etag(data)))
+                seg_duration = sum(d for _, d, _ in group)
+                target = max(target, seg_duration)
+                lines += [f'#EXTINF:{seg_duration:.3f},', seg_name]
+                referenced.add(seg_name)
+                referenced.update(uri for _, _, uri in group)
+
+        self.msn = last_msn
+        self.parts = len(groups[last_msn])
+        if self.parts >= self.parts_per_segment:
+            self.msn, self.parts = last_msn + 1, 0
+        last_seq, _, last_uri = parts[-1]
+        self.next_part = _PART_NAME_RE.sub(f'part{last_seq + 1}.ts', last_uri) \
+            if _PART_NAME_RE.search(last_uri) else None
+        if self.next_part:
+            lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{self.next_part}"')
+
+        # ffmpeg cuts on keyframes, so a part can run a frame or two over the target
+        part_target = max(self.part_target, max(d for _, d, _ in parts))
+        header = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:9',
+            f'#EXT-X-TARGETDURATION:{math.ceil(target)}',
+            f'#EXT-X-PART-INF:PART-TARGET={part_target:.3f}',
+            f'#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={part_target * 3:.3f}',
+            f'#EXT-X-MEDIA-SEQUENCE:{msns[0]}',
+        ]
+        text = ('\n'.join(header + lines) + '\n').encode()
+        # blocking reloads make the URL unique per request; the bare URL must never go stale
+        self.store.put_locked(self.playlist, Entry(text, PLAYLIST_TYPE, 'no-cache', make_etag(text)), referenced)
@@ -0,0 +1,213 @@
+"""
+Bulk M3U/M3U8 playlist importer.
+
+The playlist is parsed as a stream and staged into a temporary table with
+``executemany`` in fixed-size batches, so Python memory stays flat
+regardless of playlist size. The merge into ``channels`` is then a handful
+of set-based statements inside one transaction. Channels are matched on
+``url``; an existing row keeps its id and its ``Favorites`` flag.
+
+Anything without an ``#EXTM3U`` header (an empty body, a provider's HTML
+error page) is rejected, and a prune is refused when the playlist yielded
+no entries, so a bad download can't empty the channel table.
+
+Usage:
+    python m3u_import.py playlist.m3u [--db channels.db] [--prune]
+    python m3u_import.py https://provider.example/get.php?... --prune
+"""
+import argparse
+import io
+import re
+import sqlite3
+import time
+import urllib.request
+from typing import Iterable, Iterator, NamedTuple
+
+import channel_db
+
+DEFAULT_BATCH_SIZE = 5000
+
+_ATTR_RE = re.compile(r'([A-Za-z0-9_-]+)="([^"]*)"')
+_EXTINF_RE = re.compile(r'#EXTINF:([^,"]*(?:"[^"]*"[^,"]*)*),(.*)')
+_URL_RE = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://\S+')
+
+
+class PlaylistError(ValueError):
+    pass
+
+
+class PlaylistEntry(NamedTuple):
+    name: str
+    url: str
+    group: str | None = None
+    tvg_id: str | None = None
+
+
+class ImportResult(NamedTuple):
+    parsed: int
+    inserted: int
+    updated: int
+    removed: int
+    seconds: float
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+# ─────────────── Parsing ───────────────
+def _split_extinf(info: str) -> tuple[dict, str]:
+    """Split '#EXTINF:-1 tvg-id="x" group-title="y",Name' into (attrs, name)."""
+    # the title starts at the first comma that is not inside a quoted attribute
+    m = _EXTINF_RE.match(info)
+    if m:
+        return dict(_ATTR_RE.findall(m.group(1))), m.group(2).strip()
+    head, _, title = info.partition(",")
+    return dict(_ATTR_RE.findall(head)), title.strip()
+
+
+def parse_m3u(lines: Iterable[str]) -> Iterator[PlaylistEntry]:
+    """
+    Yield one PlaylistEntry per stream URL; never holds more than one entry.
+    PlaylistError if the first line isn't the ``#EXTM3U`` header.
+    """
+    attrs: dict = {}
+    title = None
+    group = None
+    header = False
+    for raw in lines:
+        line = raw.strip().lstrip("\ufeff")
+        if not line:
+            continue
+        if not header:
+            if not line.startswith("#EXTM3U"):
+                raise PlaylistError("Not an M3U playlist (no #EXTM3U header)")
+            header = True
+        elif line.startswith("#EXTINF:"):
+            attrs, title = _split_extinf(line)
+            group = None
+        elif line.startswith("#EXTGRP:"):
+            group = line[len("#EXTGRP:"):].strip() or None
+        elif line.startswith("#") or not _URL_RE.fullmatch(line):
+            continue
+        else:
+            name = title or attrs.get("tvg-name") or line
+            yield PlaylistEntry(
+                name=name,
+                url=line,
+                group=attrs.get("group-title") or group or None,
+                tvg_id=attrs.get("tvg-id") or None,
+            )
+            attrs, title, group = {}, None, None
+
+
+def open_playlist(source: str, timeout: float = 30.0) -> Iterator[str]:
+    """Line iterator over a local file or an http(s) URL, decoded as UTF-8."""
+    if source.startswith(("http://", "https://")):
+        req = urllib.request.Request(source, headers={"User-Agent": "vlc-website-importer"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            yield from io.TextIOWrapper(resp, encoding="utf-8", errors="replace")
+    else:
+        with open(source, encoding="utf-8", errors="replace") as fh:
+            yield from fh
+
+
+# ─────────────── Import ───────────────
+def _batches(entries: Iterable[PlaylistEntry], size: int) -> Iterator[list[tuple]]:
+    batch = []
+    for e in entries:
+        batch.append((e.url, e.name, e.group or channel_db.derive_category(e.name), e.tvg_id))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_entries(conn: sqlite3.Connection, entries: Iterable[PlaylistEntry], prune: bool = False,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> ImportResult:
+    """
+    Merge ``entries`` into ``channels``. With ``prune`` set, channels whose
+    URL is not in the playlist are deleted; PlaylistError if there were none.
+    """
+    started = time.monotonic()
+    channel_db.ensure_schema(conn)
+    conn.execute("DROP TABLE IF EXISTS temp.import_staging")
+    conn.execute(
+        "CREATE TEMP TABLE import_staging (url TEXT PRIMARY KEY, name TEXT NOT NULL, "
+        "category TEXT, tvg_id TEXT)"
+    )
+
+    parsed = 0
+    for batch in _batches(entries, batch_size):
+        # a URL listed twice keeps its last entry
+        conn.executemany("INSERT OR REPLACE INTO import_staging VALUES (?, ?, ?, ?)", batch)
+        parsed += len(batch)
+    conn.commit()
+
+    try:
+        if prune and parsed == 0:
+            raise PlaylistError("Playlist has no entries; refusing to prune every channel")
+        conn.execute("BEGIN IMMEDIATE")
+        updated = conn.execute("""
+            UPDATE channels SET name = s.name, category = s.category, tvg_id = s.tvg_id
+            FROM import_staging AS s
+            WHERE channels.url = s.url
+              AND (channels.name IS NOT s.name OR channels.category IS NOT s.category
+                   OR channels.tvg_id IS NOT s.tvg_id)
+        """).rowcount
+        inserted = conn.execute("""
+            INSERT INTO channels (name, url, category, tvg_id)
+            SELECT s.name, s.url, s.category, s.tvg_id FROM import_staging AS s
+            WHERE NOT EXISTS (SELECT 1 FROM channels c WHERE c.url = s.url)
+        """).rowcount
+        removed = 0
+        if prune:
+            removed = conn.execute("""
+                DELETE FROM channels
+                WHERE NOT EXISTS (SELECT 1 FROM import_staging s WHERE s.url = channels.url)
+            """).rowcount
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.import_staging")
+
+    return ImportResult(parsed, inserted, updated, removed, round(time.monotonic() - started, 3))
+
+
+def connect_for_import(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    # stage on disk, not in RAM: keeps memory flat for very large playlists
+    conn.execute("PRAGMA temp_store=FILE")
+    return conn
+
+
+def import_playlist(db_path: str, source: str, prune: bool = False,
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> ImportResult:
+    conn = connect_for_import(db_path)
+    try:
+        return import_entries(conn, parse_m3u(open_playlist(source)), prune=prune, batch_size=batch_size)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import an M3U/M3U8 playlist into channels.db")
+    parser.add_argument("source", help="playlist file path or http(s) URL")
+    parser.add_argument("--db", default="channels.db", help="channels database (default: channels.db)")
+    parser.add_argument("--prune", action="store_true", help="delete channels that are not in the playlist")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    result = import_playlist(args.db, args.source, prune=args.prune, batch_size=args.batch_size)
+    print(f"✅ Imported {result.parsed} entries in {result.seconds}s: "
+          f"{result.inserted} inserted, {result.updated} updated, {result.removed} removed")
+    return result
+
+
+if __name__ == "__main__":
+    main()
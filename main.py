@@ -1,19 +1,32 @@
 from fastapi import FastAPI, Request, Form, Depends, Body
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from session_middleware_patch import PatchedSessionMiddleware
+from channel_catalog import ChannelCatalog, etag_matches, cache_headers
+from channel_repo import ChannelRepository, AsyncChannelRepository
+import channel_db
+import m3u_import
+from channel_prober import ChannelProber
+from warm_pool import WarmPool
+from switchable_track import SwitchableTrack
+from peer_manager import PeerLimitError, PeerManager
+from bandwidth_policy import BandwidthPolicy, BitrateLimits, sdp_bitrate_hints
+from presence import Presence
+from user_cache import Identity, UserCache
+from webrtc_fanout import ENCODE_ONCE_MODES, FanoutSource, h264_preferences, is_keyframe
+import ffmpeg_tools
+import hls_pipeline
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from itsdangerous import URLSafeTimedSerializer
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os, sqlite3, asyncio, socketio
-from aiortc import RTCPeerConnection, RTCSessionDescription
+import os, asyncio, contextlib, socketio
+from aiortc import RTCPeerConnection, RTCRtpSender, RTCSessionDescription
 from aiortc.contrib.media import MediaPlayer, MediaRelay
-import time
-from collections import defaultdict
+from aiortc.rtcp import RTCP_PSFB_APP, RtcpPsfbPacket, unpack_remb_fci
 
 # ─────────────── App / Auth setup ───────────────
 SECRET_KEY = "super-secret"
@@ -21,8 +34,35 @@ RESET_SECRET = "reset-secret"
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 serializer = URLSafeTimedSerializer(RESET_SECRET)
 
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
-fastapi_app = FastAPI()
+# Comma-separated emails allowed to call /api/admin/* (main.py has no roles table)
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# Engine.IO's own ping/pong is the presence heartbeat: a tab that goes away
+# without closing its socket is disconnected after ping_interval + ping_timeout
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', ping_interval=20, ping_timeout=20)
+
+# Long-running loops started at startup; the event loop only keeps weak
+# references to tasks, so they are held here until shutdown cancels them
+background_tasks: set[asyncio.Task] = set()
+
+def start_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    start_background_loops()
+    try:
+        yield
+    finally:
+        tasks = list(background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+fastapi_app = FastAPI(lifespan=lifespan)
 fastapi_app.add_middleware(PatchedSessionMiddleware, secret_key=SECRET_KEY)
 asgi_app = socketio.ASGIApp(sio, fastapi_app)
 
@@ -36,79 +76,10 @@ templates = Jinja2Templates(directory="templates")
 Base = declarative_base()
 engine = create_engine("sqlite:///./users.db", connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine)
-online_users = set()
 
-online_last_seen: dict[str, float] = {}
 sid_to_username: dict[str, str] = {}
-username_conn_counts = defaultdict(int)
-
-# --- put this helper anywhere near the top of main.py ---
-def _sdp_force_high_bitrate(sdp: str, max_kbps: int = 10000) -> str:
-    """
-    Munges SDP to request high video bitrate:
-      - inserts b=AS / b=TIAS in the video m-section
-      - adds x-google-{start,min,max}-bitrate for VP8/VP9 payload types
-    Returns a new SDP string.
-    """
-    lines = sdp.splitlines()
-    out = []
-    in_video = False
-    injected_b_line = False
-    vp8_pt = None
-    vp9_pt = None
-
-    # First pass: copy lines, remember VP8/VP9 payload types, and inject b= lines in video section
-    for i, line in enumerate(lines):
-        if line.startswith("m="):
-            in_video = line.startswith("m=video")
-            injected_b_line = False
-            out.append(line)
-            continue
-
-        if in_video and (line.startswith("c=") and not injected_b_line):
-            # Insert bitrate lines immediately after the connection line
-            out.append(line)
-            out.append(f"b=AS:{max_kbps}")
-            out.append(f"b=TIAS:{max_kbps * 1000}")
-            injected_b_line = True
-            continue
-
-        if line.startswith("a=rtpmap:"):
-            # a=rtpmap:<pt> <codec>/<clock>
-            try:
-                pt = line.split(":")[1].split()[0]
-            except Exception:
-                pt = None
-            if "VP8/90000" in line:
-                vp8_pt = pt
-            elif "VP9/90000" in line:
-                vp9_pt = pt
-
-        out.append(line)
-
-    # Second pass: if we saw VP8/VP9, append fmtp hints (ok to append at end)
-    def add_fmtp(pt):
-        if not pt:
-            return
-        # If there's an existing fmtp for this PT, append the x-google params; else add new fmtp
-        for idx, l in enumerate(out):
-            if l.startswith(f"a=fmtp:{pt} "):
-                if "x-google-max-bitrate" not in l:
-                    out[idx] = (
-                        f"{l};x-google-start-bitrate={max_kbps};"
-                        f"x-google-min-bitrate={max_kbps};x-google-max-bitrate={max_kbps}"
-                    )
-                return
-        out.append(
-            f"a=fmtp:{pt} x-google-start-bitrate={max_kbps};"
-            f"x-google-min-bitrate={max_kbps};x-google-max-bitrate={max_kbps}"
-        )
-
-    add_fmtp(vp8_pt)
-    add_fmtp(vp9_pt)
-
-    return "\r\n".join(out) + "\r\n"
-
+HEARTBEAT_GRACE = 15                # seconds an /api/heartbeat keeps a socketless user online
+presence = Presence(HEARTBEAT_GRACE)
 
 class User(Base):
     __tablename__ = "users"
@@ -126,143 +97,427 @@ def get_db():
     finally:
         db.close()
 
+def load_identity(email: str) -> Identity | None:
+    # blocking; UserCache calls it from a worker thread on a miss
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        return Identity(user.id, user.username, user.email) if user else None
+    finally:
+        db.close()
+
+# Session email -> user, kept in memory so page loads, heartbeats and socket
+# connects don't each query users.db
+user_cache = UserCache(load_identity, ttl=float(os.environ.get("USER_CACHE_TTL", "60")))
+
+async def current_user(request: Request) -> Identity | None:
+    """FastAPI dependency: the signed-in user, resolved at most once per request."""
+    if not hasattr(request.state, "identity"):
+        email = request.session.get("user")
+        request.state.identity = await user_cache.aget(email) if email else None
+    return request.state.identity
+
+async def socket_user(environ) -> Identity | None:
+    """The signed-in user behind a Socket.IO connection (from its ASGI session)."""
+    scope = environ.get("asgi.scope")
+    session = scope.get("session") if scope else None
+    email = session.get("user") if session else None
+    return await user_cache.aget(email) if email else None
+
 # ─────────────── Channels DB (SQLite) ───────────────
 CHANNELS_DB_PATH = "channels.db"
+channel_repo = ChannelRepository(CHANNELS_DB_PATH)
+channels = AsyncChannelRepository(channel_repo)
 
-def get_channel_by_id(channel_id: int):
-    conn = sqlite3.connect(CHANNELS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM channels WHERE id = ?", (channel_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
-
-def mark_playing(channel_id: int | None):
-    conn = sqlite3.connect(CHANNELS_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE channels SET is_playing = 0")
-    if channel_id is not None:
-        cur.execute("UPDATE channels SET is_playing = 1 WHERE id = ?", (channel_id,))
-    conn.commit()
-    conn.close()
+async def get_channel_by_id(channel_id: int):
+    return await channels.get_channel_by_id(channel_id)
+
+async def mark_playing(channel_id: int | None):
+    await channels.set_playing(channel_id)
 
 def list_channels():
-    conn = sqlite3.connect(CHANNELS_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM channels ORDER BY name")
-    rows = [dict(r) for r in cur.fetchall()]
+    # catalog loader; always runs in a worker thread (see catalog_snapshot)
+    rows = channel_repo.list_channels()
     for ch in rows:
-        ch['Favorites'] = bool(ch.get('Favorites', 0))
         ch['is_playing'] = (ch['id'] == current_channel_id)
-    conn.close()
-    return rows
+    return channel_db.public_channels(rows)
+
+channel_catalog = ChannelCatalog(list_channels)
+channel_repo.on_write(channel_catalog.invalidate)
+
+# Seconds between full health sweeps of every channel URL; 0 disables the loop
+CHANNEL_PROBE_INTERVAL = float(os.environ.get("CHANNEL_PROBE_INTERVAL", "0"))
+# Also record codec and resolution of live channels, if ffprobe can be found
+CHANNEL_PROBE_FFPROBE = os.environ.get("CHANNEL_PROBE_FFPROBE", "1").lower() in ("1", "true", "yes")
+prober = ChannelProber(channel_repo, use_ffprobe=CHANNEL_PROBE_FFPROBE)
+
+async def catalog_snapshot(key=None, producer=None):
+    snap = channel_catalog.peek(key)
+    if snap is None:
+        snap = await asyncio.to_thread(channel_catalog.snapshot, key, producer)
+    return snap
+
+def catalog_response(request: Request, snap) -> Response:
+    headers = cache_headers(snap.etag)
+    if etag_matches(request.headers.get("if-none-match"), snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
 
 # ─────────────── WebRTC broadcaster state ───────────────
 relay = MediaRelay()
 player = None                 # shared MediaPlayer (current source)
+# what every peer is sent; retargeted to the current player's tracks on each switch
+video_track = SwitchableTrack("video")
+audio_track = SwitchableTrack("audio")
 current_channel_id = None
-peers: set[RTCPeerConnection] = set()
+# Caps on viewers, plus timeouts that close peers which never connect or went away
+peer_manager = PeerManager(
+    max_peers=int(os.environ.get("WEBRTC_MAX_PEERS", "50")),
+    max_per_user=int(os.environ.get("WEBRTC_MAX_PEERS_PER_USER", "3")),
+    negotiation_timeout=float(os.environ.get("WEBRTC_NEGOTIATION_TIMEOUT", "15")),
+    disconnect_grace=float(os.environ.get("WEBRTC_DISCONNECT_GRACE", "10")),
+    on_admit=lambda record: bandwidth.register(record.pc),
+    on_close=lambda record: bandwidth.forget(record.pc),
+)
+PEER_REAP_INTERVAL = 5
 player_lock = asyncio.Lock()
+pending_switch: asyncio.Task | None = None   # channel change still opening its source
+switch_generation = 0   # bumped by every play/stop; a switch that sees it move is stale
+
+# Seconds allowed for opening a source, and then for its first decoded frame
+PLAYER_OPEN_TIMEOUT = float(os.environ.get("PLAYER_OPEN_TIMEOUT", "15"))
+FIRST_FRAME_TIMEOUT = float(os.environ.get("FIRST_FRAME_TIMEOUT", "10"))
+
+def stop_player(p):
+    # MediaPlayer has no stop(); stopping its tracks closes the source. Joins
+    # the decode thread, so call it from a worker thread, not the event loop.
+    for track in (p.audio, p.video):
+        if track is not None:
+            try:
+                track.stop()
+            except Exception:
+                pass
+
+# Encode each channel's video once for every peer instead of once per peer:
+# off | auto (pass H.264 sources through, encode the rest once) | encode
+WEBRTC_ENCODE_ONCE = os.environ.get("WEBRTC_ENCODE_ONCE", "off")
+if WEBRTC_ENCODE_ONCE not in ENCODE_ONCE_MODES:
+    raise ValueError(f"WEBRTC_ENCODE_ONCE must be one of {', '.join(ENCODE_ONCE_MODES)}")
+WEBRTC_ENCODE_KBPS = int(os.environ.get("WEBRTC_ENCODE_KBPS", "6000"))
+SOURCE_PROBE_TIMEOUT = 5
+
+def make_player(channel: dict):
+    # blocking: opening connects and probes the source; call from a worker thread.
+    # aiortc MediaPlayer pulls RTSP/RTMP/HLS/HTTP using ffmpeg via PyAV
+    if WEBRTC_ENCODE_ONCE == "off":
+        return MediaPlayer(channel['url'])
+    passthrough = False
+    if WEBRTC_ENCODE_ONCE == "auto" and channel.get('stream_mode') != 'transcode':
+        source = ffmpeg_tools.probe_source(channel['url'], timeout=SOURCE_PROBE_TIMEOUT)
+        passthrough = hls_pipeline.choose_mode(channel.get('stream_mode'), source) == 'copy'
+    return FanoutSource(MediaPlayer(channel['url'], decode=not passthrough), passthrough, WEBRTC_ENCODE_KBPS)
+
+def open_warm_player(channel_id: int):
+    # runs in a worker thread (see warm_pool_loop)
+    channel = channel_repo.get_channel_by_id(channel_id)
+    return make_player(channel) if channel else None
+
+def player_alive(p) -> bool:
+    return all(track is None or track.readyState == "live" for track in (p.audio, p.video))
+
+# Optional warm pool: keep WARM_POOL_SIZE recently watched / favorite channels
+# opened so switching to them skips the connect + probe; 0 disables it. An idle
+# player's connection can go stale (servers drop it, tokens expire), so entries
+# are reopened after WARM_POOL_MAX_AGE seconds
+WARM_POOL_SIZE = int(os.environ.get("WARM_POOL_SIZE", "0"))
+WARM_POOL_INTERVAL = 30
+warm_pool = WarmPool(
+    WARM_POOL_SIZE,
+    open_source=open_warm_player,
+    close_source=lambda channel_id, p: stop_player(p),
+    max_load=float(os.environ.get("WARM_POOL_MAX_LOAD", "0.8")),
+    is_alive=player_alive,
+    max_age=float(os.environ.get("WARM_POOL_MAX_AGE", "300")),
+)
+
+# Per-viewer video bitrate: each peer's rate follows its RTCP feedback between
+# the floor and ceiling; a nonzero budget caps the server's total video egress
+bandwidth = BandwidthPolicy(
+    BitrateLimits(
+        floor_kbps=int(os.environ.get("WEBRTC_MIN_KBPS", "300")),
+        start_kbps=int(os.environ.get("WEBRTC_START_KBPS", "2500")),
+        ceiling_kbps=int(os.environ.get("WEBRTC_MAX_KBPS", "10000")),
+    ),
+    budget_kbps=int(os.environ.get("WEBRTC_EGRESS_BUDGET_KBPS", "0")),
+)
+BANDWIDTH_INTERVAL = 2.0
+
+def video_sender(pc):
+    for sender in pc.getSenders():
+        if sender.track is not None and sender.track.kind == "video":
+            return sender
+    return None
+
+# aiortc has no public hook for RTCP feedback or the encoder's rate, so the two
+# functions below use RTCRtpSender internals (checked against aiortc 1.5-1.9).
+# If a release drops them, bitrate control degrades to aiortc's own REMB handling.
+_missing_internals: set[str] = set()
+
+def _sender_internal(sender, name: str):
+    if hasattr(sender, name):
+        return getattr(sender, name)
+    if name not in _missing_internals:
+        _missing_internals.add(name)
+        print(f"aiortc's RTCRtpSender has no {name}; per-viewer bitrate control is limited")
+    return None
+
+def watch_remb(pc, sender):
+    # aiortc applies REMB straight to the encoder; note it for the policy, then
+    # hold the encoder to this peer's allocation. RTCP can still arrive after
+    # the peer is closed and forgotten, so the estimate is looked up each time
+    handle = _sender_internal(sender, "_handle_rtcp_packet")
+    if not callable(handle):
+        return
+
+    async def handle_rtcp_packet(packet):
+        estimate = bandwidth.estimate(pc)
+        if estimate is not None and isinstance(packet, RtcpPsfbPacket) and packet.fmt == RTCP_PSFB_APP:
+            try:
+                bitrate, _ = unpack_remb_fci(packet.fci)
+                estimate.update(remb_kbps=bitrate / 1000)
+            except ValueError:
+                pass
+        await handle(packet)
+        apply_bitrate(pc, sender)
+
+    sender._handle_rtcp_packet = handle_rtcp_packet
+
+def apply_bitrate(pc, sender):
+    kbps = bandwidth.allocations.get(pc)
+    if not kbps:
+        return
+    # per-peer encoders only; passed-through or shared packets are not re-encoded
+    encoder = _sender_internal(sender, "_RTCRtpSender__encoder")
+    if encoder is not None and hasattr(encoder, "target_bitrate"):
+        encoder.target_bitrate = kbps * 1000
+
+async def bandwidth_loop():
+    while True:
+        await asyncio.sleep(BANDWIDTH_INTERVAL)
+        try:
+            for pc in list(peer_manager.records):
+                stats = await pc.getStats()
+                estimate = bandwidth.estimate(pc)
+                if peer_manager.get(pc) is None or estimate is None:
+                    continue   # closed while its stats were gathered
+                for s in stats.values():
+                    if getattr(s, "type", None) == "remote-inbound-rtp" and getattr(s, "kind", None) == "video":
+                        rtt = s.roundTripTime
+                        estimate.update(
+                            loss=s.fractionLost / 256,   # aiortc passes RTCP's 8-bit fixed point through
+                            rtt_ms=rtt * 1000 if rtt is not None else None,
+                        )
+            bandwidth.allocate()
+            for pc in list(peer_manager.records):
+                sender = video_sender(pc)
+                if sender is not None:
+                    apply_bitrate(pc, sender)
+            if isinstance(player, FanoutSource):
+                player.set_bitrate(bandwidth.shared_target())
+        except Exception as e:
+            print(f"Bandwidth update failed: {e}")
+
+async def peer_reaper_loop():
+    while True:
+        await asyncio.sleep(PEER_REAP_INTERVAL)
+        try:
+            await peer_manager.reap()
+        except Exception as e:
+            print(f"Peer reaping failed: {e}")
+
+async def warm_pool_loop():
+    while True:
+        try:
+            favorites = await asyncio.to_thread(channel_repo.favorite_ids, WARM_POOL_SIZE)
+            await asyncio.to_thread(warm_pool.refresh, favorites, {current_channel_id})
+        except Exception as e:
+            print(f"Warm pool refresh failed: {e}")
+        await asyncio.sleep(WARM_POOL_INTERVAL)
 
-async def set_channel_from_id(channel_id: int):
+async def open_player(channel: dict):
+    """
+    Open a channel's player in a worker thread; PyAV connects and probes
+    the source while opening, which can take seconds. On timeout or
+    cancellation the player is closed as soon as the open finishes.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(None, make_player, channel)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), PLAYER_OPEN_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        future.add_done_callback(_discard_opened_player)
+        if isinstance(e, asyncio.TimeoutError):
+            raise ValueError(f"Timed out opening the channel after {PLAYER_OPEN_TIMEOUT:g}s") from None
+        raise
+
+def _discard_opened_player(future):
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        asyncio.get_running_loop().run_in_executor(None, stop_player, future.result())
+
+async def wait_first_frame(p):
+    """
+    Pull from the player until it yields something a viewer can start on
+    (passed-through video may begin mid-GOP). Pulling starts the player's
+    decode thread; the item is handed on to the switchable track.
+    """
+    track = p.video or p.audio
+    if track is None:
+        raise ValueError("Channel has no audio or video")
+
+    async def first():
+        while True:
+            item = await track.recv()
+            if is_keyframe(item):
+                return item
+
+    try:
+        return await asyncio.wait_for(first(), FIRST_FRAME_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ValueError(f"No frames from the channel after {FIRST_FRAME_TIMEOUT:g}s") from None
+
+async def set_channel_from_id(channel_id: int, generation: int):
     """
     Replace the shared MediaPlayer from the channel's URL.
-    Decodes once; all viewers subscribe via relay.
+    Decodes once; connected peers follow through the switchable tracks.
+
+    The new player is opened and run up to its first frame before the swap,
+    so viewers keep the old channel until the new one is actually playing;
+    a failed or cancelled switch leaves the old player untouched, and so
+    does one overtaken by a later play or stop (``generation``).
     """
-    global player, current_channel_id
-    channel = get_channel_by_id(channel_id)
+    channel = await get_channel_by_id(channel_id)
     if not channel:
         raise ValueError("Channel not found")
 
-    url = channel['url']
-
-    # stop old player if any
-    old = player
-    player = None
-    if old and hasattr(old, "stop"):
+    # a warm player has already connected and probed the source; if it went
+    # stale while idle, fall back to opening the channel afresh
+    # (off the loop: take() closes a stale entry, which joins its decode thread)
+    taking = asyncio.get_running_loop().run_in_executor(None, warm_pool.take, channel_id)
+    try:
+        new_player = await asyncio.shield(taking)
+    except asyncio.CancelledError:
+        taking.add_done_callback(_discard_opened_player)
+        raise
+    first = None
+    if new_player is not None:
         try:
-            old.stop()
-        except Exception:
-            pass
+            first = await wait_first_frame(new_player)
+        except Exception as e:
+            print(f"Warm player for channel {channel_id} failed, reopening: {e}")
+            await asyncio.shield(asyncio.to_thread(stop_player, new_player))
+            new_player = None
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(stop_player, new_player))
+            raise
+    if new_player is None:
+        new_player = await open_player(channel)
+        try:
+            first = await wait_first_frame(new_player)
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(stop_player, new_player))
+            raise
 
-    # aiortc MediaPlayer pulls RTSP/RTMP/HLS/HTTP using ffmpeg via PyAV
-    new_player = MediaPlayer(url)
+    # the swap and the old player's cleanup run to completion even if cancelled now
+    await asyncio.shield(_swap_player(channel, new_player, first, generation))
+
+async def _swap_player(channel: dict, new_player, first, generation: int):
+    global player, current_channel_id
+    channel_id = channel['id']
+    async with player_lock:
+        stale = generation != switch_generation
+        if not stale:
+            old = player
+            player = new_player
+            current_channel_id = channel_id
+            if new_player.video is not None:
+                video_track.retarget(new_player.video, first)
+                audio_track.retarget(new_player.audio)
+            else:
+                video_track.retarget(None)
+                audio_track.retarget(new_player.audio, first)
+    if stale:
+        # a stop or newer play arrived once this switch could no longer be cancelled
+        await asyncio.to_thread(stop_player, new_player)
+        return
+    warm_pool.note_played(channel_id)
+    await mark_playing(channel_id)
 
-    player = new_player
-    current_channel_id = channel_id
-    mark_playing(channel_id)
+    # connected peers follow the switch; sweep out dead ones and stalled negotiations
+    for pc, reason in peer_manager.expired():
+        await peer_manager.close(pc, reason)
 
     # notify clients
     await sio.emit('channel_changed', {'channel_id': channel_id, 'message': f"Started: {channel['name']}"})
+    # nothing reads the old player any more; a decoding player can't sit in the
+    # warm pool (its frames would pile up), so the pool re-opens it fresh later
+    if old is not None:
+        await asyncio.to_thread(stop_player, old)
 
 # ─────────────── Socket.IO events ───────────────
 @sio.event
 async def connect(sid, environ):
-    scope = environ.get("asgi.scope")
-    session = scope.get("session") if scope else None
-    if not session:
-        return
-    email = session.get("user")
-    if not email:
+    user = await socket_user(environ)
+    if not user:
         return
-
-    db = SessionLocal()
-    user = db.query(User).filter(User.email == email).first()
-    db.close()
-    if user:
-        username = user.username
-        online_users.add(username)
-        username_conn_counts[username] += 1
-        sid_to_username[sid] = username
-        online_last_seen[username] = time.time()
+    sid_to_username[sid] = user.username
+    if presence.connect(user.username):
+        await publish_presence()
 
     await sio.emit("status", {
         "is_streaming": current_channel_id is not None,
         "current_channel_id": current_channel_id
-    })
+    }, to=sid)
+    await sio.emit("presence", {"users": list(presence.snapshot())}, to=sid)
 
 @sio.event
 async def disconnect(sid):
     username = sid_to_username.pop(sid, None)
-    if not username:
-        return
-    cnt = username_conn_counts.get(username, 0) - 1
-    if cnt <= 0:
-        username_conn_counts.pop(username, None)
-        # do not immediately drop; let pruning remove if no more heartbeats
-        # (but you can also discard here if you prefer hard-drop)
-        online_users.discard(username)
-        online_last_seen.pop(username, None)
-    else:
-        username_conn_counts[username] = cnt
-        online_last_seen[username] = time.time()
+    if username and presence.disconnect(username):
+        await publish_presence()
+
+async def publish_presence():
+    """Broadcast who joined and left since the last broadcast; nothing if no one did."""
+    presence.expire()
+    joined, left = presence.drain_changes()
+    if joined or left:
+        await sio.emit("presence_diff", {"joined": joined, "left": left})
+
+async def presence_loop():
+    # socketless users (heartbeat only) drop out once their heartbeats stop
+    while True:
+        await asyncio.sleep(1)
+        try:
+            await publish_presence()
+        except Exception as e:
+            print(f"Presence update failed: {e}")
 
 # ─────────────── Routes / Pages ───────────────
 @fastapi_app.get("/", response_class=HTMLResponse)
-async def index(request: Request, db: Session = Depends(get_db)):
-    user_email = request.session.get("user")
-    user = db.query(User).filter(User.email == user_email).first() if user_email else None
+async def index(request: Request, user: Identity | None = Depends(current_user)):
     if not user:
         return RedirectResponse("/login")
-    now_playing = get_channel_by_id(current_channel_id) if current_channel_id else None
+    now_playing = await get_channel_by_id(current_channel_id) if current_channel_id else None
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user,
         "now_playing": now_playing
     })
 @fastapi_app.post("/api/heartbeat")
-async def api_heartbeat(request: Request, db: Session = Depends(get_db)):
-    user_email = request.session.get("user")
-    if not user_email:
-        return {"ok": False}
-    user = db.query(User).filter(User.email == user_email).first()
+async def api_heartbeat(user: Identity | None = Depends(current_user)):
     if not user:
         return {"ok": False}
-    username = user.username
-    online_users.add(username)
-    online_last_seen[username] = time.time()
+    if presence.touch(user.username):
+        await publish_presence()
     return {"ok": True}
 @fastapi_app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -274,97 +529,188 @@ async def login(request: Request, email: str = Form(...), password: str = Form(.
     if not user or not pwd_context.verify(password, user.hashed_password):
         return templates.TemplateResponse("security/login_user.html", {"request": request, "error": "Invalid credentials"})
     request.session["user"] = user.email
-    online_users.add(user.username)
+    user_cache.put(user.email, Identity(user.id, user.username, user.email))
+    if presence.touch(user.username):
+        await publish_presence()
     return RedirectResponse("/", status_code=302)
 
 @fastapi_app.get("/logout")
-async def logout(request: Request, db: Session = Depends(get_db)):
+async def logout(request: Request, user: Identity | None = Depends(current_user)):
     user_email = request.session.get("user")
     if user_email:
-        user = db.query(User).filter(User.email == user_email).first()
-        if user:
-            username = user.username
-            username_conn_counts.pop(username, None)
-            online_users.discard(username)
-            online_last_seen.pop(username, None)
+        user_cache.invalidate(user_email)
+        if user and presence.remove(user.username):
+            await publish_presence()
         request.session.clear()
     return RedirectResponse("/login")
 # ─────────────── REST APIs ───────────────
 @fastapi_app.get("/api/online_users")
 async def get_online_users():
-    now = time.time()
-    cutoff = now - 15  # allow 3×5s grace
-    # prune stale
-    for u, ts in list(online_last_seen.items()):
-        if ts < cutoff and username_conn_counts.get(u, 0) == 0:
-            online_last_seen.pop(u, None)
-            online_users.discard(u)
-    return sorted(list(online_users))
+    # the page gets this pushed ("presence" / "presence_diff"); kept for other clients
+    presence.expire()
+    return list(presence.snapshot())
 
 @fastapi_app.get("/api/channels")
-async def api_channels():
-    return list_channels()
+async def api_channels(request: Request):
+    if not channel_db.wants_page(request.query_params):
+        return catalog_response(request, await catalog_snapshot())
+    try:
+        filters = channel_db.parse_page_args(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    key = ("page",) + tuple(sorted(filters.items()))
+    return catalog_response(request, await catalog_snapshot(key, lambda: channel_repo.page_channels(**filters)))
+
+@fastapi_app.get("/api/channels/search")
+async def api_search_channels(request: Request):
+    try:
+        args = channel_db.parse_search_args(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    key = ("search",) + tuple(sorted(args.items()))
+    return catalog_response(request, await catalog_snapshot(key, lambda: channel_repo.search_channels(**args)))
+
+@fastapi_app.get("/api/categories")
+async def api_categories(request: Request):
+    return catalog_response(request, await catalog_snapshot("categories", channel_repo.list_categories))
 
 @fastapi_app.get("/api/status")
 async def api_status():
-    return {"is_streaming": current_channel_id is not None, "current_channel_id": current_channel_id}
+    return {"is_streaming": current_channel_id is not None, "current_channel_id": current_channel_id,
+            "warm_pool": warm_pool.status(), "bandwidth": bandwidth.status(),
+            "peers": peer_manager.counts()}
+
+@fastapi_app.get("/api/admin/webrtc/peers")
+async def api_webrtc_peers(request: Request):
+    if (request.session.get("user") or "").lower() not in ADMIN_EMAILS:
+        return JSONResponse({"success": False, "message": "Admin only"}, status_code=403)
+    rows = []
+    for record in list(peer_manager.records.values()):
+        estimate = bandwidth.peers.get(record.pc)
+        rows.append({**record.as_dict(), "bandwidth": estimate.as_dict() if estimate else None})
+    return {"counts": peer_manager.counts(), "peers": rows}
 
 @fastapi_app.post("/api/play/{channel_id}")
 async def api_play(channel_id: int):
-    async with player_lock:
-        try:
-            await set_channel_from_id(channel_id)
-            return {"success": True, "message": "OK"}
-        except Exception as e:
-            return {"success": False, "message": str(e)}
+    global pending_switch, switch_generation
+    # a newer choice cancels a switch that is still opening its source
+    if pending_switch is not None and not pending_switch.done():
+        pending_switch.cancel()
+    switch_generation += 1
+    task = pending_switch = asyncio.create_task(set_channel_from_id(channel_id, switch_generation))
+    try:
+        await task
+        return {"success": True, "message": "OK"}
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        return {"success": False, "message": "Superseded by a newer channel change"}
+    except Exception as e:
+        return {"success": False, "message": str(e)}
 
 @fastapi_app.post("/api/stop")
 async def api_stop():
-    global player, current_channel_id
+    global player, current_channel_id, switch_generation
+    if pending_switch is not None and not pending_switch.done():
+        pending_switch.cancel()
     async with player_lock:
+        switch_generation += 1
         old = player
         player = None
         current_channel_id = None
-        mark_playing(None)
-        if old and hasattr(old, "stop"):
-            try:
-                old.stop()
-            except Exception:
-                pass
+        video_track.retarget(None)
+        audio_track.retarget(None)
+    await mark_playing(None)
+    await peer_manager.close_all("stopped")
+    if old is not None:
+        await asyncio.to_thread(stop_player, old)
     await sio.emit('stream_stopped')
     return {"success": True, "message": "Stopped"}
 
+@fastapi_app.post("/api/admin/import")
+async def api_import(request: Request, body: dict = Body(...)):
+    if (request.session.get("user") or "").lower() not in ADMIN_EMAILS:
+        return JSONResponse({"success": False, "message": "Admin only"}, status_code=403)
+    source = body.get("source")
+    if not source:
+        return JSONResponse({"success": False, "message": "source is required"}, status_code=400)
+    try:
+        result = await asyncio.to_thread(
+            m3u_import.import_playlist, CHANNELS_DB_PATH, source, bool(body.get("prune"))
+        )
+    except Exception as e:
+        return JSONResponse({"success": False, "message": f"Import failed: {e}"}, status_code=500)
+    channel_repo.reset_cached_state()
+    return {"success": True, **result.as_dict()}
+
+@fastapi_app.post("/api/admin/probe")
+async def api_probe(request: Request):
+    if (request.session.get("user") or "").lower() not in ADMIN_EMAILS:
+        return JSONResponse({"success": False, "message": "Admin only"}, status_code=403)
+    if not prober.running:
+        start_background(prober.run_once())
+    return JSONResponse({"success": True, "message": "Probe started", "last_run": prober.last_run}, status_code=202)
+
+def start_background_loops():
+    # called from lifespan() once the event loop is running
+    if CHANNEL_PROBE_INTERVAL > 0:
+        start_background(prober.run_forever(CHANNEL_PROBE_INTERVAL))
+    if warm_pool.enabled:
+        start_background(warm_pool_loop())
+    start_background(bandwidth_loop())
+    start_background(peer_reaper_loop())
+    start_background(presence_loop())
+
 # ─────────────── WebRTC signaling ───────────────
 @fastapi_app.post("/webrtc/offer")
-async def webrtc_offer(sdp: dict = Body(...)):
+async def webrtc_offer(request: Request, sdp: dict = Body(...)):
     if player is None:
         return JSONResponse({"error": "No active source"}, status_code=409)
 
+    # anonymous viewers are capped per address
+    user = request.session.get("user") or (f"anon:{request.client.host}" if request.client else None)
     pc = RTCPeerConnection()
-    peers.add(pc)
+    try:
+        peer_manager.admit(pc, user)
+    except PeerLimitError as e:
+        await pc.close()
+        return JSONResponse({"error": str(e)}, status_code=503)
 
     @pc.on("connectionstatechange")
     async def on_state_change():
-        if pc.connectionState in ("failed", "closed", "disconnected"):
-            await pc.close()
-            peers.discard(pc)
+        # "disconnected" may recover; the reaper closes it after a grace period
+        if peer_manager.state_changed(pc):
+            await peer_manager.close(pc, pc.connectionState)
 
+    try:
+        return await negotiate(pc, sdp)
+    except Exception as e:
+        await peer_manager.close(pc, "negotiation failed")
+        return JSONResponse({"error": f"Negotiation failed: {e}"}, status_code=400)
+
+async def negotiate(pc, sdp: dict) -> dict:
     # 1) Set remote offer
     offer = RTCSessionDescription(sdp["sdp"], sdp["type"])
     await pc.setRemoteDescription(offer)
 
-    # 2) Attach shared tracks via relay (single decode → multi fan-out)
-    v = player.video and relay.subscribe(player.video)
-    a = player.audio and relay.subscribe(player.audio)
-    if a:
-        pc.addTrack(a)
-    if v:
-        pc.addTrack(v)
-
-    # 3) Create answer, munge SDP to request max bitrate, then set it
+    # 2) Attach the stable tracks via relay (single decode → multi fan-out); both
+    #    kinds always, since a later channel may carry what this one lacks
+    pc.addTrack(relay.subscribe(audio_track))
+    sender = pc.addTrack(relay.subscribe(video_track))
+    if WEBRTC_ENCODE_ONCE != "off":
+        # peers are sent ready-made H.264, so that is the only codec they may pick
+        for t in pc.getTransceivers():
+            if t.sender is sender:
+                t.setCodecPreferences(h264_preferences(RTCRtpSender.getCapabilities("video")))
+        if hasattr(player, "request_keyframe"):
+            player.request_keyframe()   # so the new peer can start decoding right away
+
+    watch_remb(pc, sender)
+
+    # 3) Create answer, advertise the bitrate limits in its SDP, then set it
     answer = await pc.createAnswer()
-    munged = _sdp_force_high_bitrate(answer.sdp, max_kbps=10000)  # 10 Mbps; raise if you like
-    await pc.setLocalDescription(RTCSessionDescription(munged, answer.type))
+    hinted = sdp_bitrate_hints(answer.sdp, bandwidth.limits)
+    await pc.setLocalDescription(RTCSessionDescription(hinted, answer.type))
 
     return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
 
@@ -0,0 +1,151 @@
+"""
+Lifecycle of the WebRTC broadcaster's peer connections.
+
+Every offer is admitted against a server-wide cap and a per-user cap
+before an RTCPeerConnection is built for it. Peers that don't connect
+within ``negotiation_timeout`` (ICE + DTLS), that stay disconnected for
+longer than ``disconnect_grace``, or that fail or close are closed and
+forgotten by ``reap``. Closing a peer stops its senders, which ends its
+relay subscriptions and encoders, so a long-running server holds nothing
+for tabs that went away.
+
+Peers are duck-typed: anything with ``connectionState`` and an async
+``close()`` will do.
+"""
+import itertools
+import time
+from typing import Callable
+
+PENDING_STATES = ('new', 'connecting')
+DEAD_STATES = ('failed', 'closed')
+
+
+class PeerLimitError(RuntimeError):
+    pass
+
+
+class PeerRecord:
+    _ids = itertools.count(1)
+
+    def __init__(self, pc, user: str | None):
+        self.id = next(self._ids)
+        self.pc = pc
+        self.user = user
+        self.created_at = time.monotonic()
+        self.connected_at: float | None = None
+        self.disconnected_at: float | None = None
+        self.closed_reason: str | None = None
+
+    @property
+    def state(self) -> str:
+        return self.pc.connectionState
+
+    def as_dict(self) -> dict:
+        now = time.monotonic()
+        return {
+            'id': self.id,
+            'user': self.user,
+            'state': self.state,
+            'age_seconds': round(now - self.created_at, 1),
+            'connected_seconds': round(now - self.connected_at, 1) if self.connected_at else None,
+        }
+
+
+class PeerManager:
+    def __init__(self, max_peers: int = 50, max_per_user: int = 3, negotiation_timeout: float = 15,
+                 disconnect_grace: float = 10, on_admit: Callable[[PeerRecord], None] | None = None,
+                 on_close: Callable[[PeerRecord], None] | None = None):
+        self.max_peers = max_peers
+        self.max_per_user = max_per_user
+        self.negotiation_timeout = negotiation_timeout
+        self.disconnect_grace = disconnect_grace
+        self.on_admit = on_admit
+        self.on_close = on_close
+        self.records: dict[object, PeerRecord] = {}
+        self.closed_total = 0
+
+    def admit(self, pc, user: str | None) -> PeerRecord:
+        """Register ``pc`` for ``user``; PeerLimitError if a cap is reached."""
+        if len(self.records) >= self.max_peers:
+            raise PeerLimitError(f"Viewer limit reached ({self.max_peers})")
+        if user is not None and sum(r.user == user for r in self.records.values()) >= self.max_per_user:
+            raise PeerLimitError(f"Too many streams open for this user ({self.max_per_user})")
+        record = PeerRecord(pc, user)
+        self.records[pc] = record
+        if self.on_admit:
+            self.on_admit(record)
+        return record
+
+    def get(self, pc) -> PeerRecord | None:
+        return self.records.get(pc)
+
+    def state_changed(self, pc) -> bool:
+        """Note a connectionstatechange; True if the peer is dead and should be closed."""
+        record = self.records.get(pc)
+        if record is None:
+            return False
+        state = record.state
+        if state == 'connected':
+            record.connected_at = record.connected_at or time.monotonic()
+            record.disconnected_at = None
+        elif state == 'disconnected':
+            record.disconnected_at = record.disconnected_at or time.monotonic()
+        return state in DEAD_STATES
+
+    async def close(self, pc, reason: str) -> None:
+        record = self.records.pop(pc, None)
+        if record is None:
+            return
+        record.closed_reason = reason
+        self.closed_total += 1
+        try:
+            await pc.close()
+        except Exception as e:
+            print(f"Closing peer {record.id} failed: {e}")
+        if self.on_close:
+            self.on_close(record)
+
+    async def close_all(self, reason: str) -> int:
+        pcs = list(self.records)
+        for pc in pcs:
+            await self.close(pc, reason)
+        return len(pcs)
+
+    def expired(self) -> list[tuple[object, str]]:
+        """(pc, reason) for every peer that should be closed now."""
+        now = time.monotonic()
+        out = []
+        for pc, record in self.records.items():
+            state = record.state
+            if state in DEAD_STATES:
+                out.append((pc, state))
+            elif state in PENDING_STATES and now - record.created_at > self.negotiation_timeout:
+                out.append((pc, 'negotiation timeout'))
+            elif state == 'disconnected':
+                record.disconnected_at = record.disconnected_at or now
+                if now - record.disconnected_at > self.disconnect_grace:
+                    out.append((pc, 'disconnected'))
+        return out
+
+    async def reap(self) -> list[int]:
+        closed = []
+        for pc, reason in self.expired():
+            record = self.records.get(pc)
+            if record is not None:
+                closed.append(record.id)
+                await self.close(pc, reason)
+        return closed
+
+    def counts(self) -> dict:
+        states = [r.state for r in self.records.values()]
+        return {
+            'total': len(states),
+            'connected': states.count('connected'),
+            'pending': sum(s in PENDING_STATES for s in states),
+            'users': len({r.user for r in self.records.values() if r.user is not None}),
+            'max_peers': self.max_peers,
+            'closed_total': self.closed_total,
+        }
+
+    def status(self) -> list[dict]:
+        return [r.as_dict() for r in self.records.values()]
@@ -0,0 +1,132 @@
+"""
+Who is online, shared by both backends.
+
+A user is online while they hold at least one open socket, or until
+``timeout`` seconds after their last ``touch`` (an HTTP request or
+heartbeat). Deadlines live in a dict, so ``touch`` is O(1). A min-heap
+holds at most one entry per user; ``expire`` pops due entries and
+re-queues users whose deadline moved on since, so each expiry costs
+amortized O(log n) and nothing ever scans the whole table. The sorted
+member list is cached and rebuilt only after membership changes, and
+joins/leaves are collected for ``drain_changes`` so callers can broadcast
+diffs instead of full lists.
+"""
+import heapq
+import threading
+import time
+from typing import Callable
+
+
+class Presence:
+    def __init__(self, timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._deadlines: dict[str, float] = {}   # every online user; connected ones never expire
+        self._connections: dict[str, int] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._queued: set[str] = set()           # users with an entry in the heap
+        self._changes: dict[str, bool] = {}      # user -> joined (True) / left (False) since the last drain
+        self._snapshot: tuple[str, ...] | None = ()
+
+    def touch(self, user: str) -> bool:
+        """Mark ``user`` active now; True if they just came online."""
+        with self.lock:
+            joined = user not in self._deadlines
+            self._deadlines[user] = self.clock() + self.timeout
+            if user not in self._queued:
+                self._queued.add(user)
+                heapq.heappush(self._heap, (self._deadlines[user], user))
+            if joined:
+                self._changed_locked(user, True)
+            return joined
+
+    def connect(self, user: str) -> bool:
+        """Count an open socket for ``user``; True if they just came online."""
+        with self.lock:
+            self._connections[user] = self._connections.get(user, 0) + 1
+        return self.touch(user)
+
+    def disconnect(self, user: str) -> bool:
+        """Drop one socket; the last one takes ``user`` offline (True) at once."""
+        with self.lock:
+            count = self._connections.get(user, 0) - 1
+            if count > 0:
+                self._connections[user] = count
+                return False
+            self._connections.pop(user, None)
+            return self._remove_locked(user)
+
+    def remove(self, user: str) -> bool:
+        """Take ``user`` offline regardless of sockets (e.g. on logout)."""
+        with self.lock:
+            self._connections.pop(user, None)
+            return self._remove_locked(user)
+
+    def expire(self) -> list[str]:
+        """Drop users whose deadline passed and who hold no socket; returns them."""
+        now = self.clock()
+        gone = []
+        with self.lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, user = heapq.heappop(self._heap)
+                deadline = self._deadlines.get(user)
+                if deadline is None:
+                    self._queued.discard(user)
+                elif deadline > now:
+                    # touched since it was queued: look again at the new deadline
+                    heapq.heappush(self._heap, (deadline, user))
+                elif user in self._connections:
+                    # held open by a socket: look again a timeout from now
+                    heapq.heappush(self._heap, (now + self.timeout, user))
+                else:
+                    self._queued.discard(user)
+                    self._remove_locked(user)
+                    gone.append(user)
+        return gone
+
+    def snapshot(self) -> tuple[str, ...]:
+        """Sorted online users; the same tuple until membership changes."""
+        with self.lock:
+            if self._snapshot is None:
+                self._snapshot = tuple(sorted(self._deadlines))
+            return self._snapshot
+
+    def drain_changes(self) -> tuple[list[str], list[str]]:
+        """(joined, left) since the previous call, netted out."""
+        with self.lock:
+            changes, self._changes = self._changes, {}
+        joined = sorted(u for u, j in changes.items() if j)
+        left = sorted(u for u, j in changes.items() if not j)
+        return joined, left
+
+    def clear(self) -> None:
+        with self.lock:
+            self._deadlines.clear()
+            self._connections.clear()
+            self._heap.clear()
+            self._queued.clear()
+            self._changes.clear()
+            self._snapshot = ()
+
+    def __contains__(self, user: str) -> bool:
+        return user in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    # ─────────────── internals ───────────────
+
+    def _remove_locked(self, user: str) -> bool:
+        # its heap entry, if any, is dropped lazily by expire()
+        if self._deadlines.pop(user, None) is None:
+            return False
+        self._changed_locked(user, False)
+        return True
+
+    def _changed_locked(self, user: str, joined: bool) -> None:
+        self._snapshot = None
+        if self._changes.get(user) == (not joined):
+            del self._changes[user]   # left and came back (or the reverse) between drains
+        else:
+            self._changes[user] = joined
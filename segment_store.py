@@ -0,0 +1,184 @@
+"""
+In-memory live window for one channel's HLS output.
+
+A watcher thread polls the channel directory for playlist changes. When
+ffmpeg rewrites a playlist, every segment it lists is read from disk
+once and kept in memory, then the playlist itself is published. Viewers
+are served from memory with cache headers suited to each kind of file:
+segments are immutable (names never repeat), playlists live for a second.
+Segments that drop out of every playlist are kept for a short grace
+window for slow clients, then evicted.
+"""
+import collections
+import os
+import posixpath
+import re
+import threading
+import zlib
+from typing import NamedTuple
+
+PLAYLIST_TYPE = 'application/vnd.apple.mpegurl'
+CONTENT_TYPES = {'.ts': 'video/mp2t', '.m4s': 'video/iso.segment', '.mp4': 'video/mp4', '.aac': 'audio/aac'}
+
+_URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+
+
+class Entry(NamedTuple):
+    body: bytes
+    content_type: str
+    cache_control: str
+    etag: str
+
+
+def playlist_uris(text: str) -> list[str]:
+    """Every URI a playlist points at: plain lines plus URI="..." attributes."""
+    uris = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            uris.extend(_URI_ATTR_RE.findall(line))
+        else:
+            uris.append(line)
+    return uris
+
+
+class SegmentStore:
+    def __init__(self, directory: str, keep: int = 8, poll_interval: float = 0.1,
+                 segment_max_age: int = 60, playlist_max_age: int = 1):
+        self.directory = directory
+        self.keep = keep
+        self.poll_interval = poll_interval
+        self.segment_cache = f'public, max-age={segment_max_age}, immutable'
+        self.playlist_cache = f'public, max-age={playlist_max_age}'
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.entries: dict[str, Entry] = {}
+        self._mtimes: dict[str, int] = {}
+        self._referenced: dict[str, set] = {}
+        self._segments = collections.deque()   # segment names, oldest first
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> 'SegmentStore':
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        with self.changed:
+            self.entries.clear()
+            self._segments.clear()
+            self.changed.notify_all()
+
+    def get(self, name: str) -> Entry | None:
+        return self.entries.get(name)
+
+    def add_listener(self, callback) -> None:
+        """
+        ``callback(name, body)`` runs after each playlist is published, with
+        the store lock held, so it can derive entries via ``put_locked``.
+        """
+        self._listeners.append(callback)
+
+    def put_locked(self, name: str, entry: Entry, referenced=None) -> None:
+        """
+        Add a derived entry (lock held). With ``referenced`` it is a playlist
+        whose listed names stay live; otherwise it is an evictable segment.
+        """
+        if referenced is not None:
+            self._referenced[name] = set(referenced)
+        elif name not in self.entries:
+            self._segments.append(name)
+        self.entries[name] = entry
+
+    def wait_for(self, predicate, timeout: float) -> bool:
+        """Block until ``predicate()`` holds (checked on every publish) or ``timeout`` passes."""
+        with self.changed:
+            return self.changed.wait_for(lambda: predicate() or self._stop.is_set(), timeout) \
+                and not self._stop.is_set()
+
+    def refresh(self) -> int:
+        """Pick up rewritten playlists and their segments; returns how many playlists changed."""
+        published = 0
+        for name, path in self._playlist_files():
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if self._mtimes.get(name) == mtime:
+                    continue
+                with open(path, 'rb') as fh:
+                    body = fh.read()
+            except OSError:
+                continue
+            if not body.startswith(b'#EXTM3U'):
+                continue   # caught mid-write; try again on the next poll
+            if self._publish(name, body):
+                self._mtimes[name] = mtime
+                published += 1
+        return published
+
+    # ─────────────── internals ───────────────
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Segment store for {self.directory} failed to refresh: {e}")
+
+    def _playlist_files(self):
+        for dirpath, _, files in os.walk(self.directory):
+            for f in files:
+                if f.endswith('.m3u8'):
+                    path = os.path.join(dirpath, f)
+                    yield os.path.relpath(path, self.directory).replace(os.sep, '/'), path
+
+    def _publish(self, name: str, body: bytes) -> bool:
+        base = posixpath.dirname(name)
+        referenced = set()
+        loaded = {}
+        for uri in playlist_uris(body.decode('utf-8', errors='replace')):
+            if '://' in uri or uri.startswith('/'):
+                continue
+            seg = posixpath.normpath(posixpath.join(base, uri.split('?')[0]))
+            if seg.endswith('.m3u8') or seg.startswith('..'):
+                continue
+            referenced.add(seg)
+            if seg in self.entries:
+                continue
+            try:
+                with open(os.path.join(self.directory, seg), 'rb') as fh:
+                    data = fh.read()
+            except FileNotFoundError:
+                # not written yet (e.g. a preload hint); a later rewrite will list it again
+                continue
+            except OSError:
+                return False
+            content_type = CONTENT_TYPES.get(posixpath.splitext(seg)[1], 'application/octet-stream')
+            loaded[seg] = Entry(data, content_type, self.segment_cache, make_etag(data))
+
+        with self.changed:
+            for seg, entry in loaded.items():
+                self.entries[seg] = entry
+                self._segments.append(seg)
+            self.entries[name] = Entry(body, PLAYLIST_TYPE, self.playlist_cache, make_etag(body))
+            self._referenced[name] = referenced
+            for callback in self._listeners:
+                callback(name, body)
+            self._evict_locked()
+            self.changed.notify_all()
+        return True
+
+    def _evict_locked(self) -> None:
+        live = set().union(*self._referenced.values())
+        stale = [s for s in self._segments if s not in live]
+        for seg in stale[:max(0, len(stale) - self.keep)]:
+            self._segments.remove(seg)
+            self.entries.pop(seg, None)
+
+
+def make_etag(data: bytes) -> str:
+    return f'"{len(data):x}-{zlib.crc32(data):08x}"'
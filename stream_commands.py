@@ -0,0 +1,133 @@
+"""
+Serialized play/stop command queue for the HLS streamer.
+
+Request threads only enqueue a job and return its id; a single worker
+thread runs jobs one at a time, so starting, stopping and switching
+channels never race each other. A new command from a viewer supersedes
+that viewer's commands still waiting in the queue, so rapid zapping only
+runs the last choice. Job progress is reported through ``on_update``.
+"""
+import collections
+import threading
+import time
+import uuid
+from typing import Callable
+
+
+class Job:
+    def __init__(self, kind: str, viewer, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.viewer = viewer
+        self.params = params
+        self.state = 'queued'      # queued -> running -> done | failed; or superseded
+        self.message: str | None = None
+        self.result: dict = {}
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('done', 'failed', 'superseded')
+
+    def as_dict(self) -> dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'viewer': self.viewer,
+            'state': self.state,
+            'message': self.message,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            **self.params,
+            **self.result,
+        }
+
+
+class CommandQueue:
+    def __init__(self, handlers: dict[str, Callable[[Job], tuple[bool, str, dict]]],
+                 on_update: Callable[[Job], None] | None = None, history: int = 200):
+        """
+        ``handlers`` map a job kind to ``handler(job) -> (success, message, result)``.
+        The last ``history`` jobs stay queryable through ``get``.
+        """
+        self.handlers = handlers
+        self.on_update = on_update
+        self.history = history
+        self.lock = threading.Lock()
+        self.pending = threading.Condition(self.lock)
+        self._queue = collections.deque()
+        self._jobs: collections.OrderedDict[str, Job] = collections.OrderedDict()
+        self._worker: threading.Thread | None = None
+
+    def submit(self, kind: str, viewer=None, **params) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown command: {kind}")
+        job = Job(kind, viewer, params)
+        superseded = []
+        with self.pending:
+            if viewer is not None:
+                superseded = [j for j in self._queue if j.viewer == viewer]
+                for old in superseded:
+                    self._queue.remove(old)
+                    self._finish_locked(old, 'superseded', 'Replaced by a newer command')
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.finished:
+                    break
+                self._jobs.popitem(last=False)
+            self._queue.append(job)
+            self._ensure_worker()
+            self.pending.notify()
+        for old in superseded:
+            self._report(old)
+        self._report(job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def wait(self, job: Job, timeout: float | None = None) -> bool:
+        """Block until ``job`` has finished; mainly for tests and scripts."""
+        with self.pending:
+            return self.pending.wait_for(lambda: job.finished, timeout)
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    # ─────────────── internals ───────────────
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            with self.pending:
+                self.pending.wait_for(lambda: self._queue)
+                job = self._queue.popleft()
+                job.state = 'running'
+            self._report(job)
+            try:
+                success, message, result = self.handlers[job.kind](job)
+            except Exception as e:
+                success, message, result = False, f"{job.kind} failed: {e}", {}
+            with self.pending:
+                job.result = result or {}
+                self._finish_locked(job, 'done' if success else 'failed', message)
+            self._report(job)
+
+    def _finish_locked(self, job: Job, state: str, message: str | None) -> None:
+        job.state = state
+        job.message = message
+        job.finished_at = time.time()
+        self.pending.notify_all()
+
+    def _report(self, job: Job) -> None:
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"Job update for {job.id} failed: {e}")
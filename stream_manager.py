@@ -0,0 +1,350 @@
+"""
+Per-channel ffmpeg processes for the HLS streamer.
+
+Every channel being watched gets its own ffmpeg process writing into
+``<root>/<channel_id>/``. Viewers join and leave channels; a channel keeps
+running while it is being fetched and is torn down once nobody has asked
+for its playlist or segments for ``idle_timeout`` seconds. At most
+``max_streams`` channels run at once; when full, the least recently used
+channel without viewers (warm ones included) makes room.
+
+A channel whose ffmpeg dies is restarted with exponential backoff (see
+stream_supervisor) and torn down only once the retries run out.
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, NamedTuple
+
+from stream_supervisor import Backoff, StreamHealth, supervise
+
+
+class StreamLimitError(RuntimeError):
+    """Every stream slot is taken by a channel that still has viewers."""
+
+
+class Launch(NamedTuple):
+    process: subprocess.Popen | None   # None if ffmpeg never got going
+    playlist: str                      # relative to the channel directory
+    mode: str
+    ready: bool                        # first segment written before launch returned
+
+
+class ChannelStream:
+    def __init__(self, channel_id: int, directory: str):
+        self.channel_id = channel_id
+        self.directory = directory
+        self.process: subprocess.Popen | None = None
+        self.playlist: str | None = None
+        self.mode: str | None = None
+        self.error: str | None = None
+        self.store = None                  # in-memory live window, see segment_store
+        self.low_latency = None            # ll_hls packager when mode == 'll'
+        self.health = StreamHealth()
+        self.launcher: Callable[[str], Launch] | None = None
+        self.stopped = threading.Event()
+        self.viewers: set = set()
+        self.pinned = False                # kept warm by the warm pool; exempt from idle reaping
+        self.started_at = time.time()
+        self.last_access = time.monotonic()
+        self.launched = threading.Event()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def touch(self) -> None:
+        self.last_access = time.monotonic()
+
+    def as_dict(self) -> dict:
+        return {
+            'channel_id': self.channel_id,
+            'playlist': f"/stream/{self.channel_id}/{self.playlist}" if self.playlist else None,
+            'mode': self.mode,
+            'viewers': len(self.viewers),
+            'pinned': self.pinned,
+            'alive': self.alive,
+            'started_at': self.started_at,
+            'idle_seconds': round(time.monotonic() - self.last_access, 1),
+            'health': self.health.as_dict(),
+        }
+
+
+def stop_process(process: subprocess.Popen | None, timeout: float = 3.0) -> None:
+    if process is None or process.poll() is not None:
+        return
+    try:
+        process.terminate()
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    except OSError:
+        pass
+
+
+class StreamManager:
+    def __init__(self, root: str, max_streams: int = 4, idle_timeout: float = 60.0,
+                 start_timeout: float = 30.0, reap_interval: float = 5.0,
+                 on_change: Callable[[], None] | None = None,
+                 on_exit: Callable[[ChannelStream, int | None, set[str]], None] | None = None,
+                 on_health: Callable[[ChannelStream], None] | None = None,
+                 store_factory: Callable[[ChannelStream], object] | None = None,
+                 max_restarts: int = 6, restart_delay: float = 1.0, max_restart_delay: float = 30.0):
+        self.root = root
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+        self.reap_interval = reap_interval
+        self.on_change = on_change
+        self.on_exit = on_exit
+        self.on_health = on_health
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.store_factory = store_factory
+        self.lock = threading.Lock()
+        self.streams: dict[int, ChannelStream] = {}
+        self.viewing: dict = {}   # viewer -> channel id
+        self._reaper: threading.Thread | None = None
+        os.makedirs(root, exist_ok=True)
+
+    def directory(self, channel_id: int) -> str:
+        return os.path.join(self.root, str(int(channel_id)))
+
+    def get(self, channel_id: int) -> ChannelStream | None:
+        return self.streams.get(channel_id)
+
+    def viewer_channel(self, viewer) -> int | None:
+        return self.viewing.get(viewer)
+
+    def join(self, channel_id: int, viewer, launch: Callable[[str], Launch]) -> ChannelStream:
+        """
+        Put ``viewer`` on ``channel_id`` (leaving whatever it watched before),
+        starting the channel through ``launch(directory)`` unless it is
+        already running. Raises StreamLimitError when every slot is busy.
+        """
+        evicted = []
+        with self.lock:
+            self._ensure_reaper()
+            self._leave_locked(viewer)
+            stream = self.streams.get(channel_id)
+            if stream is not None and stream.launched.is_set() and not stream.alive:
+                evicted.append(self.streams.pop(channel_id))
+                stream = None
+            owner = stream is None
+            if owner:
+                if len(self.streams) >= self.max_streams:
+                    idle = self._evict_candidate_locked()
+                    if idle is None:
+                        raise StreamLimitError(f"All {self.max_streams} stream slots are in use")
+                    evicted.append(self.streams.pop(idle.channel_id))
+                stream = ChannelStream(channel_id, self.directory(channel_id))
+                self.streams[channel_id] = stream
+            stream.viewers.add(viewer)
+            self.viewing[viewer] = channel_id
+            stream.touch()
+
+        for old in evicted:
+            self._teardown(old)
+        if owner:
+            self._launch(stream, launch)
+        else:
+            stream.launched.wait(self.start_timeout)
+        return stream
+
+    def warm(self, channel_id: int, launch: Callable[[str], Launch]) -> ChannelStream | None:
+        """
+        Start ``channel_id`` with no viewers and pin it so it survives idling.
+        Only uses a free slot; returns None when full or if ffmpeg fails.
+        """
+        with self.lock:
+            self._ensure_reaper()
+            stream = self.streams.get(channel_id)
+            if stream is not None:
+                stream.pinned = True
+                return stream
+            if len(self.streams) >= self.max_streams:
+                return None
+            stream = ChannelStream(channel_id, self.directory(channel_id))
+            stream.pinned = True
+            self.streams[channel_id] = stream
+        self._launch(stream, launch)
+        return stream if stream.process is not None else None
+
+    def unpin(self, channel_id: int) -> None:
+        """Let a warm channel idle out like any other (the idle clock starts now)."""
+        stream = self.streams.get(channel_id)
+        if stream is not None and stream.pinned:
+            stream.pinned = False
+            stream.touch()
+
+    def leave(self, viewer) -> int | None:
+        """Drop ``viewer``; its channel idles out unless someone else is fetching it."""
+        with self.lock:
+            return self._leave_locked(viewer)
+
+    def touch(self, channel_id: int) -> bool:
+        stream = self.streams.get(channel_id)
+        if stream is None:
+            return False
+        stream.touch()
+        return True
+
+    def stop(self, channel_id: int) -> bool:
+        with self.lock:
+            stream = self.streams.pop(channel_id, None)
+            if stream is not None:
+                self._forget_viewers_locked(stream)
+        if stream is None:
+            return False
+        self._teardown(stream)
+        self._changed()
+        return True
+
+    def stop_all(self) -> None:
+        for channel_id in list(self.streams):
+            self.stop(channel_id)
+
+    def reap(self) -> list[int]:
+        """Tear down channels nobody has fetched for ``idle_timeout``; returns their ids."""
+        now = time.monotonic()
+        with self.lock:
+            idle = [
+                s for s in self.streams.values()
+                if s.launched.is_set() and not s.pinned and now - s.last_access > self.idle_timeout
+            ]
+            for stream in idle:
+                del self.streams[stream.channel_id]
+                self._forget_viewers_locked(stream)
+        for stream in idle:
+            self._teardown(stream)
+        if idle:
+            self._changed()
+        return [s.channel_id for s in idle]
+
+    def status(self) -> list[dict]:
+        with self.lock:
+            streams = list(self.streams.values())
+        return [s.as_dict() for s in streams]
+
+    # ─────────────── internals ───────────────
+
+    def _leave_locked(self, viewer) -> int | None:
+        channel_id = self.viewing.pop(viewer, None)
+        stream = self.streams.get(channel_id)
+        if stream is not None:
+            stream.viewers.discard(viewer)
+        return channel_id
+
+    def _forget_viewers_locked(self, stream: ChannelStream) -> None:
+        for viewer in stream.viewers:
+            if self.viewing.get(viewer) == stream.channel_id:
+                del self.viewing[viewer]
+        stream.viewers.clear()
+
+    def _evict_candidate_locked(self) -> ChannelStream | None:
+        idle = [s for s in self.streams.values() if not s.viewers and s.launched.is_set()]
+        return min(idle, key=lambda s: s.last_access) if idle else None
+
+    def _launch(self, stream: ChannelStream, launch: Callable[[str], Launch]) -> None:
+        stream.launcher = launch
+        result = None
+        try:
+            shutil.rmtree(stream.directory, ignore_errors=True)
+            os.makedirs(stream.directory, exist_ok=True)
+            result = launch(stream.directory)
+        except Exception as e:
+            stream.error = str(e)
+        if result is not None:
+            stream.process, stream.playlist, stream.mode = result.process, result.playlist, result.mode
+        if stream.process is None:
+            stream.error = stream.error or "Stream failed to start"
+            with self.lock:
+                if self.streams.get(stream.channel_id) is stream:
+                    del self.streams[stream.channel_id]
+                    self._forget_viewers_locked(stream)
+            shutil.rmtree(stream.directory, ignore_errors=True)
+        else:
+            if self.store_factory:
+                stream.store = self.store_factory(stream)
+            threading.Thread(target=self._watch, args=(stream,), daemon=True).start()
+        stream.touch()
+        stream.launched.set()
+        self._changed()
+
+    def _watch(self, stream: ChannelStream) -> None:
+        """Supervise the channel's ffmpeg, restarting it with backoff until stopped or out of retries."""
+        backoff = Backoff(self.restart_delay, 2.0, self.max_restart_delay, self.max_restarts)
+        process = stream.process
+        while True:
+            returncode = supervise(process, stream.health, lambda: self._report(stream)) if process else None
+            if stream.stopped.is_set():
+                return
+            delay = backoff.failure(stream.health.uptime())
+            stream.health.exited(returncode, delay)
+            self._report(stream)
+            if delay is None or stream.stopped.wait(delay):
+                break
+            process = self._relaunch(stream)
+            if stream.stopped.is_set():
+                stop_process(process)
+                return
+
+        with self.lock:
+            unexpected = self.streams.get(stream.channel_id) is stream
+            if unexpected:
+                del self.streams[stream.channel_id]
+                viewers = set(stream.viewers)   # forgetting clears them; on_exit tells them why
+                self._forget_viewers_locked(stream)
+        if unexpected:
+            self._close_store(stream)
+            shutil.rmtree(stream.directory, ignore_errors=True)
+            if self.on_exit:
+                self.on_exit(stream, returncode, viewers)
+            self._changed()
+
+    def _relaunch(self, stream: ChannelStream) -> subprocess.Popen | None:
+        try:
+            result = stream.launcher(stream.directory)
+        except Exception as e:
+            stream.health.log(f"Restart failed: {e}")
+            return None
+        if result.process is not None:
+            stream.process, stream.playlist, stream.mode = result.process, result.playlist, result.mode
+            stream.health.restarts += 1
+        return result.process
+
+    def _report(self, stream: ChannelStream) -> None:
+        if self.on_health:
+            self.on_health(stream)
+
+    def _teardown(self, stream: ChannelStream) -> None:
+        stream.stopped.set()
+        stop_process(stream.process)
+        self._close_store(stream)
+        shutil.rmtree(stream.directory, ignore_errors=True)
+
+    @staticmethod
+    def _close_store(stream: ChannelStream) -> None:
+        if stream.store is not None:
+            stream.store.close()
+
+    def _changed(self) -> None:
+        if self.on_change:
+            self.on_change()
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"Stream reaper failed: {e}")
@@ -0,0 +1,178 @@
+"""
+Health telemetry and restart policy for supervised ffmpeg processes.
+
+ffmpeg runs with hls_pipeline.PROGRESS_ARGS: stdout carries key=value
+progress blocks (ending in ``progress=continue``) that are parsed as they
+arrive, and stderr carries warnings and errors, of which only the last few
+lines are kept. Nothing is buffered for the life of the process.
+"""
+import collections
+import re
+import threading
+import time
+
+_ERROR_RE = re.compile(r'error|failed|invalid|refused|timed out|not found|unable', re.IGNORECASE)
+
+
+def _number(value: str | None) -> float | None:
+    """'25.02' / '1234.5kbits/s' / '1.01x' / 'N/A' -> float or None."""
+    if not value:
+        return None
+    match = re.match(r'\s*(-?[\d.]+)', value)
+    return float(match.group(1)) if match else None
+
+
+class ProgressParser:
+    """Accumulates ``-progress`` lines; ``feed`` returns a block once it is complete."""
+
+    def __init__(self):
+        self._block = {}
+
+    def feed(self, line: str) -> dict | None:
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return None
+        if key != 'progress':
+            self._block[key] = value.strip()
+            return None
+        block, self._block = self._block, {}
+        block['progress'] = value.strip()
+        return block
+
+
+class StreamHealth:
+    def __init__(self, stderr_lines: int = 50):
+        self.state = 'starting'
+        self.fps: float | None = None
+        self.bitrate_kbps: float | None = None
+        self.speed: float | None = None
+        self.frame: int | None = None
+        self.drop_frames = 0
+        self.dup_frames = 0
+        self.out_time_s: float | None = None
+        self.last_error: str | None = None
+        self.last_exit_code: int | None = None
+        self.restarts = 0
+        self.retry_at: float | None = None
+        self.started_at = time.monotonic()
+        self.updated_at = time.time()
+        self.stderr = collections.deque(maxlen=stderr_lines)
+        self.lock = threading.Lock()
+
+    def started(self) -> None:
+        with self.lock:
+            self.state = 'running'
+            self.started_at = time.monotonic()
+            self.retry_at = None
+            self.updated_at = time.time()
+
+    def update(self, block: dict) -> None:
+        with self.lock:
+            self.state = 'running' if block.get('progress') == 'continue' else 'ended'
+            self.fps = _number(block.get('fps'))
+            self.bitrate_kbps = _number(block.get('bitrate'))
+            self.speed = _number(block.get('speed'))
+            frame = _number(block.get('frame'))
+            self.frame = int(frame) if frame is not None else None
+            self.drop_frames = int(_number(block.get('drop_frames')) or 0)
+            self.dup_frames = int(_number(block.get('dup_frames')) or 0)
+            out_time_us = _number(block.get('out_time_us') or block.get('out_time_ms'))
+            self.out_time_s = round(out_time_us / 1e6, 2) if out_time_us is not None else None
+            self.updated_at = time.time()
+
+    def log(self, line: str) -> None:
+        line = line.rstrip()
+        if not line:
+            return
+        with self.lock:
+            self.stderr.append(line)
+            if _ERROR_RE.search(line):
+                self.last_error = line
+
+    def exited(self, returncode: int | None, retry_in: float | None) -> None:
+        with self.lock:
+            self.last_exit_code = returncode
+            if self.last_error is None and self.stderr:
+                self.last_error = self.stderr[-1]
+            self.state = 'restarting' if retry_in is not None else 'failed'
+            self.retry_at = time.time() + retry_in if retry_in is not None else None
+            self.updated_at = time.time()
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                'state': self.state,
+                'fps': self.fps,
+                'bitrate_kbps': self.bitrate_kbps,
+                'speed': self.speed,
+                'frame': self.frame,
+                'drop_frames': self.drop_frames,
+                'dup_frames': self.dup_frames,
+                'out_time_s': self.out_time_s,
+                'last_error': self.last_error,
+                'last_exit_code': self.last_exit_code,
+                'restarts': self.restarts,
+                'retry_at': self.retry_at,
+                'updated_at': self.updated_at,
+            }
+
+
+class Backoff:
+    """
+    Exponential restart delays: base, base*factor, ... capped at max_delay.
+    After ``max_attempts`` consecutive failures it gives up (returns None);
+    a process that ran for ``reset_after`` seconds resets the count.
+    """
+
+    def __init__(self, base: float = 1.0, factor: float = 2.0, max_delay: float = 30.0,
+                 max_attempts: int = 6, reset_after: float = 60.0):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.reset_after = reset_after
+        self.attempts = 0
+
+    def failure(self, ran_for: float) -> float | None:
+        if ran_for >= self.reset_after:
+            self.attempts = 0
+        self.attempts += 1
+        if self.attempts > self.max_attempts:
+            return None
+        return min(self.max_delay, self.base * self.factor ** (self.attempts - 1))
+
+
+def _drain(stream, handle) -> None:
+    for raw in iter(stream.readline, b''):
+        handle(raw.decode('utf-8', errors='replace'))
+
+
+def supervise(process, health: StreamHealth, on_progress=None) -> int:
+    """
+    Follow ``process`` until it exits, feeding its progress and stderr into
+    ``health``; ``on_progress()`` runs after every progress block.
+    """
+    health.started()
+    readers = []
+    if process.stderr is not None:
+        reader = threading.Thread(target=_drain, args=(process.stderr, health.log), daemon=True)
+        reader.start()
+        readers.append(reader)
+    if process.stdout is not None:
+        parser = ProgressParser()
+
+        def handle(line):
+            block = parser.feed(line)
+            if block is not None:
+                health.update(block)
+                if on_progress:
+                    on_progress()
+
+        _drain(process.stdout, handle)
+    returncode = process.wait()
+    for reader in readers:
+        reader.join(timeout=1)
+    return returncode
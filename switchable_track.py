@@ -0,0 +1,93 @@
+"""
+Stable outgoing tracks for the WebRTC broadcaster.
+
+Every peer subscribes (through MediaRelay) to one SwitchableTrack per
+kind for the life of its connection. Changing channels only retargets the
+track's upstream to the new player's track, so connected peers switch
+without renegotiating. Timestamps are rebased onto one continuous
+timeline, so the encoder and the browser's jitter buffer see a steady
+stream rather than a jump back to the new source's zero.
+"""
+import asyncio
+from fractions import Fraction
+
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+# Assumed spacing between frames before two have been seen (seconds)
+DEFAULT_STEP = Fraction(1, 50)
+
+
+class SwitchableTrack(MediaStreamTrack):
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+        self.source: MediaStreamTrack | None = None
+        self.switches = 0
+        self._changed = asyncio.Event()
+        self._first = None                     # already-pulled item to send before reading ``source``
+        self._offset: Fraction | None = None   # added to source time; None until a source frame is seen
+        self._last: Fraction | None = None     # output time of the last frame
+        self._step = DEFAULT_STEP
+
+    def retarget(self, source: MediaStreamTrack | None, first=None) -> None:
+        """
+        Read from ``source`` from the next frame on; None pauses the track.
+        ``first`` is a frame or packet already pulled from ``source`` (e.g. the
+        keyframe a switch waited for) to send ahead of it.
+        """
+        if source is self.source:
+            return
+        self.source = source
+        self._first = first
+        self.switches += 1
+        self._offset = None
+        self._changed.set()
+
+    async def recv(self):
+        while True:
+            if self.readyState != "live":
+                raise MediaStreamError
+            source = self.source
+            if source is None:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            if self._first is not None:
+                frame, self._first = self._first, None
+                return self._rebase(frame)
+
+            self._changed.clear()
+            frame_task = asyncio.ensure_future(source.recv())
+            changed_task = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait({frame_task, changed_task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed_task.cancel()
+            if not frame_task.done() or self.source is not source:
+                # retargeted while waiting; whatever the old source yields is dropped
+                frame_task.cancel()
+                continue
+            try:
+                frame = frame_task.result()
+            except MediaStreamError:
+                # the source ended (player stopped or failed); wait for the next channel
+                if self.source is source:
+                    self.retarget(None)
+                continue
+            return self._rebase(frame)
+
+    # ─────────────── internals ───────────────
+
+    def _rebase(self, frame):
+        if frame.pts is None or frame.time_base is None:
+            return frame
+        source_time = frame.pts * frame.time_base
+        if self._offset is None:
+            start = self._last + self._step if self._last is not None else source_time
+            self._offset = start - source_time
+        when = source_time + self._offset
+        if self._last is not None and when > self._last:
+            self._step = when - self._last
+        self._last = when
+        frame.pts = int(when / frame.time_base)
+        return frame
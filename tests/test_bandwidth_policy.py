@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from bandwidth_policy import BandwidthPolicy, BitrateLimits, PeerEstimate, sdp_bitrate_hints
+
+LIMITS = BitrateLimits(floor_kbps=300, start_kbps=2000, ceiling_kbps=8000)
+
+SDP = "\r\n".join([
+    "v=0",
+    "m=audio 9 UDP/TLS/RTP/SAVPF 111",
+    "c=IN IP4 0.0.0.0",
+    "a=rtpmap:111 opus/48000/2",
+    "m=video 9 UDP/TLS/RTP/SAVPF 96 102",
+    "c=IN IP4 0.0.0.0",
+    "a=rtpmap:96 VP8/90000",
+    "a=rtpmap:102 H264/90000",
+    "a=fmtp:102 packetization-mode=1",
+]) + "\r\n"
+
+
+def test_sdp_hints_leave_room_between_floor_and_ceiling():
+    out = sdp_bitrate_hints(SDP, LIMITS).split("\r\n")
+    video = out[out.index("m=video 9 UDP/TLS/RTP/SAVPF 96 102"):]
+    assert "b=AS:8000" in video and "b=AS:8000" not in out[:out.index(video[0])]
+    hints = "x-google-start-bitrate=2000;x-google-min-bitrate=300;x-google-max-bitrate=8000"
+    assert f"a=fmtp:102 packetization-mode=1;{hints}" in out
+    assert f"a=fmtp:96 {hints}" in out
+    assert not any(line.startswith("a=fmtp:111") for line in out)
+
+
+def test_estimate_follows_loss_and_remb():
+    e = PeerEstimate(LIMITS)
+    assert e.update(loss=0.0) == 2100
+    assert e.update(loss=0.2) == 1890
+    assert e.update(loss=0.05) == 1890
+    assert e.update(remb_kbps=1000) == 1000
+    for _ in range(100):
+        e.update(loss=0.5)
+    assert int(e.kbps) == LIMITS.floor_kbps
+
+
+def test_budget_is_shared_max_min_fairly():
+    policy = BandwidthPolicy(LIMITS, budget_kbps=5000)
+    for peer, kbps in (("a", 500), ("b", 4000), ("c", 4000)):
+        policy.register(peer).kbps = kbps
+    assert policy.allocate() == {"a": 500, "b": 2250, "c": 2250}
+    assert policy.status()["allocated_kbps"] == 5000
+
+    policy.forget("c")
+    assert policy.allocate() == {"a": 500, "b": 4000}
+    assert policy.shared_target() == 500
+
+
+def test_floors_hold_when_the_budget_is_too_small():
+    policy = BandwidthPolicy(LIMITS, budget_kbps=500)
+    for peer in ("a", "b", "c"):
+        policy.register(peer)
+    assert set(policy.allocate().values()) == {300}
+
+
+def test_forgotten_peers_get_no_estimate():
+    policy = BandwidthPolicy(LIMITS)
+    assert policy.estimate("a") is None and policy.allocate() == {}
+    policy.register("a")
+    policy.forget("a")
+    assert policy.estimate("a") is None and policy.allocate() == {}
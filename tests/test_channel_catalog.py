@@ -0,0 +1,56 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from channel_catalog import ChannelCatalog, etag_matches
+
+
+def test_snapshot_is_cached_until_invalidated():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return [{"id": 1, "name": "BBC One"}]
+
+    catalog = ChannelCatalog(loader)
+    first = catalog.snapshot()
+    second = catalog.snapshot()
+    assert first is second
+    assert len(calls) == 1
+    assert first.body == b'[{"id":1,"name":"BBC One"}]'
+
+    catalog.invalidate()
+    third = catalog.snapshot()
+    assert len(calls) == 2
+    assert third.version == first.version + 1
+    # same content -> same strong ETag
+    assert third.etag == first.etag
+
+
+def test_etag_changes_with_content():
+    data = [{"id": 1, "Favorites": False}]
+    catalog = ChannelCatalog(lambda: data)
+    before = catalog.snapshot().etag
+    data[0]["Favorites"] = True
+    catalog.invalidate()
+    assert catalog.snapshot().etag != before
+
+
+def test_write_during_build_is_not_cached():
+    catalog = ChannelCatalog(lambda: [])
+
+    def racing_loader():
+        catalog.invalidate()
+        return ["stale"]
+
+    catalog.snapshot(producer=racing_loader)
+    assert catalog.snapshot().body == b"[]"
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
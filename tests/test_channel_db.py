@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import channel_db
+
+
+def make_db(names, favorites=()):
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        'CREATE TABLE channels ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, '
+        '"url" TEXT NOT NULL, "Favorites" INTEGER NOT NULL DEFAULT 0, "is_playing" INTEGER)'
+    )
+    for name in names:
+        conn.execute(
+            "INSERT INTO channels (name, url, Favorites) VALUES (?, ?, ?)",
+            (name, f"http://upstream/{name}", int(name in favorites)),
+        )
+    conn.commit()
+    channel_db.ensure_schema(conn)
+    return conn
+
+
+def test_keyset_pagination_walks_every_row_once():
+    names = [f"Channel {i:03d}" for i in range(25)]
+    conn = make_db(names)
+    seen, cursor = [], None
+    while True:
+        page = channel_db.page_channels(conn, limit=10, cursor=cursor)
+        seen += [c["name"] for c in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == sorted(names)
+
+
+def test_filters_and_projection():
+    conn = make_db(["Sky Sports 1", "Sky News", "BBC One", "Skyline TV"], favorites=("Sky News",))
+
+    page = channel_db.page_channels(conn, category="Sky", fields=("name",))
+    assert page["items"] == [{"name": "Sky News"}, {"name": "Sky Sports 1"}]
+
+    page = channel_db.page_channels(conn, q="sky", favorites_only=True)
+    assert [c["name"] for c in page["items"]] == ["Sky News"]
+    assert page["items"][0]["Favorites"] is True
+    assert "url" not in page["items"][0]
+
+
+def test_public_channels_hide_server_only_columns():
+    conn = make_db(["Sky News"], favorites=("Sky News",))
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute("SELECT * FROM channels")]
+    assert "url" in rows[0] and "stream_mode" in rows[0]
+
+    (channel,) = channel_db.public_channels(rows)
+    assert tuple(channel) == channel_db.PUBLIC_FIELDS
+    assert channel["name"] == "Sky News" and channel["Favorites"] is True
+
+
+def test_like_wildcards_are_literal():
+    conn = make_db(["100% Hits", "100 Hits"])
+    page = channel_db.page_channels(conn, q="100%")
+    assert [c["name"] for c in page["items"]] == ["100% Hits"]
+
+
+def test_parse_page_args():
+    args = channel_db.parse_page_args({"limit": "5000", "favorites_only": "true", "fields": "id, name"})
+    assert args["limit"] == channel_db.MAX_PAGE_SIZE
+    assert args["favorites_only"] is True
+    assert args["fields"] == ("id", "name")
+
+    with pytest.raises(ValueError):
+        channel_db.parse_page_args({"fields": "url"})
+    with pytest.raises(ValueError):
+        channel_db.parse_page_args({"cursor": "not-a-cursor"})
+    with pytest.raises(ValueError):
+        channel_db.parse_page_args({"limit": "0"})
+
+
+def test_search_is_ranked_prefix_and_follows_writes():
+    conn = make_db(["Sky Sports 1", "Sky News", "BBC One", "Discovery Sky"])
+    assert channel_db.fts_query("sky spo") == '"sky" "spo"*'
+
+    result = channel_db.search_channels(conn, "sky spo", fields=("name",))
+    assert result["items"] == [{"name": "Sky Sports 1"}]
+
+    result = channel_db.search_channels(conn, "sky", category="Sky", fields=("name",))
+    assert sorted(c["name"] for c in result["items"]) == ["Sky News", "Sky Sports 1"]
+
+    # triggers keep the index in sync with inserts, renames and deletes
+    conn.execute("INSERT INTO channels (name, url) VALUES ('Skyfall Movies', 'u')")
+    conn.execute("UPDATE channels SET name = 'BBC Two' WHERE name = 'BBC One'")
+    conn.execute("DELETE FROM channels WHERE name = 'Sky News'")
+    names = {c["name"] for c in channel_db.search_channels(conn, "sky")["items"]}
+    assert names == {"Sky Sports 1", "Discovery Sky", "Skyfall Movies"}
+    assert channel_db.search_channels(conn, "two")["items"][0]["name"] == "BBC Two"
+    assert channel_db.search_channels(conn, "one")["items"] == []
+
+
+def test_category_column_is_derived_and_counted():
+    conn = make_db(["Sky Sports 1", "Sky News", "BBC One", "Dave"])
+    assert channel_db.derive_category("Sky Sports 1") == "Sky"
+    assert channel_db.derive_category("Dave") is None
+    assert channel_db.list_categories(conn) == [{"name": "BBC", "count": 1}, {"name": "Sky", "count": 2}]
+
+    # new rows and renames are categorised by the triggers...
+    conn.execute("INSERT INTO channels (name, url) VALUES ('BBC Two', 'u')")
+    conn.execute("UPDATE channels SET name = 'ITV 1' WHERE name = 'Sky News'")
+    # ...but an explicit category (e.g. an M3U group-title) survives a rename
+    conn.execute("INSERT INTO channels (name, url, category) VALUES ('Eurosport 1', 'u', 'Sports')")
+    conn.execute("UPDATE channels SET name = 'Eurosport One' WHERE name = 'Eurosport 1'")
+    assert channel_db.list_categories(conn) == [
+        {"name": "BBC", "count": 2}, {"name": "ITV", "count": 1},
+        {"name": "Sky", "count": 1}, {"name": "Sports", "count": 1},
+    ]
+    page = channel_db.page_channels(conn, category="Sports", fields=("name", "category"))
+    assert page["items"] == [{"name": "Eurosport One", "category": "Sports"}]
+
+
+def test_now_playing_lives_in_a_single_row():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        'CREATE TABLE channels ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, '
+        '"url" TEXT NOT NULL, "Favorites" INTEGER NOT NULL DEFAULT 0, "is_playing" INTEGER)'
+    )
+    conn.execute("INSERT INTO channels (name, url, is_playing) VALUES ('BBC One', 'u', 0), ('Sky News', 'u', 1)")
+    channel_db.ensure_schema(conn)
+
+    # migrated from the legacy column, which is then cleared
+    assert channel_db.get_now_playing_id(conn) == 2
+    assert conn.execute("SELECT COUNT(*) FROM channels WHERE is_playing").fetchone()[0] == 0
+
+    channel_db.set_now_playing(conn, 1)
+    channel_db.set_now_playing(conn, 1)
+    assert conn.execute("SELECT COUNT(*) FROM now_playing").fetchone()[0] == 1
+    items = channel_db.page_channels(conn, fields=("id", "is_playing"))["items"]
+    assert items == [{"id": 1, "is_playing": True}, {"id": 2, "is_playing": False}]
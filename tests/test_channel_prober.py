@@ -0,0 +1,101 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import channel_db
+from channel_prober import ChannelProber, probe_http
+from channel_repo import ChannelRepository
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/live.m3u8":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+            self.end_headers()
+            self.wfile.write(b"#EXTM3U\n")
+        elif self.path == "/moved":
+            self.send_response(302)
+            self.send_header("Location", "/live.m3u8")
+            self.end_headers()
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_probe_http(stub_server):
+    live = asyncio.run(probe_http(f"{stub_server}/live.m3u8"))
+    assert live.alive and live.status == 200 and live.ttfb_ms is not None
+
+    moved = asyncio.run(probe_http(f"{stub_server}/moved"))
+    assert moved.alive and moved.status == 200
+
+    missing = asyncio.run(probe_http(f"{stub_server}/nope"))
+    assert not missing.alive and missing.status == 404
+
+    refused = asyncio.run(probe_http(f"http://127.0.0.1:{closed_port()}/x", timeout=1))
+    assert not refused.alive and refused.error
+
+
+def test_prober_records_health_columns(stub_server, tmp_path):
+    db_path = str(tmp_path / "channels.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        'CREATE TABLE channels ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, '
+        '"url" TEXT NOT NULL, "Favorites" INTEGER NOT NULL DEFAULT 0, "is_playing" INTEGER)'
+    )
+    conn.executemany("INSERT INTO channels (name, url) VALUES (?, ?)", [
+        ("Live One", f"{stub_server}/live.m3u8"),
+        ("Dead One", f"{stub_server}/gone.ts"),
+        ("Live Two", f"{stub_server}/moved"),
+        ("RTMP One", "rtmp://example/live"),
+    ])
+    conn.commit()
+    conn.close()
+
+    repo = ChannelRepository(db_path)
+    prober = ChannelProber(repo, concurrency=2, timeout=2, batch_size=2)
+    summary = asyncio.run(prober.run_once())
+    assert (summary["checked"], summary["alive"], summary["dead"]) == (3, 2, 1)
+
+    alive = repo.page_channels(alive=True, fields=("name", "alive"))["items"]
+    assert alive == [{"name": "Live One", "alive": True}, {"name": "Live Two", "alive": True}]
+
+    fastest = repo.page_channels(sort="ttfb", limit=1, fields=("name", "ttfb_ms"))
+    assert fastest["items"][0]["ttfb_ms"] is not None
+    rest = repo.page_channels(sort="ttfb", cursor=fastest["next_cursor"], fields=("name",))
+    # the rtmp channel was never probed, so it has no ttfb and is left out
+    assert len(rest["items"]) == 2 and rest["next_cursor"] is None
+
+    unprobed = repo.page_channels(q="rtmp", fields=("alive", "last_checked"))["items"]
+    assert unprobed == [{"alive": None, "last_checked": None}]
+
+    with pytest.raises(ValueError):
+        channel_db.parse_page_args({"sort": "name", "cursor": fastest["next_cursor"]})
+    repo.close()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from channel_repo import AsyncChannelRepository, ChannelRepository, ConnectionPool
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "channels.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE channels ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, '
+        '"url" TEXT NOT NULL, "Favorites" INTEGER NOT NULL DEFAULT 0, "is_playing" INTEGER)'
+    )
+    conn.executemany("INSERT INTO channels (name, url) VALUES (?, ?)",
+                     [("Sky News", "http://a"), ("BBC One", "http://b")])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_pool_reuses_wal_connections(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    with pool.connection() as first:
+        assert first.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert first.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    with pool.connection() as again:
+        assert again is first
+    pool.close()
+
+
+def test_pool_is_bounded(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+    pool.close()
+
+
+def test_repository_reads_writes_and_notifies(db_path):
+    repo = ChannelRepository(db_path)
+    writes = []
+    repo.on_write(lambda: writes.append(1))
+
+    assert [c["name"] for c in repo.list_channels()] == ["BBC One", "Sky News"]
+    sky = next(c for c in repo.list_channels() if c["name"] == "Sky News")
+    assert repo.get_channel_by_id(sky["id"])["url"] == "http://a"
+    assert repo.get_channel_by_id(999) is None
+    # schema migrations ran on first connect
+    assert repo.list_categories() == [{"name": "BBC", "count": 1}, {"name": "Sky", "count": 1}]
+
+    assert repo.toggle_favorite(sky["id"]) == 1
+    assert repo.toggle_favorite(999) is None
+    repo.set_playing(sky["id"])
+    assert len(writes) == 2
+    assert repo.get_channel_by_id(sky["id"])["is_playing"] == 1
+    assert repo.get_now_playing()["name"] == "Sky News"
+    repo.set_playing(None)
+    assert repo.get_now_playing() is None
+    assert not any(c["is_playing"] for c in repo.list_channels())
+
+    before = len(writes)
+    assert repo.set_stream_mode(sky["id"], "copy")
+    assert repo.get_channel_by_id(sky["id"])["stream_mode"] == "copy"
+    assert repo.set_stream_mode(sky["id"], "auto")
+    assert repo.get_channel_by_id(sky["id"])["stream_mode"] is None
+    assert not repo.set_stream_mode(999, "copy")
+    assert len(writes) == before + 2
+    repo.close()
+
+
+def test_async_facade(db_path):
+    repo = ChannelRepository(db_path)
+    channels = AsyncChannelRepository(repo)
+
+    async def run():
+        page = await channels.page_channels(limit=1, fields=("name",))
+        return page, await channels.search_channels(q="bbc")
+
+    page, found = asyncio.run(run())
+    assert page["items"] == [{"name": "BBC One"}]
+    assert found["items"][0]["name"] == "BBC One"
+    repo.close()
@@ -0,0 +1,49 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import ffmpeg_tools
+
+ENCODERS = """Encoders:
+ V..... = Video
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC
+ V....D h264_nvenc           NVIDIA NVENC H.264 encoder (codec h264)
+ A....D aac                  AAC (Advanced Audio Coding)
+"""
+
+
+class FakeProcess:
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+def test_parse_capabilities():
+    assert ffmpeg_tools._parse_encoders(ENCODERS) == {"libx264", "h264_nvenc", "aac"}
+    assert ffmpeg_tools._parse_hwaccels("Hardware acceleration methods:\ncuda\nvaapi\n\n") == ("cuda", "vaapi")
+
+
+def test_wait_for_playlist_returns_on_first_segment(tmp_path):
+    playlist = tmp_path / "stream.m3u8"
+    playlist.write_text("#EXTM3U\n")
+
+    def write_segment():
+        time.sleep(0.1)
+        playlist.write_text("#EXTM3U\n#EXTINF:1.0,\nstream0.ts\n")
+
+    threading.Thread(target=write_segment).start()
+    started = time.monotonic()
+    assert ffmpeg_tools.wait_for_playlist(str(playlist), FakeProcess(), timeout=5)
+    assert time.monotonic() - started < 2
+
+
+def test_wait_for_playlist_gives_up_when_process_exits(tmp_path):
+    missing = str(tmp_path / "missing.m3u8")
+    assert not ffmpeg_tools.wait_for_playlist(missing, FakeProcess(returncode=1), timeout=5)
+    assert not ffmpeg_tools.wait_for_playlist(missing, FakeProcess(), timeout=0.1)
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import hls_pipeline
+from ffmpeg_tools import SourceInfo, _parse_probe
+
+
+def test_parse_ladder():
+    ladder = hls_pipeline.parse_ladder("720:2800, 360:800:64 ,audio:48")
+    assert ladder == (
+        hls_pipeline.Rendition("720p", 720, 2800, 128),
+        hls_pipeline.Rendition("360p", 360, 800, 64),
+        hls_pipeline.Rendition("audio", None, 0, 48),
+    )
+    with pytest.raises(ValueError):
+        hls_pipeline.parse_ladder("audio:64")
+
+
+def test_abr_plan_maps_every_rendition():
+    plan = hls_pipeline.abr_plan("ffmpeg", "http://src/live.ts", "out")
+    cmd = plan.cmd
+    assert plan.playlist == "master.m3u8"
+    assert plan.ready_path == os.path.join("out", "master.m3u8")
+
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert graph.startswith("[0:v]split=3[v0][v1][v2];")
+    assert "[v1]scale=-2:'min(ih,720)'[v1out]" in graph
+
+    assert cmd[cmd.index("-var_stream_map") + 1] == (
+        "v:0,a:0,name:1080p v:1,a:1,name:720p v:2,a:2,name:480p a:3,name:audio"
+    )
+    assert cmd.count("0:a:0") == 4
+    assert cmd[cmd.index("-b:v:2") + 1] == "1200k"
+    assert cmd[-1] == os.path.join("out", "%v", "stream.m3u8")
+
+
+def test_abr_plan_skips_rungs_above_the_source():
+    plan = hls_pipeline.abr_plan("ffmpeg", "http://src/live.ts", "out", source_height=720)
+    graph = plan.cmd[plan.cmd.index("-filter_complex") + 1]
+    assert graph.startswith("[0:v]split=2[v0][v1];") and "1080" not in graph
+    assert plan.cmd[plan.cmd.index("-var_stream_map") + 1] == "v:0,a:0,name:720p v:1,a:1,name:480p a:2,name:audio"
+
+    # a source below every rung keeps just the lowest one
+    assert [r.name for r in hls_pipeline.fit_ladder(hls_pipeline.DEFAULT_LADDER, 288)] == ["480p", "audio"]
+
+
+def test_transcode_plan_is_single_rendition():
+    plan = hls_pipeline.transcode_plan("ffmpeg", "http://src/live.ts", "out")
+    assert plan.playlist == "stream.m3u8"
+    assert "-var_stream_map" not in plan.cmd
+    assert plan.cmd[-1] == plan.ready_path == os.path.join("out", "stream.m3u8")
+
+
+def test_choose_mode_copies_h264_unless_overridden():
+    probe = '{"streams": [{"codec_type": "audio", "codec_name": "mp2"}, ' \
+            '{"codec_type": "video", "codec_name": "h264", "width": 1280, "height": 720}]}'
+    h264 = _parse_probe(probe)
+    assert h264 == SourceInfo("h264", "mp2", 1280, 720)
+    hevc = SourceInfo("hevc", "aac")
+
+    assert hls_pipeline.choose_mode(None, h264) == "copy"
+    assert hls_pipeline.choose_mode("auto", hevc) == "transcode"
+    assert hls_pipeline.choose_mode(None, None) == "transcode"
+    assert hls_pipeline.choose_mode("transcode", h264) == "transcode"
+    assert hls_pipeline.choose_mode("copy", hevc) == "copy"
+
+
+def test_remux_plan_copies_video():
+    plan = hls_pipeline.remux_plan("ffmpeg", "http://src/live.ts", "out", copy_audio=False)
+    cmd = plan.cmd
+    assert cmd[cmd.index("-c:v") + 1] == "copy"
+    assert cmd[cmd.index("-c:a") + 1] == "aac"
+    assert "libx264" not in cmd and "-force_key_frames" not in cmd
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import ll_hls
+from segment_store import SegmentStore
+
+
+def write_parts(directory, first, count, stamp):
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:1", f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+    for seq in range(first, first + count):
+        path = os.path.join(directory, f"part{seq}.ts")
+        if not os.path.exists(path):
+            with open(path, "wb") as fh:
+                fh.write(b"P%d" % seq)
+        lines += ["#EXTINF:0.500000,", f"part{seq}.ts"]
+    path = os.path.join(directory, "parts.m3u8")
+    with open(path, "w") as fh:
+        fh.write("\n".join(lines) + "\n")
+    os.utime(path, ns=(stamp, stamp))
+
+
+@pytest.fixture
+def packaged(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    return str(tmp_path), store, ll_hls.LowLatencyPackager(store, part_target=0.5, parts_per_segment=4)
+
+
+def test_parts_are_grouped_into_segments(packaged):
+    directory, store, packager = packaged
+    # parts 10..15: part 10/11 belong to a segment whose head is gone
+    write_parts(directory, 10, 6, 1)
+    store.refresh()
+    text = store.get("stream.m3u8").body.decode()
+
+    assert "#EXT-X-MEDIA-SEQUENCE:3" in text
+    assert "#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK=1.500" in text
+    assert '#EXT-X-PART:DURATION=0.500,URI="part12.ts",INDEPENDENT=YES' in text
+    assert "#EXTINF:2.000,\nseg3.ts" in text
+    assert text.rstrip().endswith('#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part16.ts"')
+    assert store.get("seg3.ts").body == b"P12P13P14P15"
+    assert "part10.ts" not in text
+
+    # segment 3 is complete, segment 4 has no parts yet
+    assert packager.has(3, None) and not packager.has(4, 0)
+    assert (packager.msn, packager.parts) == (4, 0)
+    with pytest.raises(ValueError):
+        packager.wait(7, 0, timeout=0)
+
+
+def test_blocking_reload_wakes_on_new_part(packaged):
+    directory, store, packager = packaged
+    write_parts(directory, 12, 4, 1)
+    store.refresh()
+
+    def produce():
+        time.sleep(0.1)
+        write_parts(directory, 12, 5, 2)
+        store.refresh()
+
+    threading.Thread(target=produce).start()
+    assert not packager.has(4, 0)
+    assert packager.wait(4, 0, timeout=5)
+    assert 'URI="part16.ts"' in store.get("stream.m3u8").body.decode()
+    assert packager.next_part == "part17.ts"
+    assert not packager.wait_for_part("part17.ts", timeout=0.01)
+
+
+def test_parse_blocking_args():
+    assert ll_hls.parse_blocking_args({}) == (None, None)
+    assert ll_hls.parse_blocking_args({"_HLS_msn": "7", "_HLS_part": "2"}) == (7, 2)
+    with pytest.raises(ValueError):
+        ll_hls.parse_blocking_args({"_HLS_part": "1"})
+    with pytest.raises(ValueError):
+        ll_hls.parse_blocking_args({"_HLS_msn": "x"})
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import m3u_import
+
+PLAYLIST = """\ufeff#EXTM3U
+#EXTINF:-1 tvg-id="bbc1.uk" tvg-name="BBC One" group-title="UK, General",BBC One HD
+http://provider/bbc1.ts
+#EXTINF:-1,Sky News
+#EXTGRP:News
+http://provider/skynews.ts
+#EXTINF:-1 tvg-id="dave.uk",Dave
+http://provider/dave.ts
+"""
+
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE channels ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "name" TEXT NOT NULL, '
+        '"url" TEXT NOT NULL, "Favorites" INTEGER NOT NULL DEFAULT 0, "is_playing" INTEGER)'
+    )
+    conn.execute("INSERT INTO channels (name, url, Favorites) VALUES ('BBC 1', 'http://provider/bbc1.ts', 1)")
+    conn.execute("INSERT INTO channels (name, url) VALUES ('Gone TV', 'http://provider/gone.ts')")
+    conn.commit()
+    conn.close()
+
+
+def test_parse_m3u_reads_extinf_attributes():
+    entries = list(m3u_import.parse_m3u(PLAYLIST.splitlines()))
+    assert entries == [
+        m3u_import.PlaylistEntry("BBC One HD", "http://provider/bbc1.ts", "UK, General", "bbc1.uk"),
+        m3u_import.PlaylistEntry("Sky News", "http://provider/skynews.ts", "News", None),
+        m3u_import.PlaylistEntry("Dave", "http://provider/dave.ts", None, "dave.uk"),
+    ]
+
+
+def test_import_upserts_keeps_favorites_and_prunes(tmp_path):
+    db_path = str(tmp_path / "channels.db")
+    playlist = tmp_path / "playlist.m3u"
+    playlist.write_text(PLAYLIST, encoding="utf-8")
+    make_db(db_path)
+
+    result = m3u_import.import_playlist(db_path, str(playlist), prune=True, batch_size=2)
+    assert (result.parsed, result.inserted, result.updated, result.removed) == (3, 2, 1, 1)
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, name, category, tvg_id, Favorites FROM channels ORDER BY name").fetchall()
+    assert rows == [
+        (1, "BBC One HD", "UK, General", "bbc1.uk", 1),
+        (4, "Dave", None, "dave.uk", 0),
+        (3, "Sky News", "News", None, 0),
+    ]
+    conn.close()
+
+    # re-importing an unchanged playlist touches nothing
+    again = m3u_import.import_playlist(db_path, str(playlist), prune=True)
+    assert (again.inserted, again.updated, again.removed) == (0, 0, 0)
+
+
+def test_parse_m3u_requires_header_and_urls():
+    with pytest.raises(m3u_import.PlaylistError):
+        list(m3u_import.parse_m3u(["<html><body>Service unavailable</body></html>"]))
+    entries = list(m3u_import.parse_m3u(["#EXTM3U", "#EXTINF:-1,Junk", "not a url", "rtmp://host/live"]))
+    assert [e.url for e in entries] == ["rtmp://host/live"]
+
+
+def test_empty_playlist_never_prunes(tmp_path):
+    db_path = str(tmp_path / "channels.db")
+    make_db(db_path)
+    for body in ("", "#EXTM3U\n", "<html>502 Bad Gateway</html>\n"):
+        playlist = tmp_path / "playlist.m3u"
+        playlist.write_text(body, encoding="utf-8")
+        with pytest.raises(m3u_import.PlaylistError):
+            m3u_import.import_playlist(db_path, str(playlist), prune=True)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM channels").fetchone()[0] == 2
+    conn.close()
@@ -1,4 +1,3 @@
-from datetime import datetime, timedelta
 import os
 import sys
 import types
@@ -53,6 +52,7 @@ class DummySocketIO:
 
 flask_socketio.SocketIO = DummySocketIO
 flask_socketio.emit = _no_op
+flask_socketio.join_room = _no_op
 sys.modules["flask_socketio"] = flask_socketio
 
 flask_security = types.ModuleType("flask_security")
@@ -85,23 +85,46 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 import app
 
 
-def setup_module(module):
-    # ensure clean state before each module run
-    with app.online_users_lock:
-        app.online_users.clear()
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def setup_function(function):
+    # fresh tracker on a fake clock for every test
+    app.presence.clear()
+    app.presence.clock = Clock()
 
 
 def test_cleanup_removes_stale_users():
-    with app.online_users_lock:
-        app.online_users['old'] = datetime.utcnow() - app.ONLINE_TIMEOUT - timedelta(seconds=1)
+    app.presence.touch('old')
+    app.presence.clock.now += app.ONLINE_TIMEOUT + 1
     result = app.get_online_users()
     assert 'old' not in result
-    with app.online_users_lock:
-        assert 'old' not in app.online_users
+    assert 'old' not in app.presence
 
 
 def test_get_online_users_keeps_recent_entries():
-    with app.online_users_lock:
-        app.online_users['new'] = datetime.utcnow()
+    app.presence.touch('new')
     result = app.get_online_users()
     assert 'new' in result
+
+
+def test_socket_connections_keep_users_online():
+    app.presence.connect('viewer')
+    app.presence.clock.now += app.ONLINE_TIMEOUT * 5
+    assert app.get_online_users() == ['viewer']
+    assert app.presence.disconnect('viewer')
+    assert app.get_online_users() == []
+
+
+def test_failed_stream_notifies_each_viewer(monkeypatch):
+    sent = []
+    monkeypatch.setattr(app.socketio, 'emit', lambda event, data, to=None: sent.append((event, to)), raising=False)
+    health = types.SimpleNamespace(as_dict=lambda: {'restarts': 6, 'last_error': 'Connection refused'})
+    stream = types.SimpleNamespace(channel_id=7, health=health, viewers=set())
+    app.streamer._stream_exited(stream, 1, {'bob', 'alice'})
+    assert sent == [('stream_error', 'alice'), ('stream_error', 'bob')]
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from peer_manager import PeerLimitError, PeerManager
+
+
+class FakePC:
+    def __init__(self):
+        self.connectionState = "new"
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+        self.connectionState = "closed"
+
+
+def test_caps_are_enforced():
+    admitted = []
+    manager = PeerManager(max_peers=3, max_per_user=2, on_admit=lambda record: admitted.append(record.user))
+    manager.admit(FakePC(), "alice")
+    manager.admit(FakePC(), "alice")
+    with pytest.raises(PeerLimitError):
+        manager.admit(FakePC(), "alice")
+    manager.admit(FakePC(), "bob")
+    with pytest.raises(PeerLimitError):
+        manager.admit(FakePC(), "carol")
+    assert manager.counts()["total"] == 3 and manager.counts()["users"] == 2
+    assert admitted == ["alice", "alice", "bob"]
+
+
+def test_stalled_and_disconnected_peers_are_reaped():
+    closed = []
+    manager = PeerManager(negotiation_timeout=10, disconnect_grace=5,
+                          on_close=lambda record: closed.append(record.closed_reason))
+    stalled, gone, healthy = FakePC(), FakePC(), FakePC()
+    for pc in (stalled, gone, healthy):
+        manager.admit(pc, None)
+    manager.get(stalled).created_at -= 11
+
+    gone.connectionState = "disconnected"
+    assert not manager.state_changed(gone)
+    manager.get(gone).disconnected_at -= 6
+
+    healthy.connectionState = "connected"
+    manager.state_changed(healthy)
+
+    asyncio.run(manager.reap())
+    assert stalled.closed and gone.closed and not healthy.closed
+    assert sorted(closed) == ["disconnected", "negotiation timeout"]
+    assert manager.counts()["connected"] == 1 and manager.counts()["closed_total"] == 2
+
+
+def test_failed_peers_close_and_close_all():
+    manager = PeerManager()
+    a, b = FakePC(), FakePC()
+    manager.admit(a, "alice")
+    manager.admit(b, "bob")
+    a.connectionState = "failed"
+    assert manager.state_changed(a)
+
+    assert asyncio.run(manager.close_all("stopped")) == 2
+    assert a.closed and b.closed and manager.status() == []
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from presence import Presence
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make(timeout=10):
+    clock = Clock()
+    return Presence(timeout, clock), clock
+
+
+def test_touch_expire_and_refcounts():
+    presence, clock = make()
+    assert presence.touch("alice") and not presence.touch("alice")
+    assert presence.connect("bob") and not presence.connect("bob")
+
+    clock.now = 5
+    presence.touch("alice")
+    clock.now = 12
+    assert presence.expire() == []          # alice was touched again, bob holds sockets
+    clock.now = 16
+    assert presence.expire() == ["alice"]
+
+    assert not presence.disconnect("bob")
+    assert presence.disconnect("bob")
+    assert presence.snapshot() == ()
+
+
+def test_changes_are_netted_between_drains():
+    presence, clock = make()
+    presence.touch("a")
+    presence.touch("b")
+    assert presence.drain_changes() == (["a", "b"], [])
+
+    presence.remove("a")
+    presence.touch("a")                     # left and came back: no news
+    presence.remove("b")
+    presence.touch("c")
+    assert presence.drain_changes() == (["c"], ["b"])
+    assert presence.drain_changes() == ([], [])
+
+
+def test_snapshot_is_cached_until_membership_changes():
+    presence, clock = make()
+    presence.touch("b")
+    presence.touch("a")
+    first = presence.snapshot()
+    assert first == ("a", "b")
+    presence.touch("a")
+    assert presence.snapshot() is first
+    presence.touch("c")
+    assert presence.snapshot() == ("a", "b", "c")
+
+
+def churn(presence, clock, users):
+    """Touch everyone, hold a quarter on sockets, then keep half heartbeating over five rounds."""
+    for user in users:
+        presence.touch(user)
+    for user in users[:len(users) // 4]:
+        presence.connect(user)
+    # a steady state: half keep heartbeating, the snapshot is read constantly
+    gone = []
+    for step in range(1, 6):
+        clock.now = step * 5
+        for user in users[:len(users) // 2]:
+            presence.touch(user)
+        for _ in range(1000):
+            presence.snapshot()
+        gone += presence.expire()
+    return gone
+
+
+def test_churn_with_twenty_thousand_users():
+    presence, clock = make(timeout=15)
+    users = [f"user{i:05d}" for i in range(20000)]
+    gone = churn(presence, clock, users)
+
+    # heartbeating users stay; the rest (never touched again) expire once
+    assert len(gone) == 10000 and len(presence) == 10000
+    assert presence.snapshot()[0] == "user00000"
+
+
+@pytest.mark.skipif(not os.environ.get("PRESENCE_BENCHMARK"), reason="set PRESENCE_BENCHMARK=1 to run")
+def test_benchmark_churn():
+    """Timings only, no pass/fail bound: PRESENCE_BENCHMARK=1 pytest -s -k benchmark"""
+    for count in (1000, 10000, 100000):
+        presence, clock = make(timeout=15)
+        users = [f"user{i:06d}" for i in range(count)]
+        started = time.perf_counter()
+        churn(presence, clock, users)
+        elapsed = time.perf_counter() - started
+        print(f"\npresence churn, {count} users: {elapsed * 1000:.0f} ms")
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from segment_store import SegmentStore, playlist_uris
+
+
+def write_playlist(directory, name, first, count):
+    segments = [f"stream{n}.ts" for n in range(first, first + count)]
+    for seg in segments:
+        path = os.path.join(directory, os.path.dirname(name), seg)
+        if not os.path.exists(path):
+            with open(path, "wb") as fh:
+                fh.write(seg.encode() * 10)
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:1", f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+    for seg in segments:
+        lines += ["#EXTINF:1.0,", seg]
+    path = os.path.join(directory, name)
+    with open(path, "w") as fh:
+        fh.write("\n".join(lines) + "\n")
+    # distinct mtimes even on coarse filesystem clocks
+    os.utime(path, ns=(first * 10**9, first * 10**9))
+
+
+def test_playlist_uris():
+    text = '#EXTM3U\n#EXT-X-MAP:URI="init.mp4"\n#EXTINF:1,\nseg1.ts\n\n#EXT-X-PRELOAD-HINT:TYPE=PART,URI="p2.ts"\n'
+    assert playlist_uris(text) == ["init.mp4", "seg1.ts", "p2.ts"]
+
+
+def test_store_serves_live_window_from_memory(tmp_path):
+    directory = str(tmp_path)
+    store = SegmentStore(directory, keep=1)
+    write_playlist(directory, "stream.m3u8", 0, 3)
+    assert store.refresh() == 1
+    assert store.refresh() == 0  # unchanged playlist is not re-read
+
+    playlist = store.get("stream.m3u8")
+    assert playlist.body.startswith(b"#EXTM3U") and playlist.cache_control == "public, max-age=1"
+    seg = store.get("stream0.ts")
+    assert seg.body == b"stream0.ts" * 10 and seg.content_type == "video/mp2t"
+    assert "immutable" in seg.cache_control
+
+    # once ffmpeg deletes it, it is still served from memory
+    os.remove(os.path.join(directory, "stream0.ts"))
+    assert store.get("stream0.ts") is not None
+
+    # sliding the window keeps one dropped segment as grace, evicts older ones
+    write_playlist(directory, "stream.m3u8", 2, 3)
+    store.refresh()
+    assert store.get("stream0.ts") is None
+    assert store.get("stream1.ts") is not None
+    assert store.get("stream4.ts") is not None
+
+    store.close()
+    assert store.get("stream.m3u8") is None
+
+
+def test_store_handles_variant_subdirectories(tmp_path):
+    os.makedirs(tmp_path / "720p")
+    write_playlist(str(tmp_path), "720p/stream.m3u8", 0, 2)
+    (tmp_path / "master.m3u8").write_text("#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\n720p/stream.m3u8\n")
+    store = SegmentStore(str(tmp_path))
+    assert store.refresh() == 2
+    assert store.get("master.m3u8") is not None
+    assert store.get("720p/stream1.ts") is not None
@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from stream_commands import CommandQueue
+
+
+def test_jobs_run_in_order_and_zapping_coalesces():
+    gate, started = threading.Event(), threading.Event()
+    ran = []
+    updates = []
+
+    def play(job):
+        if job.params["channel_id"] == 1:
+            started.set()
+            gate.wait(5)
+        ran.append((job.viewer, job.params["channel_id"]))
+        return True, "ok", {"playlist": f"/stream/{job.params['channel_id']}/stream.m3u8"}
+
+    def stop(job):
+        raise RuntimeError("boom")
+
+    queue = CommandQueue({"play": play, "stop": stop}, on_update=lambda j: updates.append((j.id, j.state)))
+    first = queue.submit("play", viewer="alice", channel_id=1)
+    assert started.wait(5)
+    # alice zaps through 2 and 3 while 1 is still starting; bob queues behind her
+    second = queue.submit("play", viewer="alice", channel_id=2)
+    bob = queue.submit("play", viewer="bob", channel_id=7)
+    third = queue.submit("play", viewer="alice", channel_id=3)
+    assert second.state == "superseded"
+    gate.set()
+
+    assert queue.wait(third, timeout=5)
+    assert ran == [("alice", 1), ("bob", 7), ("alice", 3)]
+    assert third.as_dict()["playlist"] == "/stream/3/stream.m3u8" and bob.state == "done"
+    assert (first.id, "running") in updates and (first.id, "done") in updates
+
+    failed = queue.submit("stop", viewer="alice")
+    assert queue.wait(failed, timeout=5)
+    assert failed.state == "failed" and "boom" in failed.message
+    assert queue.get(failed.id) is failed
+
+    with pytest.raises(ValueError):
+        queue.submit("rewind")
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from stream_manager import Launch, StreamLimitError, StreamManager
+
+
+def sleeper(seconds=60):
+    return subprocess.Popen(
+        [sys.executable, "-c", f"import time; time.sleep({seconds})"], stderr=subprocess.PIPE
+    )
+
+
+class FakeLauncher:
+    def __init__(self, seconds=60):
+        self.seconds = seconds
+        self.launched = []
+
+    def __call__(self, out_dir):
+        self.launched.append(out_dir)
+        with open(os.path.join(out_dir, "stream.m3u8"), "w") as fh:
+            fh.write("#EXTM3U\n")
+        return Launch(sleeper(self.seconds), "stream.m3u8", "copy", True)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    m = StreamManager(str(tmp_path / "stream"), max_streams=2, idle_timeout=60, reap_interval=3600)
+    yield m
+    m.stop_all()
+
+
+def test_viewers_share_one_process_per_channel(manager):
+    launch = FakeLauncher()
+    a = manager.join(1, "alice", launch)
+    b = manager.join(1, "bob", launch)
+    assert a is b and len(launch.launched) == 1
+    assert a.viewers == {"alice", "bob"}
+    assert os.path.isfile(os.path.join(manager.directory(1), "stream.m3u8"))
+    assert manager.status()[0]["playlist"] == "/stream/1/stream.m3u8"
+
+    # switching channels leaves the old one
+    manager.join(2, "bob", launch)
+    assert manager.get(1).viewers == {"alice"}
+    assert manager.viewer_channel("bob") == 2
+
+
+def test_cap_evicts_idle_channel_or_refuses(manager):
+    launch = FakeLauncher()
+    manager.join(1, "alice", launch)
+    manager.join(2, "bob", launch)
+    with pytest.raises(StreamLimitError):
+        manager.join(3, "carol", launch)
+
+    old = manager.get(1).process
+    manager.leave("alice")
+    manager.join(3, "carol", launch)
+    assert manager.get(1) is None and old.poll() is not None
+    assert not os.path.exists(manager.directory(1))
+    assert sorted(s["channel_id"] for s in manager.status()) == [2, 3]
+
+
+def test_idle_channels_are_reaped(manager):
+    launch = FakeLauncher()
+    stream = manager.join(1, "alice", launch)
+    manager.join(2, "bob", launch)
+    manager.touch(2)
+    stream.last_access -= 120
+    assert manager.reap() == [1]
+    assert stream.process.poll() is not None
+    assert manager.viewer_channel("alice") is None and manager.viewer_channel("bob") == 2
+
+
+def test_dead_stream_restarts_then_gives_up(tmp_path):
+    exits = []
+    launches = []
+
+    def launch(out_dir):
+        launches.append(out_dir)
+        return Launch(sleeper(0), "stream.m3u8", "transcode", True)
+
+    manager = StreamManager(str(tmp_path), max_restarts=2, restart_delay=0.01,
+                            on_exit=lambda s, rc, viewers: exits.append((s.channel_id, rc, viewers)))
+    stream = manager.join(5, "alice", launch)
+    deadline = time.monotonic() + 5
+    while not exits and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert exits == [(5, 0, {"alice"})] and len(launches) == 3
+    health = stream.health.as_dict()
+    assert health["state"] == "failed" and health["restarts"] == 2
+    assert manager.get(5) is None and manager.viewer_channel("alice") is None
+
+    # a failed launch leaves nothing behind
+    failed = manager.join(6, "alice", lambda out_dir: Launch(None, "stream.m3u8", "copy", False))
+    assert failed.error and manager.get(6) is None
+
+
+def test_warm_streams_are_pinned_until_released(manager):
+    launch = FakeLauncher()
+    stream = manager.warm(1, launch)
+    assert stream is not None and stream.pinned and not stream.viewers
+    assert manager.join(1, "alice", launch) is stream and len(launch.launched) == 1
+
+    manager.leave("alice")
+    stream.last_access -= 120
+    assert manager.reap() == []
+
+    manager.unpin(1)
+    stream.last_access -= 120
+    assert manager.reap() == [1]
+
+    # warming never takes a slot from a running channel
+    manager.join(2, "bob", launch)
+    manager.join(3, "carol", launch)
+    assert manager.warm(4, launch) is None
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from stream_supervisor import Backoff, ProgressParser, StreamHealth, supervise
+
+PROGRESS = """frame=250
+fps=25.01
+bitrate=1450.2kbits/s
+total_size=1812345
+out_time_us=10000000
+dup_frames=1
+drop_frames=3
+speed=1.01x
+progress=continue
+"""
+
+
+def test_progress_blocks_update_health():
+    parser = ProgressParser()
+    blocks = [b for b in (parser.feed(line) for line in PROGRESS.splitlines()) if b]
+    assert len(blocks) == 1
+
+    health = StreamHealth(stderr_lines=2)
+    health.update(blocks[0])
+    for line in ["[hls] opening segment", "Connection refused", "retrying"]:
+        health.log(line)
+    state = health.as_dict()
+    assert (state["fps"], state["bitrate_kbps"], state["speed"]) == (25.01, 1450.2, 1.01)
+    assert (state["frame"], state["drop_frames"], state["dup_frames"]) == (250, 3, 1)
+    assert state["out_time_s"] == 10.0 and state["state"] == "running"
+    assert state["last_error"] == "Connection refused"
+    assert list(health.stderr) == ["Connection refused", "retrying"]
+
+
+def test_backoff_grows_caps_and_resets():
+    backoff = Backoff(base=1, factor=2, max_delay=5, max_attempts=4, reset_after=60)
+    assert [backoff.failure(0) for _ in range(5)] == [1, 2, 4, 5, None]
+    assert backoff.failure(120) == 1  # a long healthy run starts over
+
+
+def test_supervise_reads_pipes_incrementally():
+    script = "import sys; sys.stdout.write(%r); sys.stderr.write('Server returned 404 Not Found\\n'); sys.exit(1)" % PROGRESS
+    process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    health = StreamHealth()
+    updates = []
+    assert supervise(process, health, lambda: updates.append(health.fps)) == 1
+    assert updates == [25.01]
+    health.exited(1, None)
+    assert health.as_dict()["state"] == "failed"
+    assert health.last_error == "Server returned 404 Not Found"
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+from fractions import Fraction
+
+import pytest
+
+pytest.importorskip("aiortc")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+from switchable_track import SwitchableTrack
+
+TIME_BASE = Fraction(1, 90000)
+
+
+class Frame:
+    def __init__(self, pts, source):
+        self.pts = pts
+        self.time_base = TIME_BASE
+        self.source = source
+
+
+class FakeSource(MediaStreamTrack):
+    kind = "video"
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.queue = asyncio.Queue()
+
+    def push(self, pts):
+        self.queue.put_nowait(Frame(pts, self.name))
+
+    def end(self):
+        self.queue.put_nowait(None)
+
+    async def recv(self):
+        frame = await self.queue.get()
+        if frame is None:
+            raise MediaStreamError
+        return frame
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_timestamps_continue_across_a_switch():
+    async def run():
+        track = SwitchableTrack("video")
+        a, b = FakeSource("a"), FakeSource("b")
+        track.retarget(a)
+        for pts in (90000, 93000, 96000):
+            a.push(pts)
+        out = [await track.recv() for _ in range(3)]
+        # the new channel's clock starts again at zero
+        track.retarget(b, Frame(0, "b"))
+        b.push(3000)
+        out += [await track.recv() for _ in range(2)]
+        return out
+
+    out = asyncio.run(run())
+    assert [f.source for f in out] == ["a", "a", "a", "b", "b"]
+    assert [f.pts for f in out] == [90000, 93000, 96000, 99000, 102000]
+
+
+def test_old_source_frame_is_dropped_after_retarget():
+    async def run():
+        track = SwitchableTrack("video")
+        a, b = FakeSource("a"), FakeSource("b")
+        track.retarget(a)
+        pending = asyncio.ensure_future(track.recv())
+        await settle()
+        # a late frame from the old channel lands together with the switch
+        a.push(90000)
+        track.retarget(b)
+        b.push(0)
+        return await asyncio.wait_for(pending, 1), track
+
+    frame, track = asyncio.run(run())
+    assert frame.source == "b" and track.switches == 2
+
+
+def test_waits_for_a_new_source_after_the_old_one_ends():
+    async def run():
+        track = SwitchableTrack("video")
+        a = FakeSource("a")
+        track.retarget(a)
+        a.end()
+        pending = asyncio.ensure_future(track.recv())
+        await settle()
+        assert not pending.done() and track.source is None
+
+        b = FakeSource("b")
+        track.retarget(b)
+        b.push(0)
+        return await asyncio.wait_for(pending, 1), track
+
+    frame, track = asyncio.run(run())
+    assert frame.source == "b" and track.readyState == "live"
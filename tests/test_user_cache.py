@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from user_cache import Identity, UserCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader:
+    def __init__(self):
+        self.users = {"a@x": Identity(1, "alice", "a@x"), "b@x": Identity(2, "bob", "b@x")}
+        self.calls = []
+
+    def __call__(self, email):
+        self.calls.append(email)
+        return self.users.get(email)
+
+
+def test_hits_skip_the_loader_until_the_ttl_passes():
+    loader, clock = Loader(), Clock()
+    cache = UserCache(loader, ttl=60, negative_ttl=5, clock=clock)
+    assert cache.get("a@x").username == "alice"
+    assert asyncio.run(cache.aget("a@x")).username == "alice"
+    assert cache.get("nobody@x") is None and cache.get("nobody@x") is None
+    assert loader.calls == ["a@x", "nobody@x"]
+
+    clock.now = 10
+    cache.get("nobody@x")
+    clock.now = 61
+    cache.get("a@x")
+    assert loader.calls == ["a@x", "nobody@x", "nobody@x", "a@x"]
+    assert cache.stats()["hits"] == 2
+
+
+def test_invalidate_and_lru_bound():
+    loader = Loader()
+    cache = UserCache(loader, max_entries=1)
+    cache.get("a@x")
+    loader.users["a@x"] = Identity(1, "alice2", "a@x")
+    cache.invalidate("a@x")
+    assert cache.get("a@x").username == "alice2"
+
+    cache.get("b@x")
+    assert list(cache.entries) == ["b@x"]
+
+
+def test_a_load_racing_an_invalidate_is_not_cached():
+    cache = UserCache(lambda email: None)
+
+    def loader(email):
+        cache.invalidate(email)   # e.g. logout lands while the query runs
+        return Identity(1, "stale", email)
+
+    cache.loader = loader
+    assert cache.get("a@x").username == "stale"
+    assert cache.entries == {}
@@ -0,0 +1,83 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from warm_pool import WarmPool
+
+
+class Sources:
+    def __init__(self):
+        self.opened = []
+        self.closed = []
+
+    def open(self, channel_id):
+        self.opened.append(channel_id)
+        return {"channel_id": channel_id, "alive": True}
+
+    def close(self, channel_id, handle):
+        self.closed.append(channel_id)
+
+
+def make_pool(size=2, **kwargs):
+    sources = Sources()
+    return WarmPool(size, sources.open, sources.close, **kwargs), sources
+
+
+def test_targets_prefer_recent_then_favorites():
+    pool, _ = make_pool(size=3)
+    for channel_id in (5, 6, 5):
+        pool.note_played(channel_id)
+    assert pool.targets(favorites=[1, 6, 2]) == [5, 6, 1]
+    assert pool.targets(favorites=[1, 2], exclude={5}) == [6, 1, 2]
+
+
+def test_refresh_warms_and_releases():
+    pool, sources = make_pool(size=2)
+    assert pool.refresh(favorites=[1, 2, 3]) == {"warmed": [1, 2], "released": []}
+
+    pool.note_played(3)
+    result = pool.refresh(favorites=[1, 2])
+    assert result == {"warmed": [3], "released": [2]}
+    assert sources.closed == [2] and sorted(pool.status()["channels"]) == [1, 3]
+
+
+def test_take_and_put_evicts_least_recently_used():
+    pool, sources = make_pool(size=2)
+    pool.refresh(favorites=[1, 2])
+    handle = pool.take(1)
+    assert handle["channel_id"] == 1 and pool.take(1) is None
+
+    assert pool.put(1, handle)
+    assert pool.put(9, {"channel_id": 9})
+    assert sources.closed == [2] and list(pool.entries) == [1, 9]
+    assert not pool.put(9, {"channel_id": 9})
+
+
+def test_dead_entries_are_replaced():
+    pool, sources = make_pool(size=1, is_alive=lambda h: h["alive"])
+    pool.refresh(favorites=[1])
+    pool.entries[1]["alive"] = False
+    assert pool.refresh(favorites=[1]) == {"warmed": [1], "released": [1]}
+    assert sources.opened == [1, 1]
+
+
+def test_disabled_pool_keeps_nothing():
+    pool, sources = make_pool(size=0)
+    assert not pool.put(1, object())
+    assert pool.refresh(favorites=[1]) == {"warmed": [], "released": []} and not sources.opened
+
+
+def test_old_entries_are_reopened_and_not_handed_out():
+    now = [0.0]
+    pool, sources = make_pool(size=1, max_age=60, clock=lambda: now[0])
+    pool.refresh(favorites=[1])
+    now[0] = 30
+    assert pool.take(1)["channel_id"] == 1
+
+    pool.refresh(favorites=[1])
+    now[0] = 100
+    assert pool.take(1) is None and sources.closed == [1]
+    assert pool.refresh(favorites=[1]) == {"warmed": [1], "released": []}
+    now[0] = 200
+    assert pool.refresh(favorites=[1]) == {"warmed": [1], "released": [1]}
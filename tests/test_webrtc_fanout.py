@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sys
+from fractions import Fraction
+from types import SimpleNamespace
+
+import pytest
+
+av = pytest.importorskip("av")
+pytest.importorskip("aiortc")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from aiortc.mediastreams import MediaStreamTrack
+
+from webrtc_fanout import (
+    AnnexBTrack, DecodingTrack, FanoutSource, SharedEncoder, h264_preferences, is_avcc, is_keyframe,
+)
+
+
+class FakeTrack(MediaStreamTrack):
+    def __init__(self, kind):
+        super().__init__()
+        self.kind = kind
+
+    async def recv(self):
+        raise NotImplementedError
+
+
+class PacketSource(FakeTrack):
+    def __init__(self, packets, kind="audio"):
+        super().__init__(kind)
+        self.packets = list(packets)
+
+    async def recv(self):
+        return self.packets.pop(0)
+
+
+def fake_player(audio=True):
+    return SimpleNamespace(video=FakeTrack("video"), audio=FakeTrack("audio") if audio else None)
+
+
+def make_frame(i):
+    frame = av.VideoFrame(64, 64, "yuv420p")
+    frame.pts = i * 3000
+    frame.time_base = Fraction(1, 90000)
+    return frame
+
+
+def test_is_keyframe():
+    assert is_keyframe(SimpleNamespace(is_keyframe=True))
+    assert not is_keyframe(SimpleNamespace(is_keyframe=False))
+    assert is_keyframe(object())   # decoded frames carry no flag
+
+
+def test_h264_preferences_keep_h264_and_rtx():
+    codecs = [SimpleNamespace(mimeType=m) for m in ("video/VP8", "video/H264", "video/rtx", "video/h264")]
+    picked = h264_preferences(SimpleNamespace(codecs=codecs))
+    assert [c.mimeType for c in picked] == ["video/H264", "video/rtx", "video/h264"]
+
+
+def test_fanout_source_modes():
+    player = fake_player()
+    passthrough = FanoutSource(player, passthrough=True)
+    assert passthrough.mode == "passthrough" and isinstance(passthrough.video, AnnexBTrack)
+    assert passthrough.video.source is player.video
+    assert isinstance(passthrough.audio, DecodingTrack) and passthrough.audio.source is player.audio
+    passthrough.set_bitrate(100)   # the source's own bitrate is sent; nothing to retarget
+
+    player = fake_player(audio=False)
+    encoded = FanoutSource(player, passthrough=False, bitrate_kbps=4000)
+    assert encoded.mode == "encode" and encoded.audio is None
+    assert isinstance(encoded.video, SharedEncoder) and encoded.video.source is player.video
+    assert encoded.video.bitrate_kbps == 4000
+
+
+def test_shared_encoder_forces_keyframes():
+    encoder = SharedEncoder(FakeTrack("video"), bitrate_kbps=1000, gop_seconds=60)
+    first = encoder._encode(make_frame(0))
+    assert first and first[0].is_keyframe
+
+    middle = [p for i in range(1, 5) for p in encoder._encode(make_frame(i))]
+    assert middle and not any(p.is_keyframe for p in middle)
+
+    encoder.request_keyframe()
+    assert encoder._encode(make_frame(5))[0].is_keyframe
+
+    # a small change is ignored; a large one rebuilds the encoder before the next frame
+    encoder.set_bitrate(1050)
+    assert not encoder._encode(make_frame(6))[0].is_keyframe and encoder.bitrate_kbps == 1000
+    encoder.set_bitrate(500)
+    assert encoder.bitrate_kbps == 1000
+    assert encoder._encode(make_frame(7))[0].is_keyframe and encoder.bitrate_kbps == 500
+
+
+def test_decoding_track_skips_damaged_packets():
+    def damaged():
+        raise av.error.InvalidDataError(-1094995529, "Invalid data found when processing input")
+
+    good = SimpleNamespace(decode=lambda: ["frame"])
+    track = DecodingTrack(PacketSource([SimpleNamespace(decode=damaged), good]))
+    assert asyncio.run(track.recv()) == "frame"
+
+
+def demuxed_h264(path, frames=5):
+    with av.open(str(path), "w") as out:
+        stream = out.add_stream("libx264", rate=30)
+        stream.width = stream.height = 64
+        stream.pix_fmt = "yuv420p"
+        for _ in range(frames):
+            out.mux(stream.encode(av.VideoFrame(64, 64, "yuv420p")))
+        out.mux(stream.encode(None))
+    container = av.open(str(path))
+    return container, [p for p in container.demux(video=0) if p.size]
+
+
+async def drain(track, count):
+    return [await track.recv() for _ in range(count)]
+
+
+@pytest.mark.parametrize("suffix, avcc", [(".mp4", True), (".ts", False)])
+def test_annexb_track_converts_length_prefixed_h264(tmp_path, suffix, avcc):
+    container, packets = demuxed_h264(tmp_path / f"source{suffix}")
+    assert is_avcc(packets[0].stream) == avcc
+    pts = [p.pts for p in packets]
+    out = asyncio.run(drain(AnnexBTrack(PacketSource(packets, "video")), len(packets)))
+    container.close()
+
+    annexb = (b"\x00\x00\x01", b"\x00\x00\x00\x01")
+    assert all(bytes(p).startswith(annexb) for p in packets) != avcc
+    assert all(bytes(p).startswith(annexb) for p in out)
+    assert out[0].is_keyframe and [p.pts for p in out] == pts
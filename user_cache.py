@@ -0,0 +1,92 @@
+"""
+Session-to-user resolution without a database round trip per request.
+
+Sessions only carry the user's email; turning that into a user used to
+cost a SQLite query on every page load, heartbeat and socket connect.
+UserCache keeps small immutable Identity records in an LRU keyed by
+email. Each entry lives for ``ttl`` seconds, and unknown emails are
+remembered for ``negative_ttl`` so a stale session can't hammer the
+database either. Logout and user changes call ``invalidate``.
+"""
+import asyncio
+import collections
+import threading
+import time
+from typing import Callable, NamedTuple
+
+
+class Identity(NamedTuple):
+    id: int
+    username: str
+    email: str
+
+
+class UserCache:
+    def __init__(self, loader: Callable[[str], Identity | None], ttl: float = 60,
+                 max_entries: int = 1024, negative_ttl: float = 5,
+                 clock: Callable[[], float] = time.monotonic):
+        """``loader(email)`` fetches an Identity (or None) from the database; it may block."""
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries: collections.OrderedDict[str, tuple[float, Identity | None]] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._invalidations = 0   # a load that raced an invalidate must not be cached
+
+    def peek(self, email: str) -> tuple[bool, Identity | None]:
+        """(found, identity) from memory only; never calls the loader."""
+        with self.lock:
+            entry = self.entries.get(email)
+            if entry is None or entry[0] <= self.clock():
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(email)
+            self.hits += 1
+            return True, entry[1]
+
+    def get(self, email: str) -> Identity | None:
+        found, identity = self.peek(email)
+        if found:
+            return identity
+        before = self._invalidations
+        identity = self.loader(email)
+        self.put(email, identity, before)
+        return identity
+
+    async def aget(self, email: str) -> Identity | None:
+        """Like ``get``, but a miss loads in a worker thread; hits never leave the loop."""
+        found, identity = self.peek(email)
+        if found:
+            return identity
+        before = self._invalidations
+        identity = await asyncio.to_thread(self.loader, email)
+        self.put(email, identity, before)
+        return identity
+
+    def put(self, email: str, identity: Identity | None, loaded_after: int | None = None) -> None:
+        ttl = self.ttl if identity is not None else self.negative_ttl
+        with self.lock:
+            if loaded_after is not None and loaded_after != self._invalidations:
+                return
+            self.entries[email] = (self.clock() + ttl, identity)
+            self.entries.move_to_end(email)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, email: str) -> None:
+        with self.lock:
+            self._invalidations += 1
+            self.entries.pop(email, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._invalidations += 1
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
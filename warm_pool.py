@@ -0,0 +1,168 @@
+"""
+Pre-warmed channel sources for instant zapping.
+
+Keeps up to ``size`` channels connected ahead of time: the most recently
+watched first, then favorites. What a "source" is belongs to the backend:
+an opened MediaPlayer in main.py, a pinned ffmpeg stream in app.py. The
+pool only decides which channels deserve a slot, opens and closes them
+through the callbacks it is given, evicts the least recently used entry
+when full, and stops warming new channels while the machine is busier
+than ``max_load`` (1-minute load average per CPU). Entries that fail
+``is_alive`` or are older than ``max_age`` seconds are closed rather than
+handed out, and reopened on the next refresh.
+"""
+import collections
+import os
+import threading
+import time
+from typing import Callable
+
+
+class WarmPool:
+    def __init__(self, size: int, open_source: Callable[[int], object],
+                 close_source: Callable[[int, object], None],
+                 max_load: float | None = None, history: int = 32,
+                 is_alive: Callable[[object], bool] | None = None, max_age: float | None = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.size = size
+        self.open_source = open_source
+        self.close_source = close_source
+        self.is_alive = is_alive
+        self.max_age = max_age
+        self.clock = clock
+        self.max_load = max_load
+        self.lock = threading.Lock()
+        self.entries: collections.OrderedDict[int, object] = collections.OrderedDict()  # LRU first
+        self.opened_at: dict[int, float] = {}
+        self.recent: collections.OrderedDict[int, None] = collections.OrderedDict()      # oldest first
+        self.history = history
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def note_played(self, channel_id: int) -> None:
+        with self.lock:
+            self.recent.pop(channel_id, None)
+            self.recent[channel_id] = None
+            while len(self.recent) > self.history:
+                self.recent.popitem(last=False)
+
+    def targets(self, favorites=(), exclude=()) -> list[int]:
+        """Channels that deserve a slot: recently watched (newest first), then favorites."""
+        with self.lock:
+            ordered = list(reversed(self.recent)) + list(favorites)
+        picked = []
+        for channel_id in ordered:
+            if channel_id not in picked and channel_id not in exclude:
+                picked.append(channel_id)
+            if len(picked) >= self.size:
+                break
+        return picked
+
+    def take(self, channel_id: int):
+        """
+        Hand a warm source over to the caller (it leaves the pool); None on a
+        miss. A stale entry is closed first, so this may block.
+        """
+        with self.lock:
+            handle = self.entries.pop(channel_id, None)
+            opened_at = self.opened_at.pop(channel_id, None)
+        if handle is not None and self._stale(handle, opened_at):
+            self._close([(channel_id, handle)])
+            return None
+        return handle
+
+    def put(self, channel_id: int, handle) -> bool:
+        """
+        Offer a source that just stopped being watched back to the pool. False
+        means the pool didn't keep it and the caller should close it.
+        """
+        if not self.enabled:
+            return False
+        with self.lock:
+            if channel_id in self.entries:
+                return False
+            self.entries[channel_id] = handle
+            self.opened_at[channel_id] = self.clock()
+            evicted = self._evict_locked()
+        self._close(evicted)
+        return True
+
+    def over_budget(self) -> bool:
+        if self.max_load is None or not hasattr(os, 'getloadavg'):
+            return False
+        return os.getloadavg()[0] / (os.cpu_count() or 1) > self.max_load
+
+    def refresh(self, favorites=(), exclude=()) -> dict:
+        """
+        Bring the pool in line with ``targets``: close entries that no longer
+        qualify, then open missing ones while there is room and budget.
+        Blocking; run it off the request path.
+        """
+        if not self.enabled:
+            return {'warmed': [], 'released': []}
+        wanted = self.targets(favorites, exclude)
+        with self.lock:
+            released = [
+                (cid, h) for cid, h in self.entries.items()
+                if cid not in wanted or self._stale(h, self.opened_at.get(cid))
+            ]
+            for cid, _ in released:
+                del self.entries[cid]
+                self.opened_at.pop(cid, None)
+            missing = [cid for cid in wanted if cid not in self.entries]
+        self._close(released)
+
+        warmed = []
+        for channel_id in missing:
+            if len(self.entries) >= self.size or self.over_budget():
+                break
+            try:
+                handle = self.open_source(channel_id)
+            except Exception as e:
+                print(f"Warming channel {channel_id} failed: {e}")
+                continue
+            if handle is None:
+                continue
+            with self.lock:
+                self.entries[channel_id] = handle
+                self.opened_at[channel_id] = self.clock()
+                self.entries.move_to_end(channel_id, last=False)  # below recently returned sources
+                evicted = self._evict_locked()
+            self._close(evicted)
+            warmed.append(channel_id)
+        return {'warmed': warmed, 'released': [cid for cid, _ in released]}
+
+    def close_all(self) -> None:
+        with self.lock:
+            entries = list(self.entries.items())
+            self.entries.clear()
+            self.opened_at.clear()
+        self._close(entries)
+
+    def status(self) -> dict:
+        with self.lock:
+            return {'size': self.size, 'channels': list(self.entries), 'recent': list(reversed(self.recent))}
+
+    # ─────────────── internals ───────────────
+
+    def _stale(self, handle, opened_at: float | None) -> bool:
+        if self.is_alive and not self.is_alive(handle):
+            return True
+        return self.max_age is not None and opened_at is not None and self.clock() - opened_at > self.max_age
+
+    def _evict_locked(self) -> list:
+        evicted = []
+        while len(self.entries) > self.size:
+            channel_id, handle = self.entries.popitem(last=False)
+            self.opened_at.pop(channel_id, None)
+            evicted.append((channel_id, handle))
+        return evicted
+
+    def _close(self, entries) -> None:
+        for channel_id, handle in entries:
+            try:
+                self.close_source(channel_id, handle)
+            except Exception as e:
+                print(f"Closing warm channel {channel_id} failed: {e}")
@@ -0,0 +1,226 @@
+"""
+Encode-once video for the WebRTC broadcaster.
+
+aiortc normally encodes every peer's video separately, so CPU grows with
+the viewer count. When an RTCRtpSender is handed an encoded packet
+instead of a decoded frame, it only packetizes it. This module exploits
+that: a channel's video is either passed through as the source's own
+H.264 packets, or encoded to H.264 once by a SharedEncoder. The result is
+fanned out to every peer through MediaRelay, so per-peer work shrinks to
+packetizing, SRTP and congestion feedback. Audio stays decoded (Opus
+encoding is cheap).
+
+aiortc's H.264 packetizer splits packets on Annex-B start codes, while
+MP4, FLV (RTMP) and fMP4-HLS sources carry length-prefixed (AVCC) NAL
+units; passthrough video goes through AnnexBTrack, which converts those
+with FFmpeg's h264_mp4toannexb filter and leaves Annex-B sources alone.
+
+Passed-through and shared-encoder packets can't honour per-peer keyframe
+requests. The shared encoder emits a keyframe every ``gop_seconds`` and
+whenever ``request_keyframe`` is called (e.g. when a peer joins);
+passthrough relies on the source's own GOP.
+"""
+import asyncio
+import collections
+import threading
+from fractions import Fraction
+
+import av
+import av.bitstream
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+
+ENCODE_ONCE_MODES = ('off', 'auto', 'encode')   # auto: pass H.264 through, encode anything else once
+VIDEO_TIME_BASE = Fraction(1, 90000)
+RETARGET_THRESHOLD = 0.15
+
+
+class SharedEncoder(MediaStreamTrack):
+    """Encodes a decoded video track to H.264 packets once, for all peers."""
+
+    kind = "video"
+
+    def __init__(self, source: MediaStreamTrack, bitrate_kbps: int = 6000, gop_seconds: float = 2.0,
+                 framerate: int = 30):
+        super().__init__()
+        self.source = source
+        self.bitrate_kbps = bitrate_kbps
+        self.gop_seconds = gop_seconds
+        self.framerate = framerate
+        self.codec: av.CodecContext | None = None   # only touched by _encode, in the executor
+        self._packets = collections.deque()
+        self._force_keyframe = True
+        self._lock = threading.Lock()
+        self._pending_kbps: int | None = None
+
+    def request_keyframe(self) -> None:
+        self._force_keyframe = True
+
+    def set_bitrate(self, kbps: int) -> None:
+        """
+        Retarget the encoder. x264 can't change rate in place, so it is rebuilt
+        (costing a keyframe) before the next frame is encoded; changes under
+        ``RETARGET_THRESHOLD`` are ignored.
+        """
+        with self._lock:
+            if abs(kbps - self.bitrate_kbps) > self.bitrate_kbps * RETARGET_THRESHOLD:
+                self._pending_kbps = kbps
+            else:
+                self._pending_kbps = None
+
+    async def recv(self):
+        loop = asyncio.get_running_loop()
+        while not self._packets:
+            if self.readyState != "live":
+                raise MediaStreamError
+            frame = await self.source.recv()
+            self._packets.extend(await loop.run_in_executor(None, self._encode, frame))
+        return self._packets.popleft()
+
+    def stop(self) -> None:
+        super().stop()
+        self.source.stop()
+
+    # ─────────────── internals ───────────────
+
+    def _open(self, frame):
+        codec = av.CodecContext.create('libx264', 'w')
+        codec.width = frame.width
+        codec.height = frame.height
+        codec.pix_fmt = 'yuv420p'
+        codec.time_base = VIDEO_TIME_BASE
+        codec.framerate = Fraction(self.framerate, 1)
+        codec.bit_rate = self.bitrate_kbps * 1000
+        codec.gop_size = max(1, int(self.framerate * self.gop_seconds))
+        codec.options = {'profile': 'baseline', 'level': '31', 'tune': 'zerolatency', 'preset': 'veryfast'}
+        self.codec = codec
+        self._force_keyframe = True
+        return codec
+
+    def _encode(self, frame) -> list:
+        with self._lock:
+            pending, self._pending_kbps = self._pending_kbps, None
+            if pending is not None:
+                self.bitrate_kbps = pending
+        codec = self.codec
+        if pending is not None or codec is None or (frame.width, frame.height) != (codec.width, codec.height):
+            codec = self._open(frame)
+        pts = frame.pts * frame.time_base if frame.pts is not None and frame.time_base else None
+        image = frame.reformat(format='yuv420p')
+        if pts is not None:
+            image.pts = int(pts / VIDEO_TIME_BASE)
+            image.time_base = VIDEO_TIME_BASE
+        if self._force_keyframe:
+            image.pict_type = av.video.frame.PictureType.I
+            self._force_keyframe = False
+        packets = codec.encode(image)
+        for packet in packets:
+            if packet.time_base is None:
+                packet.time_base = VIDEO_TIME_BASE
+        return packets
+
+
+class DecodingTrack(MediaStreamTrack):
+    """Decodes a passthrough player's audio packets back into frames."""
+
+    kind = "audio"
+
+    def __init__(self, source: MediaStreamTrack):
+        super().__init__()
+        self.source = source
+        self._frames = collections.deque()
+
+    async def recv(self):
+        while not self._frames:
+            if self.readyState != "live":
+                raise MediaStreamError
+            packet = await self.source.recv()
+            try:
+                self._frames.extend(packet.decode())
+            except av.error.FFmpegError:
+                continue   # a damaged packet; skip it rather than end the track
+        return self._frames.popleft()
+
+    def stop(self) -> None:
+        super().stop()
+        self.source.stop()
+
+
+class AnnexBTrack(MediaStreamTrack):
+    """Rewrites a passthrough player's AVCC H.264 packets as Annex B."""
+
+    kind = "video"
+
+    def __init__(self, source: MediaStreamTrack):
+        super().__init__()
+        self.source = source
+        self._filter = None
+        self._checked = False
+        self._packets = collections.deque()
+
+    async def recv(self):
+        while not self._packets:
+            if self.readyState != "live":
+                raise MediaStreamError
+            packet = await self.source.recv()
+            if not self._checked:
+                self._checked = True
+                if is_avcc(packet.stream):
+                    self._filter = av.bitstream.BitStreamFilterContext('h264_mp4toannexb', packet.stream)
+            if self._filter is None:
+                return packet
+            for out in self._filter.filter(packet):
+                if out.time_base is None:
+                    out.time_base = packet.time_base
+                self._packets.append(out)
+        return self._packets.popleft()
+
+    def stop(self) -> None:
+        super().stop()
+        self.source.stop()
+
+
+class FanoutSource:
+    """
+    A MediaPlayer whose video reaches peers encoded once. Exposes ``audio``
+    and ``video`` like the player itself; stopping them stops the player.
+    """
+
+    def __init__(self, player, passthrough: bool, bitrate_kbps: int = 6000):
+        self.player = player
+        self.passthrough = passthrough
+        if passthrough:
+            # opened with decode=False: both tracks yield demuxed packets
+            self.video = player.video and AnnexBTrack(player.video)
+            self.audio = player.audio and DecodingTrack(player.audio)
+        else:
+            self.video = player.video and SharedEncoder(player.video, bitrate_kbps)
+            self.audio = player.audio
+
+    @property
+    def mode(self) -> str:
+        return 'passthrough' if self.passthrough else 'encode'
+
+    def request_keyframe(self) -> None:
+        if isinstance(self.video, SharedEncoder):
+            self.video.request_keyframe()
+
+    def set_bitrate(self, kbps: int) -> None:
+        # passthrough sends the source's own bitrate
+        if isinstance(self.video, SharedEncoder):
+            self.video.set_bitrate(kbps)
+
+
+def is_avcc(stream) -> bool:
+    """H.264 whose extradata is an avcC record (length-prefixed NAL units), not Annex B."""
+    extradata = stream.codec_context.extradata
+    return stream.codec_context.name == 'h264' and bool(extradata) and extradata[0] == 1
+
+
+def is_keyframe(item) -> bool:
+    """Packets from passthrough may start mid-GOP; decoded frames always qualify."""
+    return getattr(item, 'is_keyframe', True)
+
+
+def h264_preferences(capabilities) -> list:
+    """H.264 (and its RTX) out of RTCRtpSender.getCapabilities('video').codecs."""
+    return [c for c in capabilities.codecs if c.mimeType.lower() in ('video/h264', 'video/rtx')]